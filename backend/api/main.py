@@ -1,11 +1,24 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+from fastapi.responses import Response
+from pathlib import Path
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.routing import Match
+import asyncio
 import logging
+import os
+import time
+import yaml
 
 # Import create_db_and_tables
 from database import create_db_and_tables, engine # Added engine
 from models.user import Base as UserBase # Import Base from where User model is defined
+from services.metrics import (
+    HTTP_REQUEST_SECONDS, ContextThreadPoolExecutor, server_timing, start_request_stages, track_executor,
+)
+from services.structured_logging import configure_logging, start_log_context
 
 # Configure logging
 logging.basicConfig(
@@ -13,6 +26,8 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Request ids and context fields on every line, level from config/logging.yaml
+configure_logging()
 
 # Create database table
 # This should ideally be called once, perhaps managed by Alembic for migrations in production
@@ -25,12 +40,125 @@ UserBase.metadata.create_all(bind=engine) # Create tables defined in User model
 load_dotenv()
 logger.info("Environment variables loaded")
 
+try:
+    with open(Path(__file__).parent.parent / "config" / "metrics.yaml", "r") as file:
+        metrics_settings = yaml.safe_load(file)["metrics"]
+        SERVER_TIMING = os.getenv("SERVER_TIMING", str(metrics_settings.get("server_timing", False))).lower() in ("1", "true", "yes")
+except Exception as e:
+    logger.error(f"Failed to load metrics settings from YAML: {str(e)}")
+    raise
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Database work runs on the default executor; this one carries the request's context
+    # into its threads so their time shows up in the request's stage breakdown
+    default_executor = ContextThreadPoolExecutor(thread_name_prefix="default")
+    asyncio.get_running_loop().set_default_executor(default_executor)
+    track_executor("default", default_executor)
+    from api.v1.auth import _password_executor
+    track_executor("password_hash", _password_executor)
+
+    # Keep asset, risk, news and recommendation caches warm, reusing the routers' service instances
+    from services.cache_warmer import CacheWarmer
+    from api.v1.asset import asset_service, risk_analysis_service
+    from api.v1.news import news_service
+    from api.v1.stock_recommendation import stock_recommendation_service
+
+    cache_warmer = CacheWarmer(
+        asset_service.market_data,
+        risk_analysis_service,
+        news_service,
+        stock_recommendation_service,
+    )
+    cache_warmer.start()
+
+    # Job kinds are registered by the routers imported above
+    from services.job_service import job_service
+    await job_service.start()
+    yield
+    await job_service.stop()
+    await cache_warmer.stop()
+
 app = FastAPI(
     title="FinSight API",
     description="Backend API for the FinSight project",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+class MetricsMiddleware:
+    """
+    Records each request's latency by route template and, with server_timing on,
+    returns its stage breakdown in a Server-Timing header.
+
+    Written as plain ASGI so streamed responses are timed until their last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _route(self, scope) -> str:
+        # Label by template (/api/v1/jobs/{job_id}), never by raw path, to bound cardinality
+        for route in app.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        stages = start_request_stages()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING:
+                    header = server_timing(stages, time.perf_counter() - started)
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(
+                method=scope["method"], route=self._route(scope), status=str(status)
+            ).observe(time.perf_counter() - started)
+
+app.add_middleware(MetricsMiddleware)
+
+class RequestContextMiddleware:
+    """
+    Gives each request a log context: the caller's X-Request-ID if it sent a usable
+    one, otherwise a new id, which is echoed back in the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")
+        usable = 0 < len(incoming) <= 64 and incoming.replace("-", "").replace("_", "").isalnum()
+        request_id = start_log_context(incoming if usable else None)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_with_id)
+
+app.add_middleware(RequestContextMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -53,5 +181,9 @@ app.include_router(v1_router)
 async def health_check():
     logger.info("Health check endpoint accessed")
     return {"status": "healthy"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
     
 
@@ -5,6 +5,7 @@ from .asset_chat import router as asset_chat_router
 from .news import router as news_router
 from .auth import router as auth_router
 from .stock_recommendation import router as stock_recommendation_router
+from .jobs import router as jobs_router
 
 # Create main router for v1
 router = APIRouter(prefix="/api/v1")
@@ -15,4 +16,5 @@ router.include_router(asset_router, prefix="/tracker/assets", tags=["assets"])
 router.include_router(asset_chat_router, prefix="/asset-chat", tags=["asset-chat"])
 router.include_router(news_router, prefix="/news", tags=["news"])
 router.include_router(auth_router)
-router.include_router(stock_recommendation_router, prefix="/stock_recommendation", tags=["stock-recommendation"]) 
\ No newline at end of file
+router.include_router(stock_recommendation_router, prefix="/stock_recommendation", tags=["stock-recommendation"]) 
+router.include_router(jobs_router, prefix="/jobs", tags=["jobs"])
@@ -1,54 +1,151 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
 from services.asset_service import AssetService
-from services.chat_service import ChatService
 from services.risk_analysis_service import RiskAnalysisService
-from models.asset import AssetCreate, AssetResponse
-from models.risk_analysis import RiskAnalysisResponse
-from .auth import get_current_user
-from models.user import User as UserModel
-from typing import List
+from services.job_service import job_service
+from models.asset import AssetCreate, AssetResponse, AssetImportResponse
+from models.risk_analysis import RiskAnalysisResponse, PortfolioRiskResponse, PricePoint
+from services.price_store import downsample
+from .auth import Principal, get_current_user
+from typing import List, Optional
+from datetime import date
+import asyncio
+import csv
+import io
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 # Initialize services
-chat_service = ChatService()
-asset_service = AssetService(chat_service.conn)
+asset_service = AssetService()
 risk_analysis_service = RiskAnalysisService()
 
+async def _run_asset_import_job(user_id: str, params: dict):
+    return await asset_service.enrich_assets(params["assets"])
+
+job_service.register("asset_import", _run_asset_import_job)
+
+async def _start_import(assets: List[AssetCreate], user_id) -> dict:
+    items = await asset_service.import_assets(assets, user_id)
+    pending = {item["symbol"]: item["name"] for item in items if item["status"] == "pending"}
+    job = None
+    if pending:
+        # Items travel with the job so progress can be reported from the job alone
+        job, _ = await job_service.submit("asset_import", str(user_id), {"assets": pending, "items": items}, force=True)
+    return await asset_service.import_progress(items, job)
+
+def _parse_assets_csv(content: str) -> List[AssetCreate]:
+    """Rows of symbol,name, with an optional header naming the symbol and name columns."""
+    rows = [row for row in csv.reader(io.StringIO(content)) if row and any(cell.strip() for cell in row)]
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    symbol_column, name_column = 0, 1
+    if "symbol" in header:
+        symbol_column = header.index("symbol")
+        name_column = header.index("name") if "name" in header else None
+        rows = rows[1:]
+    assets = []
+    for row in rows:
+        symbol = row[symbol_column].strip() if symbol_column < len(row) else ""
+        name = row[name_column].strip() if name_column is not None and name_column < len(row) else ""
+        if symbol:
+            assets.append(AssetCreate(symbol=symbol, name=name or symbol))
+    return assets
+
 @router.post("/create", response_model=AssetResponse)
-async def create_asset(asset: AssetCreate, current_user: UserModel = Depends(get_current_user)):
+async def create_asset(asset: AssetCreate, current_user: Principal = Depends(get_current_user)):
     """Create a new tracked asset for the current user."""
     logger.info(f"Creating new asset with symbol: {asset.symbol}, User ID: {current_user.id}")
-    return asset_service.create_asset(asset, current_user.id)
+    return await asset_service.create_asset(asset, current_user.id)
+
+@router.post("/import", response_model=AssetImportResponse, status_code=202)
+async def import_assets(assets: List[AssetCreate], current_user: Principal = Depends(get_current_user)):
+    """
+    Track many assets at once.
+
+    Placeholder assets are created right away and their market data is fetched by a
+    background job; poll /import/{job_id} for per-symbol progress or stream
+    /jobs/{job_id}/events until the job has finished.
+    """
+    logger.info(f"Importing {len(assets)} assets, User ID: {current_user.id}")
+    return await _start_import(assets, current_user.id)
+
+@router.post("/import/csv", response_model=AssetImportResponse, status_code=202)
+async def import_assets_csv(file: UploadFile = File(...), current_user: Principal = Depends(get_current_user)):
+    """Track the assets listed in a CSV file of symbol,name rows, like /import."""
+    logger.info(f"Importing assets from CSV file {file.filename}, User ID: {current_user.id}")
+    try:
+        content = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8 encoded")
+    return await _start_import(_parse_assets_csv(content), current_user.id)
+
+@router.get("/import/{job_id}", response_model=AssetImportResponse)
+async def get_import_progress(job_id: str, current_user: Principal = Depends(get_current_user)):
+    """Per-symbol progress of a bulk import."""
+    job = await job_service.get(job_id, str(current_user.id))
+    if job is None or job["kind"] != "asset_import":
+        raise HTTPException(status_code=404, detail="Import not found")
+    return await asset_service.import_progress(job["params"]["items"], job)
 
 @router.get("/get", response_model=List[AssetResponse])
-async def get_assets(current_user: UserModel = Depends(get_current_user)):
+async def get_assets(current_user: Principal = Depends(get_current_user)):
     """Get all tracked assets for the current user."""
     logger.info(f"Fetching all tracked assets for user ID: {current_user.id}")
-    return asset_service.get_assets(current_user.id)
+    return await asset_service.get_assets(current_user.id)
 
 @router.delete("/delete/")
-async def delete_asset(asset_id: str, current_user: UserModel = Depends(get_current_user)):
+async def delete_asset(asset_id: str, current_user: Principal = Depends(get_current_user)):
     """Delete a tracked asset for the current user."""
     logger.info(f"Deleting asset with ID: {asset_id}, User ID: {current_user.id}")
-    return asset_service.delete_asset(asset_id, current_user.id)
+    return await asset_service.delete_asset(asset_id, current_user.id)
 
 @router.put("/refresh/{asset_id}", response_model=AssetResponse)
-async def refresh_asset(asset_id: str, current_user: UserModel = Depends(get_current_user)):
+async def refresh_asset(asset_id: str, current_user: Principal = Depends(get_current_user)):
     """Manually refresh asset details for a specific asset."""
     logger.info(f"Manually refreshing asset with ID: {asset_id}, User ID: {current_user.id}")
-    return asset_service.refresh_asset_details(asset_id, current_user.id)
+    return await asset_service.refresh_asset_details(asset_id, current_user.id)
+
+@router.get("/prices/{asset_symbol}", response_model=List[PricePoint])
+async def get_price_series(
+    asset_symbol: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    max_points: Optional[int] = Query(None, ge=2, le=1000),
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Daily closes of an asset between start and end (inclusive), oldest first.
+
+    With max_points, the series is downsampled for sparklines; the last point is always the latest close.
+    """
+    logger.info(f"Fetching price series for {asset_symbol} ({start} to {end}), user ID: {current_user.id}")
+    loop = asyncio.get_event_loop()
+    series = await loop.run_in_executor(None, asset_service.market_data.load_price_series, [asset_symbol], start, end)
+    points = series[asset_symbol]
+    if max_points:
+        points = downsample(points, max_points)
+    return [{"date": point_date, "close": close} for point_date, close in points]
+
+@router.get("/analyze-risk", response_model=PortfolioRiskResponse)
+async def analyze_portfolio_risk(current_user: Principal = Depends(get_current_user)):
+    """
+    Analyze risk for all assets tracked by the current user in one request.
+
+    Fresh stored analyses are reused and only the stale ones are requested from Sonar.
+    """
+    logger.info(f"Analyzing portfolio risk for user ID: {current_user.id}")
+    return await risk_analysis_service.analyze_portfolio_risk(current_user.id)
 
 @router.get("/analyze-risk/{asset_symbol}", response_model=RiskAnalysisResponse)
-async def analyze_asset_risk(asset_symbol: str, current_user: UserModel = Depends(get_current_user)):
+async def analyze_asset_risk(asset_symbol: str, current_user: Principal = Depends(get_current_user)):
     """
     Analyze risk for a specific asset using price history and news sentiment.
     
     Args:
         asset_symbol (str): The symbol of the asset to analyze
-        current_user (UserModel): The authenticated user
+        current_user (Principal): The authenticated user
         
     Returns:
         RiskAnalysisResponse: Detailed risk analysis including volatility, sentiment, and recommendations
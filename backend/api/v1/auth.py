@@ -1,15 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, EmailStr
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import bcrypt # For password hashing
 from jose import JWTError, jwt # For JWT handling
 from datetime import datetime, timedelta, timezone
 import os # For environment variables
+import uuid
 
 # Database and model imports
-from database import get_db # Corrected import path
+from database import get_db, SessionLocal # Corrected import path
 from models.user import User as UserModel # Corrected import path and aliased
+from services.auth_cache import Principal, PrincipalCache
+from services.structured_logging import bind_log_context
 
 # Load JWT settings from environment variables
 SECRET_KEY = os.getenv("SECRET_KEY", "your-default-secret-key-if-not-set") 
@@ -19,6 +25,22 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 if SECRET_KEY == "your-default-secret-key-if-not-set":
     print("WARNING: SECRET_KEY is using a default value. Please set it in your .env file for production.")
 
+# bcrypt is deliberately slow; run it on its own small pool so logins never block the event loop
+# and a burst of logins cannot starve the default executor used for database work
+_password_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", 4)),
+    thread_name_prefix="password-hash",
+)
+
+# Authenticated users, so most requests skip the user lookup
+principal_cache = PrincipalCache(ttl_seconds=float(os.getenv("AUTH_CACHE_TTL_SECONDS", 60)))
+
+@event.listens_for(UserModel, "after_update")
+@event.listens_for(UserModel, "after_delete")
+def _invalidate_cached_user(mapper, connection, target):
+    """Forget cached tokens of a user that was changed, e.g. deactivated, or deleted."""
+    principal_cache.invalidate_user(target.id)
+
 
 router = APIRouter(
     prefix="/auth",
@@ -56,13 +78,22 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_password_executor, get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti identifies the token in the principal cache
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -70,8 +101,19 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
 def get_user_by_email(db: Session, email: str) -> UserModel | None:
     return db.query(UserModel).filter(UserModel.email == email).first()
 
+def _load_principal(email: str) -> Principal | None:
+    """Look up a user in a session of its own, on the calling thread, and copy out the principal."""
+    db = SessionLocal()
+    try:
+        user = get_user_by_email(db, email=email)
+        if user is None:
+            return None
+        return Principal(id=user.id, email=user.email, is_active=bool(user.is_active))
+    finally:
+        db.close()
+
 # --- Dependency to get current user ---
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -87,22 +129,33 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         raise credentials_exception
     except Exception as e:
         raise credentials_exception
-    
-    user = get_user_by_email(db, email=token_data.email)
-    if user is None:
-        raise credentials_exception
-    if not user.is_active:
+
+    # Tokens issued before jti was added are cached by subject
+    cache_key = payload.get("jti") or ("sub", token_data.email)
+    principal = principal_cache.get(cache_key)
+    if principal is None:
+        loop = asyncio.get_event_loop()
+        principal = await loop.run_in_executor(None, _load_principal, token_data.email)
+        if principal is None:
+            raise credentials_exception
+        if principal.is_active:
+            expires_in = payload["exp"] - datetime.now(timezone.utc).timestamp() if "exp" in payload else None
+            principal_cache.put(cache_key, principal, expires_in)
+    if not principal.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return user
+    bind_log_context(user_id=principal.id)
+    return principal
 
 # --- Endpoints ---
+# The request's Session is not thread-safe: it is only used on the request thread, and
+# only the password hashing goes to the executor
 @router.post("/register", response_model=UserDisplay)
 async def register_user(user_in: UserCreate, db: Session = Depends(get_db)):
-    db_user = get_user_by_email(db, email=user_in.email)
+    db_user = get_user_by_email(db, user_in.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await get_password_hash_async(user_in.password)
     new_user = UserModel(email=user_in.email, hashed_password=hashed_password)
     db.add(new_user)
     db.commit()
@@ -112,8 +165,8 @@ async def register_user(user_in: UserCreate, db: Session = Depends(get_db)):
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = get_user_by_email(db, email=form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = get_user_by_email(db, form_data.username)
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -130,5 +183,5 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 # Example of a protected route (you'll add this dependency to other routes)
 # @router.get("/users/me/", response_model=UserDisplay)
-# async def read_users_me(current_user: UserModel = Depends(get_current_user)):
+# async def read_users_me(current_user: Principal = Depends(get_current_user)):
 # return current_user 
\ No newline at end of file
@@ -1,8 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
 from services.chat_service import ChatService
+from services.conversation_store import list_conversations
+from .sse import sse_response
 from models.chat import ChatRequest
-from .auth import get_current_user
-from models.user import User as UserModel
+from .auth import Principal, get_current_user
+from database import db_connection
+from queries import CHAT_MESSAGES
 import uuid
 import logging
 import asyncio
@@ -15,7 +19,7 @@ router = APIRouter()
 chat_service = ChatService()
 
 @router.post("/send")
-async def chat_completion(request: ChatRequest, current_user: UserModel = Depends(get_current_user)):
+async def chat_completion(request: ChatRequest, current_user: Principal = Depends(get_current_user)):
     logger.info(f"Chat completion request received - Type: {request.type}, Conversation ID: {request.conversation_id}, User ID: {current_user.id}")
     try:
         if request.conversation_id is None:
@@ -30,97 +34,117 @@ async def chat_completion(request: ChatRequest, current_user: UserModel = Depend
             "conversation_id": request.conversation_id,
             "response": response,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/stream")
+async def chat_completion_stream(request: ChatRequest, current_user: Principal = Depends(get_current_user)):
+    """Stream the answer as Server-Sent Events: conversation, token, citations and done."""
+    logger.info(f"Streaming chat request received - Type: {request.type}, Conversation ID: {request.conversation_id}, User ID: {current_user.id}")
+    try:
+        if request.conversation_id is None:
+            request.conversation_id = str(uuid.uuid4())
+            logger.info(f"Generated new conversation ID: {request.conversation_id}")
+
+        stream = await chat_service.stream_chat_request(
+            request.type, request.user_query, request.conversation_id, current_user.id
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting chat stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        try:
+            yield {"event": "conversation", "data": {"conversation_id": request.conversation_id}}
+            async for event in stream:
+                yield event
+        finally:
+            await stream.aclose()
+
+    return sse_response(events())
+
 @router.get("/history")
-async def get_chat_history(current_user: UserModel = Depends(get_current_user)):
-    """Get a list of all chat conversations for the current user."""
+async def get_chat_history(
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user)
+):
+    """Get one page of chat conversations for the current user, newest first. Pass next_cursor back as cursor for the next page."""
     logger.info(f"Fetching chat history for user ID: {current_user.id}")
     loop = asyncio.get_event_loop()
     try:
         def db_query():
-            cursor = chat_service.conn.execute("""
-                SELECT 
-                    conversation_id,
-                    MIN(timestamp) as first_message_time,
-                    type,
-                    (
-                        SELECT content 
-                        FROM messages m2 
-                        WHERE m2.conversation_id = m1.conversation_id 
-                        AND m2.role = 'user'
-                        AND m2.user_id = ?  -- Filter by user_id
-                        ORDER BY m2.timestamp ASC 
-                        LIMIT 1
-                    ) as first_message
-                FROM messages m1
-                WHERE m1.user_id = ?  -- Filter by user_id
-                AND m1.type != 'guide'  -- Exclude guide type messages
-                GROUP BY conversation_id
-                ORDER BY first_message_time DESC
-            """, (current_user.id, current_user.id))
+            with db_connection() as conn:
+                # Guide conversations are not listed
+                rows, next_cursor = list_conversations(
+                    conn, "chat", current_user.id, limit, cursor, exclude_type="guide"
+                )
             
             history_data = []
-            for row in cursor.fetchall():
+            for row in rows:
+                title = row["title"] or ""
                 history_data.append({
                     "id": row["conversation_id"],
-                    "title": row["first_message"][:30] + ("..." if len(row["first_message"]) > 30 else ""),
-                    "timestamp": row["first_message_time"],
+                    "title": title[:30] + ("..." if len(title) > 30 else ""),
+                    "timestamp": row["created_at"],
                     "type": row["type"]
                 })
-            return history_data
+            return history_data, next_cursor
         
-        history = await loop.run_in_executor(None, db_query)
+        history, next_cursor = await loop.run_in_executor(None, db_query)
         logger.info(f"Successfully retrieved {len(history)} chat conversations for user ID: {current_user.id}")
-        return {"history": history}
+        return {"history": history, "next_cursor": next_cursor}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching chat history for user ID {current_user.id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{chat_id}")
-async def get_chat_messages(chat_id: str, current_user: UserModel = Depends(get_current_user)):
+async def get_chat_messages(chat_id: str, current_user: Principal = Depends(get_current_user)):
     """Get all messages for a specific chat conversation for the current user."""
     logger.info(f"Fetching messages for chat ID: {chat_id}, User ID: {current_user.id}")
     loop = asyncio.get_event_loop()
     try:
         def db_query():
-            cursor = chat_service.conn.execute("""
-                SELECT id, role, content, timestamp, citations
-                FROM messages
-                WHERE conversation_id = ? AND user_id = ? -- Filter by user_id
-                ORDER BY timestamp ASC
-            """, (chat_id, current_user.id))
+            with db_connection() as conn:
+                cursor = conn.execute(CHAT_MESSAGES, (chat_id, current_user.id))
             
-            messages_data = []
-            for row in cursor.fetchall():
-                message_data = {
-                    "id": row["id"],
-                    "text": row["content"],
-                    "sender": "user" if row["role"] == "user" else "bot",
-                    "timestamp": row["timestamp"]
-                }
+                messages_data = []
+                for row in cursor.fetchall():
+                    message_data = {
+                        "id": row["id"],
+                        "text": row["content"],
+                        "sender": "user" if row["role"] == "user" else "bot",
+                        "timestamp": row["timestamp"]
+                    }
                 
-                # Add citations if available
-                if row["citations"]:
-                    try:
-                        message_data["citations"] = json.loads(row["citations"])
-                    except (json.JSONDecodeError, TypeError):
-                        message_data["citations"] = []
+                    # Add citations if available
+                    if row["citations"]:
+                        try:
+                            message_data["citations"] = json.loads(row["citations"])
+                        except (json.JSONDecodeError, TypeError):
+                            message_data["citations"] = []
                 
-                messages_data.append(message_data)
-            return messages_data
+                    messages_data.append(message_data)
+                return messages_data
         
         messages = await loop.run_in_executor(None, db_query)
         logger.info(f"Successfully retrieved {len(messages)} messages for chat ID: {chat_id}, User ID: {current_user.id}")
         return {"messages": messages}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching chat messages for chat ID {chat_id}, User ID {current_user.id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/clear")
-async def clear_database(current_user: UserModel = Depends(get_current_user)):
+async def clear_database(current_user: Principal = Depends(get_current_user)):
     """Clear all data for the current user from the database."""
     logger.info(f"Clearing database for user ID: {current_user.id}")
     try:
@@ -131,6 +155,8 @@ async def clear_database(current_user: UserModel = Depends(get_current_user)):
         else:
             logger.error(f"Failed to clear database for user ID: {current_user.id}")
             raise HTTPException(status_code=500, detail=f"Failed to clear database for user ID: {current_user.id}")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error clearing database for user ID {current_user.id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Depends
+from services.job_service import job_service
+from models.job import JobResponse
+from .sse import sse_response
+from .auth import Principal, get_current_user
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, current_user: Principal = Depends(get_current_user)):
+    """Status of a job, with its result once it has succeeded."""
+    job = await job_service.get(job_id, str(current_user.id))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, current_user: Principal = Depends(get_current_user)):
+    """Stream a job's progress as Server-Sent Events: status updates, then result or error."""
+    user_id = str(current_user.id)
+    if await job_service.get(job_id, user_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    logger.info(f"Streaming events for job {job_id}, User ID: {user_id}")
+    return sse_response(job_service.events(job_id, user_id))
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from services.news_service import NewsService
-from .auth import get_current_user
-from models.user import User as UserModel
+from services.job_service import job_service
+from .auth import Principal, get_current_user
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,15 +10,20 @@ router = APIRouter()
 # Initialize service
 news_service = NewsService()
 
+async def _run_news_job(user_id: str, params: dict):
+    return await news_service.process_news_request(user_id=user_id, **params)
+
+job_service.register("news", _run_news_job)
+
 @router.post("/")
-async def news_completion(topics: str = "", model: str = "sonar-pro", force_reload: bool = False, current_user: UserModel = Depends(get_current_user)):
+async def news_completion(topics: str = "", model: str = "sonar-pro", force_reload: bool = False, current_user: Principal = Depends(get_current_user)):
     """
     Fetch latest financial news from the web.
     
     Args:
         topics (str): The topics to focus on
         force_reload (bool): Whether to force a reload of the news
-        current_user (UserModel): The authenticated user, injected by Depends(get_current_user).
+        current_user (Principal): The authenticated user, injected by Depends(get_current_user).
         
     Returns:
         dict: The response from the Sonar Pro model
@@ -32,6 +37,23 @@ async def news_completion(topics: str = "", model: str = "sonar-pro", force_relo
         response = await news_service.process_news_request(user_id=user_id, topics=topics, model=model, force_reload=force_reload)
         logger.info(f"Successfully processed news request for User ID: {user_id}")
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing news request for User ID: {user_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/jobs", status_code=202)
+async def submit_news_job(topics: str = "", model: str = "sonar-pro", force_reload: bool = False, current_user: Principal = Depends(get_current_user)):
+    """
+    Fetch news as a background job, for slow models such as sonar-deep-research.
+
+    Returns the job id right away; poll /jobs/{job_id} or stream /jobs/{job_id}/events
+    for the result. Submitting the same request again returns the same job.
+    """
+    user_id = str(current_user.id)
+    logger.info(f"Submitting news job for User ID: {user_id}, topics: {topics}, model: {model}, force_reload: {force_reload}")
+    job, created = await job_service.submit(
+        "news", user_id, {"topics": topics, "model": model, "force_reload": force_reload}, force=force_reload
+    )
+    return {"job_id": job["job_id"], "status": job["status"], "created": created}
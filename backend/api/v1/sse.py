@@ -0,0 +1,36 @@
+from typing import Any, AsyncGenerator, Dict
+from fastapi.responses import StreamingResponse
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def format_sse(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events: AsyncGenerator[Dict[str, Any], None]) -> StreamingResponse:
+    """
+    Stream {"event": ..., "data": ...} dicts to the client as Server-Sent Events.
+
+    Errors raised while streaming are sent as a final "error" event, since the
+    status code has already gone out with the first byte. events is closed when the
+    stream ends, including when the client disconnects, so its cleanup always runs.
+    """
+    async def body():
+        try:
+            async for item in events:
+                yield format_sse(item["event"], item["data"])
+        except Exception as e:
+            logger.error(f"Error while streaming events: {str(e)}")
+            detail = getattr(e, "detail", None) or str(e)
+            yield format_sse("error", {"detail": detail})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends
 from services.stock_recommendation_service import StockRecommendationService
-from models.stock_recommendation import StockRecommendationResponse
-from .auth import get_current_user
-from models.user import User as UserModel
+from services.job_service import job_service
+from models.stock_recommendation import PersonalizedStockRecommendationResponse
+from .auth import Principal, get_current_user
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,11 +11,17 @@ router = APIRouter()
 # Initialize service
 stock_recommendation_service = StockRecommendationService()
 
-@router.get("/", response_model=StockRecommendationResponse)
+async def _run_stock_recommendation_job(user_id: str, params: dict):
+    response = await stock_recommendation_service.get_beginner_stock_recommendation(user_id=user_id, **params)
+    return PersonalizedStockRecommendationResponse(**response).model_dump()
+
+job_service.register("stock_recommendation", _run_stock_recommendation_job)
+
+@router.get("/", response_model=PersonalizedStockRecommendationResponse)
 async def get_beginner_stock_recommendation(
     model: str = "sonar-pro", 
     force_reload: bool = False, 
-    current_user: UserModel = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Get a beginner-friendly low-risk stock recommendation.
@@ -23,10 +29,10 @@ async def get_beginner_stock_recommendation(
     Args:
         model (str): The model to use for the API call (default: sonar-pro)
         force_reload (bool): Whether to force a reload and bypass cache
-        current_user (UserModel): The authenticated user, injected by Depends(get_current_user).
+        current_user (Principal): The authenticated user, injected by Depends(get_current_user).
         
     Returns:
-        StockRecommendationResponse: A single stock recommendation suitable for beginners
+        PersonalizedStockRecommendationResponse: A single stock recommendation suitable for beginners
     """
     user_id = str(current_user.id)
 
@@ -38,7 +44,28 @@ async def get_beginner_stock_recommendation(
             force_reload=force_reload
         )
         logger.info(f"Successfully processed stock recommendation request for User ID: {user_id}")
-        return StockRecommendationResponse(**response)
+        return PersonalizedStockRecommendationResponse(**response)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing stock recommendation request for User ID: {user_id}: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/jobs", status_code=202)
+async def submit_stock_recommendation_job(
+    model: str = "sonar-pro",
+    force_reload: bool = False,
+    current_user: Principal = Depends(get_current_user)
+):
+    """
+    Get a stock recommendation as a background job, for slow models such as sonar-deep-research.
+
+    Returns the job id right away; poll /jobs/{job_id} or stream /jobs/{job_id}/events
+    for the result. Submitting the same request again returns the same job.
+    """
+    user_id = str(current_user.id)
+    logger.info(f"Submitting stock recommendation job for User ID: {user_id}, model: {model}, force_reload: {force_reload}")
+    job, created = await job_service.submit(
+        "stock_recommendation", user_id, {"model": model, "force_reload": force_reload}, force=force_reload
+    )
+    return {"job_id": job["job_id"], "status": job["status"], "created": created}
@@ -0,0 +1,99 @@
+"""
+Compare two benchmark result files written by benchmarks.run.
+
+Prints p50/p95/p99, RPS, error rate and loop lag per scenario with the relative
+change, and exits with status 1 if any scenario regressed by more than the threshold:
+a slower p95 or p99, lower RPS or a higher error rate.
+
+    python -m benchmarks.compare benchmarks/results/baseline.json benchmarks/results/candidate.json
+"""
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import argparse
+import json
+import sys
+
+# (label, path into a scenario result, whether higher is better)
+METRICS = [
+    ("p50 ms", ("latency_ms", "p50"), False),
+    ("p95 ms", ("latency_ms", "p95"), False),
+    ("p99 ms", ("latency_ms", "p99"), False),
+    ("req/s", ("rps",), True),
+    ("errors", ("error_rate",), False),
+    ("lag p99 ms", ("loop_lag_ms", "p99"), False),
+]
+# Metrics that fail the comparison when they regress beyond the threshold
+GATED = {"p95 ms", "p99 ms", "req/s", "errors"}
+
+
+def _value(result: Dict[str, Any], path) -> Optional[float]:
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def _change(base: Optional[float], new: Optional[float]) -> Optional[float]:
+    if base is None or new is None:
+        return None
+    if base == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - base) / base
+
+
+def _format(value: Optional[float]) -> str:
+    return "n/a" if value is None else f"{value:.2f}"
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the comparison table and return descriptions of the regressions."""
+    regressions = []
+    print(f"base: {base['meta'].get('commit')} {base['meta'].get('label', '')} ({base['meta'].get('started_at')})")
+    print(f"new:  {new['meta'].get('commit')} {new['meta'].get('label', '')} ({new['meta'].get('started_at')})")
+    if base["meta"].get("settings") != new["meta"].get("settings"):
+        print("warning: the runs used different settings, differences may not be meaningful")
+
+    for scenario in [name for name in base["scenarios"] if name in new["scenarios"]]:
+        print(f"\n{scenario}")
+        for label, path, higher_is_better in METRICS:
+            old_value = _value(base["scenarios"][scenario], path)
+            new_value = _value(new["scenarios"][scenario], path)
+            change = _change(old_value, new_value)
+            worse = change is not None and (change < -threshold if higher_is_better else change > threshold)
+            # An error rate going from 0 to anything is a regression, however small
+            if label == "errors" and old_value == 0 and new_value:
+                worse = True
+            flag = "  REGRESSION" if worse and label in GATED else ""
+            change_text = f"{change:+.1%}" if change is not None and change != float("inf") else "n/a"
+            print(f"  {label:<11} {_format(old_value):>10} -> {_format(new_value):>10}  {change_text:>8}{flag}")
+            if flag:
+                regressions.append(f"{scenario} {label}: {old_value} -> {new_value}")
+
+    missing = sorted(set(base["scenarios"]) ^ set(new["scenarios"]))
+    if missing:
+        print(f"\nonly in one run: {', '.join(missing)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("base", type=Path)
+    parser.add_argument("new", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    with open(args.base) as file:
+        base = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        sys.exit(1)
+    print("\nno regressions")
+
+
+if __name__ == "__main__":
+    main()
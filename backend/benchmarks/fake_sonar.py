@@ -0,0 +1,293 @@
+"""
+Local stand-in for the Sonar chat completions API, for load and latency benchmarks.
+
+Answers POST /chat/completions like the OpenAI-compatible Sonar endpoint. Structured
+requests get a payload generated from the JSON schema in their response_format, so
+NewsResponse, AssetData, AssetDataBatch, QualitativeRiskAssessment and
+StockRecommendationResponse answers validate; other requests get plain text, streamed
+when stream is true. Latency, error rates and streaming are set in fake_sonar.yaml.
+
+Payloads depend only on the request body and the seed (dates aside), so repeated runs
+exercise the same code paths. Run from backend/ and point the backend at it:
+
+    python -m benchmarks.fake_sonar --port 8100
+    PERPLEXITY_BASE_URL=http://127.0.0.1:8100 uvicorn api.main:app
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Sequence
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import uuid
+import yaml
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = Path(__file__).parent / "fake_sonar.yaml"
+
+TICKERS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "JPM", "V", "KO", "PEP", "JNJ", "XOM"]
+SECTORS = ["Technology", "Healthcare", "Financial Services", "Consumer Defensive", "Energy", "Industrials"]
+SOURCES = ["Reuters", "Bloomberg", "CNBC", "MarketWatch", "Barron's"]
+WORDS = (
+    "market investors shares earnings growth guidance revenue outlook analysts demand rates "
+    "inflation quarter profit margin momentum valuation sector rally pressure volatility risk "
+    "dividend forecast supply chain consumer spending policy expectations trading index"
+).split()
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+class PayloadGenerator:
+    """Builds schema-valid, plausible-looking values from a JSON schema, using field names as hints."""
+
+    def __init__(self, rng: random.Random, symbols: Sequence[str] = ()):
+        self.rng = rng
+        # Symbols named in the prompt, so answers refer to the assets asked about
+        self.symbols = list(symbols) or [rng.choice(TICKERS)]
+        self.symbol = self.symbols[0]
+        self.price = round(rng.uniform(20, 500), 2)
+
+    def generate(self, schema: Dict[str, Any], defs: Dict[str, Any], name: str = "") -> Any:
+        if "$ref" in schema:
+            schema = defs[schema["$ref"].split("/")[-1]]
+        if "anyOf" in schema:
+            options = [option for option in schema["anyOf"] if option.get("type") != "null"]
+            schema = options[0] if options else {"type": "null"}
+        if "enum" in schema:
+            return self.rng.choice(schema["enum"])
+
+        kind = schema.get("type")
+        if kind == "object":
+            value = {prop: self.generate(sub, defs, prop) for prop, sub in schema.get("properties", {}).items()}
+            if isinstance(value.get("news_items"), list) and "total_items" in value:
+                value["total_items"] = len(value["news_items"])
+            return value
+        if kind == "array":
+            if name == "price_history":
+                # Six closes before today, drifting towards the current price
+                return [round(self.price * (1 + self.rng.uniform(-0.03, 0.03)), 2) for _ in range(6)]
+            return [self.generate(schema.get("items", {}), defs, name) for _ in range(self.rng.randint(3, 5))]
+        if kind == "number":
+            return self._number(name)
+        if kind == "integer":
+            return self.rng.randint(0, 10)
+        if kind == "boolean":
+            return False
+        if kind == "null":
+            return None
+        return self._string(name)
+
+    def _number(self, name: str) -> float:
+        if "movement" in name or "percent" in name or "change" in name:
+            return round(self.rng.uniform(-5, 5), 2)
+        if "price" in name:
+            return self.price
+        if "score" in name or name == "confidence":
+            return round(self.rng.uniform(0, 1), 2)
+        return round(self.rng.uniform(0, 100), 2)
+
+    def _string(self, name: str) -> str:
+        if "symbol" in name:
+            return self.rng.choice(self.symbols)
+        if name == "url":
+            return f"https://example.com/markets/{self.rng.randrange(10 ** 6)}"
+        if "date" in name or "updated" in name:
+            return datetime.now(timezone.utc).date().isoformat()
+        if name in ("risk_level", "risk_label"):
+            return self.rng.choice(["Low", "Moderate", "High"])
+        if "sentiment" in name:
+            return self.rng.choice(["Positive", "Neutral", "Negative"])
+        if name == "sector":
+            return self.rng.choice(SECTORS)
+        if name == "source":
+            return self.rng.choice(SOURCES)
+        if name.endswith("name"):
+            return f"{self.symbol} Inc."
+        return _sentence(self.rng, self.rng.randint(8, 16))
+
+
+class FakeSonar:
+    def __init__(self, config_path: Path = DEFAULT_CONFIG):
+        with open(config_path, "r") as file:
+            self.settings = yaml.safe_load(file)["fake_sonar"]
+        self.seed = int(self.settings.get("seed", 42))
+        self.rng = random.Random(self.seed)
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _setting(self, model: str, section: str) -> Dict[str, Any]:
+        merged = dict(self.settings.get(section, {}))
+        merged.update((self.settings.get("models", {}).get(model) or {}).get(section, {}))
+        return merged
+
+    def _latency_seconds(self, model: str) -> float:
+        latency = self._setting(model, "latency")
+        kind = latency.get("kind", "fixed")
+        median = float(latency.get("median_ms", 0))
+        if kind == "uniform":
+            value = self.rng.uniform(float(latency.get("min_ms", 0)), float(latency.get("max_ms", median)))
+        elif kind == "lognormal":
+            value = self.rng.lognormvariate(0, float(latency.get("sigma", 0.5))) * median
+        else:
+            value = median
+        return min(max(value, float(latency.get("min_ms", 0))), float(latency.get("max_ms", value))) / 1000
+
+    def _request_rng(self, body: Dict[str, Any]) -> random.Random:
+        digest = hashlib.sha256(json.dumps([self.seed, body], sort_keys=True, default=str).encode()).hexdigest()
+        return random.Random(int(digest[:16], 16))
+
+    @staticmethod
+    def _user_prompt(body: Dict[str, Any]) -> str:
+        users = [message.get("content") or "" for message in body.get("messages", []) if message.get("role") == "user"]
+        return users[-1] if users else ""
+
+    def _content(self, body: Dict[str, Any], rng: random.Random) -> str:
+        prompt = self._user_prompt(body)
+        response_format = body.get("response_format") or {}
+        schema = (response_format.get("json_schema") or {}).get("schema")
+        if schema is None:
+            return " ".join(_sentence(rng, 12) for _ in range(max(int(self.settings.get("answer_words", 120)) // 12, 1)))
+
+        defs = schema.get("$defs", {})
+        batch_symbols = re.findall(r"^- (\S+) \(", prompt, re.MULTILINE)
+        if "assets" in schema.get("properties", {}) and batch_symbols:
+            item_schema = schema["properties"]["assets"].get("items", {})
+            assets = [PayloadGenerator(rng, [symbol]).generate(item_schema, defs) for symbol in batch_symbols]
+            return json.dumps({"assets": assets})
+
+        symbols = re.findall(r"(?:symbol|Symbol:|for) ([A-Z][A-Z0-9.\-]{0,9})\b", prompt)
+        return json.dumps(PayloadGenerator(rng, list(dict.fromkeys(symbols))).generate(schema, defs))
+
+    def _count(self, model: str, outcome: str) -> None:
+        model_stats = self.stats.setdefault(model, {})
+        model_stats[outcome] = model_stats.get(outcome, 0) + 1
+
+    async def complete(self, body: Dict[str, Any]):
+        model = body.get("model", "sonar-pro")
+        self._count(model, "requests")
+
+        errors = self._setting(model, "errors")
+        draw = self.rng.random()
+        rate_limit = float(errors.get("rate_limit", 0))
+        if draw < rate_limit:
+            self._count(model, "rate_limited")
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit exceeded", "type": "rate_limit_exceeded"}},
+                headers={"Retry-After": str(errors.get("retry_after_seconds", 1))},
+            )
+        if draw < rate_limit + float(errors.get("server_error", 0)):
+            self._count(model, "server_errors")
+            return JSONResponse(status_code=503, content={"error": {"message": "Service unavailable", "type": "server_error"}})
+
+        await asyncio.sleep(self._latency_seconds(model))
+
+        rng = self._request_rng(body)
+        content = self._content(body, rng)
+        citations = [f"https://example.com/source/{rng.randrange(10 ** 6)}" for _ in range(3)]
+        prompt_tokens = sum(len(message.get("content") or "") for message in body.get("messages", [])) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+        }
+        completion_id = uuid.uuid4().hex
+        created = int(time.time())
+
+        if body.get("stream"):
+            return StreamingResponse(
+                self._stream(model, completion_id, created, content, citations, usage),
+                media_type="text/event-stream",
+            )
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "citations": citations,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+    async def _stream(self, model: str, completion_id: str, created: int, content: str,
+                      citations: List[str], usage: Dict[str, int]) -> AsyncIterator[str]:
+        streaming = self._setting(model, "streaming")
+        chunks = max(int(streaming.get("chunks", 40)), 1)
+        interval = float(streaming.get("chunk_interval_ms", 25)) / 1000
+        size = -(-len(content) // chunks)
+        pieces = [content[i:i + size] for i in range(0, len(content), size)] or [""]
+
+        for i, piece in enumerate(pieces):
+            last = i == len(pieces) - 1
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "citations": citations,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": piece} if i == 0 else {"content": piece},
+                    "finish_reason": "stop" if last else None,
+                }],
+            }
+            if last:
+                chunk["usage"] = usage
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if not last:
+                await asyncio.sleep(interval)
+        yield "data: [DONE]\n\n"
+
+
+def create_app(config_path: Path = DEFAULT_CONFIG) -> FastAPI:
+    fake = FakeSonar(config_path)
+    app = FastAPI(title="Fake Sonar")
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        return await fake.complete(await request.json())
+
+    @app.get("/stats")
+    async def stats():
+        """Requests and injected errors per model since startup."""
+        return fake.stats
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Sonar API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--config", type=Path, default=DEFAULT_CONFIG)
+    args = parser.parse_args()
+
+    logger.info(f"Fake Sonar listening on http://{args.host}:{args.port} with {args.config}")
+    uvicorn.run(create_app(args.config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+End-to-end benchmark of the v1 endpoints against the local Sonar stand-in.
+
+Seeds a synthetic database, starts benchmarks.fake_sonar and the backend
+(benchmarks.serve) as subprocesses, then drives each scenario with a fixed number of
+concurrent clients. For every scenario it reports p50/p95/p99 latency, requests per
+second, errors and the server's event-loop lag, and writes everything to a JSON file
+that benchmarks.compare diffs against another run.
+
+    python -m benchmarks.run --concurrency 16 --requests 400
+    python -m benchmarks.run --scenarios chat_history,assets_get --label after-index
+"""
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import httpx
+from benchmarks.seed import PASSWORD, QUESTIONS, SYMBOLS, conversation_id, user_email
+from benchmarks.stats import summarize_ms
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+# One line per benchmark request would drown the results
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BACKEND_DIR = Path(__file__).parent.parent
+RESULTS_DIR = Path(__file__).parent / "results"
+TOPICS = ["", "ai", "energy", "banks"]
+
+# (method, path, httpx request kwargs) for one request by a virtual user
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+class VirtualUser:
+    def __init__(self, index: int, token: str, rng: random.Random, conversations: int):
+        self.index = index
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.rng = rng
+        self.conversations = conversations
+
+
+def _auth_token(user: VirtualUser) -> Request:
+    return "POST", "/api/v1/auth/token", {"data": {"username": user_email(user.index), "password": PASSWORD}}
+
+
+def _chat_send(user: VirtualUser) -> Request:
+    # Continue a seeded conversation, so history loading and the context window are exercised
+    chat_id = conversation_id(user.index, user.rng.randrange(user.conversations))
+    body = {"type": "chat", "user_query": user.rng.choice(QUESTIONS), "conversation_id": chat_id}
+    return "POST", "/api/v1/chat/send", {"json": body, "headers": user.headers}
+
+
+def _chat_history(user: VirtualUser) -> Request:
+    return "GET", "/api/v1/chat/history", {"params": {"limit": 20}, "headers": user.headers}
+
+
+def _assets_get(user: VirtualUser) -> Request:
+    return "GET", "/api/v1/tracker/assets/get", {"headers": user.headers}
+
+
+def _news(user: VirtualUser) -> Request:
+    return "POST", "/api/v1/news/", {"params": {"topics": user.rng.choice(TOPICS)}, "headers": user.headers}
+
+
+def _asset_chat(user: VirtualUser) -> Request:
+    body = {"user_query": user.rng.choice(QUESTIONS), "symbol": user.rng.choice(list(SYMBOLS)), "conversation_id": uuid.uuid4().hex}
+    return "POST", "/api/v1/asset-chat/", {"json": body, "headers": user.headers}
+
+
+def _stock_recommendation(user: VirtualUser) -> Request:
+    return "GET", "/api/v1/stock_recommendation/", {"headers": user.headers}
+
+
+SCENARIOS: Dict[str, Callable[[VirtualUser], Request]] = {
+    "auth_token": _auth_token,
+    "chat_send": _chat_send,
+    "chat_history": _chat_history,
+    "assets_get": _assets_get,
+    "news": _news,
+    "asset_chat": _asset_chat,
+    "stock_recommendation": _stock_recommendation,
+}
+
+
+def _start(module: str, args: List[str], env: Dict[str, str], log_path: Path) -> subprocess.Popen:
+    log_file = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", module, *args],
+        cwd=BACKEND_DIR, env={**os.environ, **env}, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+
+
+async def _wait_healthy(client: httpx.AsyncClient, url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before becoming healthy")
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become healthy within {timeout}s")
+
+
+async def _login(client: httpx.AsyncClient, users: int, concurrency: int) -> List[str]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(index: int) -> str:
+        async with semaphore:
+            response = await client.post("/api/v1/auth/token", data={"username": user_email(index), "password": PASSWORD})
+            response.raise_for_status()
+            return response.json()["access_token"]
+
+    return await asyncio.gather(*(login(index) for index in range(users)))
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, users: List[VirtualUser],
+                       concurrency: int, requests: int, warmup: int) -> Dict[str, Any]:
+    """Send requests (after warmup unmeasured ones) from concurrency workers and summarize them."""
+    build = SCENARIOS[name]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = warmup + requests
+    measure_started: Optional[float] = None
+
+    async def worker(worker_index: int):
+        nonlocal remaining, measure_started
+        user = users[worker_index % len(users)]
+        while remaining > 0:
+            remaining -= 1
+            measured = remaining < requests
+            method, path, kwargs = build(user)
+            started = time.perf_counter()
+            if measured and measure_started is None:
+                measure_started = started
+            try:
+                response = await client.request(method, path, **kwargs)
+                outcome = None if response.status_code < 400 else str(response.status_code)
+            except httpx.HTTPError as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if measured:
+                latencies.append(elapsed)
+                if outcome is not None:
+                    errors[outcome] = errors.get(outcome, 0) + 1
+            user = users[(user.index + concurrency) % len(users)]
+
+    await client.post("/bench/loop-lag/reset")
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    # Measured from the first measured request, so warmup does not count
+    duration = time.perf_counter() - measure_started if measure_started is not None else 0.0
+    loop_lag = (await client.get("/bench/loop-lag")).json()
+
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(sum(errors.values()) / len(latencies), 4) if latencies else 0.0,
+        "duration_seconds": round(duration, 3),
+        "rps": round(len(latencies) / duration, 2) if duration > 0 else 0.0,
+        "latency_ms": summarize_ms(latencies),
+        "loop_lag_ms": {key: value for key, value in loop_lag.items() if key != "samples"},
+    }
+    logger.info(
+        f"{name}: {result['rps']} req/s, p50 {result['latency_ms']['p50']}ms, p95 {result['latency_ms']['p95']}ms, "
+        f"p99 {result['latency_ms']['p99']}ms, loop lag p99 {result['loop_lag_ms']['p99']}ms, errors {errors or 0}"
+    )
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+async def main_async(args: argparse.Namespace) -> Path:
+    db_file = args.db.resolve()
+    if not args.skip_seed:
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.seed", "--db", str(db_file), "--users", str(args.users),
+             "--conversations", str(args.conversations), "--seed", str(args.seed)],
+            cwd=BACKEND_DIR, check=True,
+        )
+
+    log_dir = Path(tempfile.mkdtemp(prefix="finsight-bench-"))
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    backend_url = f"http://127.0.0.1:{args.port}"
+    fake = _start("benchmarks.fake_sonar", ["--port", str(args.fake_port), "--config", str(args.fake_config.resolve())],
+                  {}, log_dir / "fake_sonar.log")
+    backend = _start("benchmarks.serve", ["--port", str(args.port)], {
+        "DATABASE_URL": f"sqlite:///{db_file}",
+        "PERPLEXITY_BASE_URL": fake_url,
+        "PERPLEXITY_API_KEY": os.getenv("PERPLEXITY_API_KEY") or "benchmark",
+    }, log_dir / "backend.log")
+    logger.info(f"Server logs in {log_dir}")
+
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=backend_url, timeout=args.timeout, limits=limits) as client:
+            await _wait_healthy(client, f"{fake_url}/health", fake)
+            await _wait_healthy(client, "/health", backend)
+
+            rng = random.Random(args.seed)
+            tokens = await _login(client, args.users, min(args.concurrency, 8))
+            users = [VirtualUser(index, token, random.Random(rng.random()), args.conversations) for index, token in enumerate(tokens)]
+
+            scenarios = {}
+            for name in args.scenarios:
+                scenarios[name] = await run_scenario(client, name, users, args.concurrency, args.requests, args.warmup)
+            fake_stats = (await client.get(f"{fake_url}/stats")).json()
+    finally:
+        for process in (backend, fake):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    started_at = datetime.now(timezone.utc)
+    results = {
+        "meta": {
+            "label": args.label,
+            "commit": _git_commit(),
+            "started_at": started_at.isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "users": args.users,
+                "conversations": args.conversations,
+                "seed": args.seed,
+                "fake_config": args.fake_config.name,
+            },
+            "upstream": fake_stats,
+        },
+        "scenarios": scenarios,
+    }
+    args.output.mkdir(parents=True, exist_ok=True)
+    name = "-".join(part for part in (started_at.strftime("%Y%m%dT%H%M%SZ"), results["meta"]["commit"], args.label) if part)
+    path = args.output / f"{name}.json"
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2)
+    logger.info(f"Results written to {path}")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the v1 endpoints against a local Sonar stand-in")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda value: [name for name in value.split(",") if name],
+                        help=f"comma separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests before each scenario")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", type=Path, default=Path(__file__).parent / "bench.db")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse the database from a previous run")
+    parser.add_argument("--fake-config", type=Path, default=Path(__file__).parent / "fake_sonar.yaml")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--fake-port", type=int, default=8201)
+    parser.add_argument("--label", default="")
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR)
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
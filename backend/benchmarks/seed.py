@@ -0,0 +1,169 @@
+"""
+Seed a synthetic SQLite database for benchmarks.
+
+Creates users with a shared password, chat and asset chat conversations with
+alternating user/assistant messages, tracked assets, fresh market snapshots and a
+daily price series per symbol. The same arguments always produce the same data.
+
+    python -m benchmarks.seed --db benchmarks/bench.db --users 50
+"""
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import logging
+import os
+import random
+import uuid
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PASSWORD = "benchmark-password"
+SYMBOLS = {
+    "AAPL": ("Apple Inc.", "Technology"),
+    "MSFT": ("Microsoft Corporation", "Technology"),
+    "NVDA": ("NVIDIA Corporation", "Technology"),
+    "GOOGL": ("Alphabet Inc.", "Technology"),
+    "AMZN": ("Amazon.com Inc.", "Consumer Cyclical"),
+    "TSLA": ("Tesla Inc.", "Consumer Cyclical"),
+    "JPM": ("JPMorgan Chase & Co.", "Financial Services"),
+    "V": ("Visa Inc.", "Financial Services"),
+    "JNJ": ("Johnson & Johnson", "Healthcare"),
+    "PFE": ("Pfizer Inc.", "Healthcare"),
+    "KO": ("The Coca-Cola Company", "Consumer Defensive"),
+    "PEP": ("PepsiCo Inc.", "Consumer Defensive"),
+    "XOM": ("Exxon Mobil Corporation", "Energy"),
+    "CVX": ("Chevron Corporation", "Energy"),
+    "CAT": ("Caterpillar Inc.", "Industrials"),
+}
+QUESTIONS = [
+    "What is an index fund and how does it work?",
+    "How should I think about diversification as a beginner?",
+    "Explain the difference between a stock and a bond.",
+    "What does a price to earnings ratio tell me?",
+    "How do interest rates affect the stock market?",
+    "Is dollar cost averaging a good strategy?",
+]
+
+
+def user_email(index: int) -> str:
+    return f"bench{index}@example.com"
+
+
+def conversation_id(user_index: int, conversation: int) -> str:
+    return f"bench-{user_index}-{conversation}"
+
+
+def _answer(rng: random.Random) -> str:
+    # Roughly the length of a real assistant answer
+    return " ".join(rng.choice(QUESTIONS) for _ in range(rng.randint(4, 10)))
+
+
+def seed(db_file: Path, users: int, conversations: int, messages: int, assets: int,
+         history_days: int, random_seed: int = 42) -> None:
+    """
+    Recreate db_file with synthetic data.
+
+    Args:
+        db_file (Path): SQLite file to (re)create; its WAL files are removed too
+        users (int): Users, with emails bench<i>@example.com and the shared PASSWORD
+        conversations (int): Chat conversations per user, plus one asset chat per tracked asset
+        messages (int): Messages per conversation
+        assets (int): Tracked assets per user, drawn from SYMBOLS
+        history_days (int): Daily closes stored per symbol
+    """
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{db_file}{suffix}").unlink(missing_ok=True)
+    # The database module reads the location on import
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+    from database import db_transaction, engine, init_db
+    from models.user import Base as UserBase
+    from services.conversation_store import record_message
+    from services.price_store import append_prices
+    import bcrypt
+
+    UserBase.metadata.create_all(bind=engine)
+    init_db()
+    rng = random.Random(random_seed)
+    now = datetime.now(timezone.utc)
+    today = date.today()
+    hashed_password = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+    with db_transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (id, email, hashed_password, is_active) VALUES (?, ?, ?, 1)",
+            [(index + 1, user_email(index), hashed_password) for index in range(users)],
+        )
+
+        for symbol, (name, sector) in SYMBOLS.items():
+            close = rng.uniform(20, 500)
+            points = []
+            for offset in range(history_days, -1, -1):
+                day = today - timedelta(days=offset)
+                # Markets close at weekends
+                if day.weekday() >= 5:
+                    continue
+                close *= 1 + rng.gauss(0, 0.02)
+                points.append((day.isoformat(), round(close, 2)))
+            append_prices(conn, symbol, points)
+            conn.execute("""
+                INSERT OR REPLACE INTO market_snapshots (
+                    symbol, name, price, movement, reason, sector, news, price_history, last_updated
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, '[]', ?)
+            """, (symbol, name, points[-1][1], round(rng.uniform(-3, 3), 2),
+                  "Synthetic benchmark data", sector, "No news in the benchmark dataset", now))
+
+        for user_index in range(users):
+            user_id = user_index + 1
+            tracked = rng.sample(list(SYMBOLS), min(assets, len(SYMBOLS)))
+            conn.executemany("""
+                INSERT INTO tracked_assets (
+                    id, symbol, name, price, movement, reason, sector, news, price_history, created_at, last_updated, user_id
+                ) VALUES (?, ?, ?, 0, 0, '', '', '', '[]', ?, ?, ?)
+            """, [(str(uuid.UUID(int=rng.getrandbits(128))), symbol, SYMBOLS[symbol][0], now, now, user_id) for symbol in tracked])
+
+            for conversation in range(conversations):
+                chat_id = conversation_id(user_index, conversation)
+                for turn in range(messages):
+                    role = "user" if turn % 2 == 0 else "assistant"
+                    content = rng.choice(QUESTIONS) if role == "user" else _answer(rng)
+                    conn.execute("""
+                        INSERT INTO messages (conversation_id, role, content, type, user_id)
+                        VALUES (?, ?, ?, 'chat', ?)
+                    """, (chat_id, role, content, user_id))
+                    record_message(conn, "chat", user_id, chat_id, role, content, "chat")
+
+            for symbol in tracked:
+                chat_id = conversation_id(user_index, symbol)
+                for turn in range(messages):
+                    role = "user" if turn % 2 == 0 else "assistant"
+                    content = rng.choice(QUESTIONS) if role == "user" else _answer(rng)
+                    conn.execute("""
+                        INSERT INTO asset_messages (conversation_id, symbol, role, content, user_id)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (chat_id, symbol, role, content, user_id))
+                    record_message(conn, "asset", user_id, chat_id, role, content, "asset", symbol)
+
+    total_messages = users * (conversations + min(assets, len(SYMBOLS))) * messages
+    logger.info(f"Seeded {db_file}: {users} users, {total_messages} messages, {len(SYMBOLS)} symbols")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a synthetic benchmark database")
+    parser.add_argument("--db", type=Path, default=Path(__file__).parent / "bench.db")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=20, help="chat conversations per user")
+    parser.add_argument("--messages", type=int, default=10, help="messages per conversation")
+    parser.add_argument("--assets", type=int, default=8, help="tracked assets per user")
+    parser.add_argument("--history-days", type=int, default=180)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    seed(args.db.resolve(), args.users, args.conversations, args.messages, args.assets, args.history_days, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Run the backend for benchmarks, with an event-loop lag probe.
+
+The app is served unchanged except for two extra routes used by benchmarks.run:
+POST /bench/loop-lag/reset starts (or restarts) sampling and GET /bench/loop-lag
+returns the lag percentiles since the last reset. Lag is how late a timer that should
+fire every interval fires, i.e. how long something blocked the event loop.
+
+    DATABASE_URL=sqlite:///benchmarks/bench.db PERPLEXITY_BASE_URL=http://127.0.0.1:8100 \\
+        python -m benchmarks.serve --port 8200
+"""
+from typing import List, Optional
+import argparse
+import asyncio
+import time
+from benchmarks.stats import summarize_ms
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(time.perf_counter() - started - self.interval, 0.0))
+
+    def reset(self) -> None:
+        self.samples = []
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def summary(self):
+        return {"samples": len(self.samples), **summarize_ms(self.samples)}
+
+
+def main():
+    import uvicorn
+    # Imported here so DATABASE_URL and PERPLEXITY_BASE_URL are read from this process's environment
+    from api.main import app
+
+    parser = argparse.ArgumentParser(description="Serve the backend with a loop lag probe")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--log-level", default="warning")
+    args = parser.parse_args()
+
+    monitor = LoopLagMonitor()
+
+    @app.post("/bench/loop-lag/reset")
+    async def reset_loop_lag():
+        monitor.reset()
+        return {"status": "sampling"}
+
+    @app.get("/bench/loop-lag")
+    async def loop_lag():
+        return monitor.summary()
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
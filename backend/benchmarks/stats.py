@@ -0,0 +1,25 @@
+from typing import Dict, Sequence
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Linearly interpolated percentile of values, fraction between 0 and 1; 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize_ms(seconds: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99/max/mean of durations given in seconds, in milliseconds."""
+    if not seconds:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0, "mean": 0.0}
+    return {
+        "p50": round(percentile(seconds, 0.50) * 1000, 2),
+        "p95": round(percentile(seconds, 0.95) * 1000, 2),
+        "p99": round(percentile(seconds, 0.99) * 1000, 2),
+        "max": round(max(seconds) * 1000, 2),
+        "mean": round(sum(seconds) / len(seconds) * 1000, 2),
+    }
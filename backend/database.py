@@ -1,38 +1,454 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
 import os
+import sqlite3
+import threading
+import time
 from dotenv import load_dotenv
+from services.price_store import dated_history
+from services.metrics import DB_CONNECTION_SECONDS, DB_STATEMENT_SECONDS, DB_WRITE_LOCK_WAIT_SECONDS, record_stage
 
 load_dotenv() # Load environment variables from .env file
 
-# Check if finsight.db exists, create if not
-db_path = "./finsight.db"
-if not os.path.exists(db_path):
-    # Create an empty database file
-    open(db_path, 'a').close()
+logger = logging.getLogger(__name__)
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that reports how long conn.execute/executemany take, by SQL verb."""
+
+    def _timed(self, method, sql, *args):
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            DB_STATEMENT_SECONDS.labels(operation=(sql.split(None, 1) or ["?"])[0].upper()).observe(time.perf_counter() - started)
+
+    def execute(self, sql, *args):
+        return self._timed(super().execute, sql, *args)
 
+    def executemany(self, sql, *args):
+        return self._timed(super().executemany, sql, *args)
+
+# Single configured database shared by the ORM and every service
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./finsight.db")
 
 engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} # Needed for SQLite
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": 30, "factory": TimedConnection}, # Needed for SQLite
+    pool_size=int(os.getenv("DB_POOL_SIZE", 10)),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 20)),
+    pool_timeout=30,
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Check if the database file exists, create if not
+db_path = engine.url.database
+if db_path and db_path != ":memory:" and not os.path.exists(db_path):
+    # Create an empty database file
+    open(db_path, 'a').close()
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """Enable WAL so readers never block on the single writer."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
+# SQLite allows one writer at a time; serialize writers in-process instead of spinning on SQLITE_BUSY
+_write_lock = threading.Lock()
+
+@contextmanager
+def _pooled_connection(mode: str):
+    started = time.perf_counter()
+    pooled = engine.raw_connection()
+    conn = pooled.driver_connection
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        # The ORM shares these connections and expects plain tuples
+        conn.row_factory = None
+        pooled.close()
+        elapsed = time.perf_counter() - started
+        DB_CONNECTION_SECONDS.labels(mode=mode).observe(elapsed)
+        record_stage("db", elapsed)
+
+@contextmanager
+def db_connection():
+    """
+    Check out a pooled sqlite3 connection for the current thread or task.
+
+    Rows are returned as sqlite3.Row. The connection goes back to the pool when the
+    block exits, and any uncommitted work is rolled back by the pool.
+    """
+    with _pooled_connection("read") as conn:
+        yield conn
+
+@contextmanager
+def db_transaction():
+    """
+    Check out a pooled connection for writing; everything in the block commits together.
+
+    Writers are serialized process-wide and the transaction is rolled back on error.
+    """
+    started = time.perf_counter()
+    with _write_lock:
+        waited = time.perf_counter() - started
+        DB_WRITE_LOCK_WAIT_SECONDS.observe(waited)
+        record_stage("db_lock", waited)
+        with _pooled_connection("write") as conn:
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+def _create_tables(conn):
+    """Create the tables used by the services through raw SQL."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            type TEXT NOT NULL,
+            citations TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tracked_assets (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            movement REAL NOT NULL,
+            reason TEXT NOT NULL,
+            sector TEXT NOT NULL,
+            news TEXT NOT NULL,
+            price_history TEXT NOT NULL,
+            risk_level TEXT,
+            volatility_score REAL,
+            sector_trend_score REAL,
+            dip_count_last_month INTEGER,
+            sentiment_class TEXT,
+            volatility_breakdown TEXT,
+            sector_breakdown TEXT,
+            sentiment_breakdown TEXT,
+            risk_confidence REAL,
+            risk_recommendation TEXT,
+            risk_analysis_updated_at DATETIME,
+            realized_volatility REAL,
+            max_drawdown REAL,
+            sector_beta REAL,
+            moving_average_short REAL,
+            moving_average_long REAL,
+            created_at DATETIME NOT NULL,
+            last_updated DATETIME NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS asset_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            user_id INTEGER
+        )
+    """)
+
+    # One summary row per conversation, kept up to date as messages are saved
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS conversations (
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            conversation_id TEXT NOT NULL,
+            symbol TEXT NOT NULL DEFAULT '',
+            type TEXT NOT NULL,
+            title TEXT,
+            created_at DATETIME NOT NULL,
+            updated_at DATETIME NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            summary TEXT,
+            summary_message_id INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (kind, user_id, conversation_id, symbol)
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS market_snapshots (
+            symbol TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            movement REAL NOT NULL,
+            reason TEXT NOT NULL,
+            sector TEXT NOT NULL,
+            news TEXT NOT NULL,
+            price_history TEXT NOT NULL,
+            last_updated DATETIME NOT NULL
+        )
+    """)
+
+    # Daily closes per symbol (services/price_store.py); the clustered key serves range scans
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS price_points (
+            symbol TEXT NOT NULL,
+            date TEXT NOT NULL,
+            close REAL NOT NULL,
+            PRIMARY KEY (symbol, date)
+        ) WITHOUT ROWID
+    """)
+
+    # Durable tier of the response cache (services/response_cache.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS response_cache (
+            cache_key TEXT PRIMARY KEY,
+            namespace TEXT NOT NULL,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            stored_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            evict_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )
+    """)
+
+    # Long-running requests run as background jobs (services/job_service.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            input_hash TEXT NOT NULL,
+            params TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            heartbeat REAL
+        )
+    """)
+
+def _add_missing_columns(conn):
+    """Add columns introduced after the tables were first created."""
+    columns = [
+        ("tracked_assets", "risk_level TEXT"),
+        ("tracked_assets", "volatility_score REAL"),
+        ("tracked_assets", "sector_trend_score REAL"),
+        ("tracked_assets", "dip_count_last_month INTEGER"),
+        ("tracked_assets", "sentiment_class TEXT"),
+        ("tracked_assets", "volatility_breakdown TEXT"),
+        ("tracked_assets", "sector_breakdown TEXT"),
+        ("tracked_assets", "sentiment_breakdown TEXT"),
+        ("tracked_assets", "risk_confidence REAL"),
+        ("tracked_assets", "risk_recommendation TEXT"),
+        ("tracked_assets", "risk_analysis_updated_at DATETIME"),
+        ("tracked_assets", "realized_volatility REAL"),
+        ("tracked_assets", "max_drawdown REAL"),
+        ("tracked_assets", "sector_beta REAL"),
+        ("tracked_assets", "moving_average_short REAL"),
+        ("tracked_assets", "moving_average_long REAL"),
+        ("messages", "citations TEXT"),
+        ("asset_messages", "user_id INTEGER"),
+        ("conversations", "summary TEXT"),
+        ("conversations", "summary_message_id INTEGER NOT NULL DEFAULT 0"),
+        ("jobs", "heartbeat REAL"),
+    ]
+    for table, column in columns:
+        try:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+
+def _create_indexes(conn):
+    """Create the secondary indexes backing the hot chat, asset chat and tracked asset queries."""
+    # Conversation history: conversation_id + type + user_id, ordered by timestamp
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_conversation
+        ON messages (conversation_id, user_id, type, timestamp)
+    """)
+    # Chat history listing: user_id grouped by conversation, first user message per conversation
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_user_conversation
+        ON messages (user_id, conversation_id, role, timestamp)
+    """)
+    # Asset chat history for one conversation
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_asset_messages_conversation
+        ON asset_messages (conversation_id, symbol, timestamp)
+    """)
+    # Asset chat listing by symbol
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_asset_messages_symbol
+        ON asset_messages (symbol, conversation_id, role, timestamp)
+    """)
+    # Tracked assets by symbol (and user), e.g. duplicate checks and risk analysis
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tracked_assets_symbol_user
+        ON tracked_assets (symbol, user_id)
+    """)
+    # History listing: a user's conversations of one kind (and symbol), newest first
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversations_listing
+        ON conversations (user_id, kind, symbol, created_at, conversation_id)
+    """)
+    # Response cache eviction: expired rows, then least recently used
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_evict ON response_cache (evict_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_accessed ON response_cache (accessed_at)")
+    # A user's tracked assets, newest first
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tracked_assets_user_created
+        ON tracked_assets (user_id, created_at)
+    """)
+    # Sector peers of an asset, for sector-relative risk metrics
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_market_snapshots_sector ON market_snapshots (sector)")
+    # Jobs: newest job with the same input, and unfinished or expired jobs by status
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_input
+        ON jobs (kind, input_hash, created_at)
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, finished_at)")
+
+def _seed_market_snapshots(conn):
+    """Carry over the newest per-user copy of each symbol that predates the shared snapshot store."""
+    conn.execute("""
+        INSERT OR IGNORE INTO market_snapshots (
+            symbol, name, price, movement, reason, sector, news, price_history, last_updated
+        )
+        SELECT symbol, name, price, movement, reason, sector, news, price_history, MAX(last_updated)
+        FROM tracked_assets
+        WHERE price_history IS NOT NULL AND price_history != '[]'
+        GROUP BY symbol
+    """)
+
+def _backfill_price_points(conn):
+    """Date the 6-point JSON price lists of existing snapshots into the price_points series, once."""
+    rows = conn.execute("""
+        SELECT symbol, price, price_history, last_updated FROM market_snapshots
+        WHERE price_history IS NOT NULL AND price_history != '[]'
+    """).fetchall()
+    points = []
+    for symbol, price, price_history, last_updated in rows:
+        try:
+            closes = json.loads(price_history)
+            as_of = datetime.fromisoformat(str(last_updated).replace('Z', '+00:00')).date()
+        except (ValueError, TypeError):
+            logger.warning(f"Skipping unreadable price history of {symbol} during migration")
+            continue
+        if not isinstance(closes, list) or not all(isinstance(close, (int, float)) for close in closes):
+            continue
+        points.extend((symbol, point_date, close) for point_date, close in dated_history(closes, price, as_of))
+    conn.executemany("INSERT OR IGNORE INTO price_points (symbol, date, close) VALUES (?, ?, ?)", points)
+    logger.info(f"Migrated {len(points)} price points from {len(rows)} market snapshots")
+
+def _backfill_conversations(conn):
+    """Build summary rows for conversations saved before the conversations table existed."""
+    conn.execute("""
+        INSERT OR IGNORE INTO conversations (
+            kind, user_id, conversation_id, symbol, type, title, created_at, updated_at, message_count
+        )
+        SELECT
+            'chat', m1.user_id, m1.conversation_id, '',
+            (
+                SELECT m2.type FROM messages m2
+                WHERE m2.conversation_id = m1.conversation_id AND m2.user_id = m1.user_id
+                ORDER BY m2.timestamp ASC, m2.id ASC LIMIT 1
+            ),
+            (
+                SELECT substr(m2.content, 1, 200) FROM messages m2
+                WHERE m2.conversation_id = m1.conversation_id AND m2.user_id = m1.user_id AND m2.role = 'user'
+                ORDER BY m2.timestamp ASC, m2.id ASC LIMIT 1
+            ),
+            MIN(m1.timestamp), MAX(m1.timestamp), COUNT(*)
+        FROM messages m1
+        GROUP BY m1.user_id, m1.conversation_id
+    """)
+    # Older asset chat messages have no owner; list them for every user tracking the symbol, as before
+    conn.execute("""
+        INSERT OR IGNORE INTO conversations (
+            kind, user_id, conversation_id, symbol, type, title, created_at, updated_at, message_count
+        )
+        SELECT
+            'asset', COALESCE(m1.user_id, t.user_id), m1.conversation_id, m1.symbol, 'asset',
+            (
+                SELECT substr(m2.content, 1, 200) FROM asset_messages m2
+                WHERE m2.conversation_id = m1.conversation_id AND m2.symbol = m1.symbol AND m2.role = 'user'
+                ORDER BY m2.timestamp ASC, m2.id ASC LIMIT 1
+            ),
+            MIN(m1.timestamp), MAX(m1.timestamp), COUNT(*)
+        FROM asset_messages m1
+        LEFT JOIN (SELECT DISTINCT user_id, symbol FROM tracked_assets) t
+            ON m1.user_id IS NULL AND t.symbol = m1.symbol
+        WHERE COALESCE(m1.user_id, t.user_id) IS NOT NULL
+        GROUP BY COALESCE(m1.user_id, t.user_id), m1.conversation_id, m1.symbol
+    """)
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def init_db():
+    """Create or migrate every raw SQL table once per process."""
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        logger.info(f"Initializing database schema at: {os.path.abspath(db_path) if db_path else DATABASE_URL}")
+        with db_transaction() as conn:
+            has_conversations = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations'"
+            ).fetchone() is not None
+            has_price_points = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'price_points'"
+            ).fetchone() is not None
+            _create_tables(conn)
+            _add_missing_columns(conn)
+            _create_indexes(conn)
+            _seed_market_snapshots(conn)
+            if not has_conversations:
+                _backfill_conversations(conn)
+            if not has_price_points:
+                _backfill_price_points(conn)
+        _schema_ready = True
+
+def reset_tables():
+    """Drop and recreate the chat and tracked asset tables."""
+    with db_transaction() as conn:
+        conn.execute("DROP TABLE IF EXISTS messages")
+        conn.execute("DROP TABLE IF EXISTS tracked_assets")
+        conn.execute("DELETE FROM conversations WHERE kind = 'chat'")
+        _create_tables(conn)
+        _create_indexes(conn)
+
 def create_db_and_tables():
     # Import all modules here that might define models so that
     # they will be registered properly on the metadata. Otherwise
     # you will have to import them first before calling init_db()
     from models.user import User # Make sure this import is correct
-    from models.chat import Message # Assuming Message is also a SQLAlchemy model
     Base.metadata.create_all(bind=engine)
+    init_db()
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
@@ -1,6 +1,6 @@
 # This file makes the 'models' directory a Python package.
 
 from .chat import Message, ChatRequest
-from .stock_recommendation import StockRecommendationResponse
+from .stock_recommendation import StockRecommendationResponse, PersonalizedStockRecommendationResponse
 
-__all__ = ['Message', 'ChatRequest', 'StockRecommendationResponse'] 
\ No newline at end of file
+__all__ = ['Message', 'ChatRequest', 'StockRecommendationResponse', 'PersonalizedStockRecommendationResponse'] 
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Optional
 
 class AssetCreate(BaseModel):
     symbol: str
@@ -16,4 +17,17 @@ class AssetResponse(BaseModel):
     sector: str
     news: str
     created_at: datetime
-    last_updated: datetime 
\ No newline at end of file
+    last_updated: datetime
+
+class AssetImportItem(BaseModel):
+    symbol: str
+    name: str
+    id: Optional[str] = None  # Tracked asset id, once the placeholder row exists
+    status: str  # "ready", "pending", "failed", or "exists" when the user already tracked it
+
+class AssetImportResponse(BaseModel):
+    job_id: Optional[str] = None  # Enrichment job, None when every asset was ready straight away
+    status: str  # Job status, or "succeeded" without a job
+    total: int
+    done: int
+    assets: List[AssetImportItem]
@@ -0,0 +1,12 @@
+from pydantic import BaseModel
+from typing import Any, Optional
+
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str  # "queued", "running", "succeeded" or "failed"
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import date
 
 class PricePoint(BaseModel):
@@ -11,12 +11,25 @@ class RiskFactors(BaseModel):
     sector_trend_score: float  # 0 to 1, raw metric for sector performance
     dip_count_last_month: int  # Raw count of price dips
     sentiment_class: str  # Concise classification: "Positive", "Neutral", "Negative", "Positive with caution", etc.
+    realized_volatility: Optional[float] = None  # Annualized volatility of daily log returns
+    max_drawdown: Optional[float] = None  # Largest peak-to-trough decline, as a fraction
+    sector_beta: Optional[float] = None  # Sensitivity to the sector's price series
+    moving_average_short: Optional[float] = None
+    moving_average_long: Optional[float] = None
 
 class RiskBreakdown(BaseModel):
     volatility: str  # Brief explanation of volatility patterns (max 2 sentences)
     sector: str  # Brief sector analysis (max 2 sentences)
     sentiment: str  # Brief sentiment analysis (max 2 sentences)
 
+class QualitativeRiskAssessment(BaseModel):
+    """The part of a risk analysis produced by the model; the numeric factors are computed locally."""
+    risk_level: str  # "Low", "Moderate", "High"
+    sentiment_class: str
+    risk_breakdown: RiskBreakdown
+    confidence: float  # 0 to 1
+    recommendation: str  # Max 2 sentences
+
 class RiskAnalysisResponse(BaseModel):
     asset_symbol: str
     asset_name: str
@@ -24,4 +37,8 @@ class RiskAnalysisResponse(BaseModel):
     factors: RiskFactors  # Raw metrics for quantitative analysis
     risk_breakdown: RiskBreakdown  # Brief qualitative explanations
     confidence: float  # 0 to 1, confidence in the analysis
-    recommendation: str  # Concise actionable insight (max 2 sentences) 
\ No newline at end of file
+    recommendation: str  # Concise actionable insight (max 2 sentences)
+
+class PortfolioRiskResponse(BaseModel):
+    analyses: List[RiskAnalysisResponse]  # One per tracked symbol, in the user's tracking order
+    errors: Dict[str, str] = {}  # Symbol -> reason, for symbols that could not be analyzed
@@ -9,4 +9,9 @@ class StockRecommendationResponse(BaseModel):
     sector: str
     risk_label: str
     risk_reasoning: str
-    recommendation_reason: Optional[str] = None 
\ No newline at end of file
+    recommendation_reason: Optional[str] = None 
+
+class PersonalizedStockRecommendationResponse(StockRecommendationResponse):
+    """The shared recommendation with per-user fields; StockRecommendationResponse stays the Sonar schema."""
+    # Whether the requesting user already tracks this stock
+    already_tracked: bool = False
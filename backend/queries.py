@@ -0,0 +1,207 @@
+"""
+Hot raw SQL shared by the services and the query plan check.
+
+Every query the chat, asset chat, tracker, news, risk and job paths run on each
+request is defined here once. The services execute these constants and
+query_plans runs EXPLAIN QUERY PLAN on the very same text, so the check cannot
+drift from the code. Queries over a variable number of symbols have a
+{placeholders} field, filled in with in_placeholders().
+"""
+
+def in_placeholders(count: int) -> str:
+    """Parameter markers for an IN (...) list of count values."""
+    return ", ".join("?" for _ in range(count))
+
+# --- Conversations ---
+
+CHAT_CONVERSATION_HISTORY = """
+    SELECT id, role, content
+    FROM messages
+    WHERE conversation_id = ? AND type = ? AND user_id = ? AND id > ?
+    ORDER BY timestamp ASC, id ASC
+"""
+
+CHAT_MESSAGES = """
+    SELECT id, role, content, timestamp, citations
+    FROM messages
+    WHERE conversation_id = ? AND user_id = ?
+    ORDER BY timestamp ASC, id ASC
+"""
+
+# Messages saved before asset chats had an owner have no user_id
+ASSET_CHAT_CONVERSATION_HISTORY = """
+    SELECT id, role, content
+    FROM asset_messages
+    WHERE conversation_id = ? AND symbol = ? AND (user_id = ? OR user_id IS NULL) AND id > ?
+    ORDER BY timestamp ASC, id ASC
+"""
+
+ASSET_CHAT_MESSAGES = """
+    SELECT id, role, content, timestamp
+    FROM asset_messages
+    WHERE conversation_id = ? AND symbol = ? AND (user_id = ? OR user_id IS NULL)
+    ORDER BY timestamp ASC, id ASC
+"""
+
+CONVERSATION_SUMMARY = """
+    SELECT summary, summary_message_id FROM conversations
+    WHERE kind = ? AND user_id = ? AND conversation_id = ? AND symbol = ?
+"""
+
+def conversation_page(exclude_type: bool, after_cursor: bool) -> str:
+    """
+    One page of a user's conversations, newest first.
+
+    Parameters: user_id, kind, symbol, then the excluded type and the cursor's
+    (created_at, conversation_id) if requested, then the row limit.
+    """
+    query = """
+        SELECT conversation_id, type, symbol, title, created_at
+        FROM conversations
+        WHERE user_id = ? AND kind = ? AND symbol = ?
+    """
+    if exclude_type:
+        query += " AND type != ?"
+    if after_cursor:
+        query += " AND (created_at, conversation_id) < (?, ?)"
+    return query + " ORDER BY created_at DESC, conversation_id DESC LIMIT ?"
+
+# --- Tracked assets ---
+
+TRACKED_ASSET_BY_SYMBOL = """
+    SELECT * FROM tracked_assets
+    WHERE symbol = ? AND user_id = ?
+"""
+
+TRACKED_ASSET_BY_ID = """
+    SELECT * FROM tracked_assets
+    WHERE id = ? AND user_id = ?
+"""
+
+TRACKED_ASSETS_FOR_USER = """
+    SELECT * FROM tracked_assets
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+"""
+
+TRACKED_ASSET_IDS_FOR_USER = """
+    SELECT id, symbol FROM tracked_assets
+    WHERE user_id = ?
+"""
+
+TRACKED_SYMBOLS_FOR_USER = """
+    SELECT symbol FROM tracked_assets
+    WHERE user_id = ?
+    ORDER BY created_at ASC
+"""
+
+OTHER_TRACKED_ASSETS = """
+    SELECT DISTINCT symbol, name FROM tracked_assets
+    WHERE user_id = ? AND symbol != ?
+    ORDER BY symbol ASC
+"""
+
+TRACKED_ASSETS_WITH_MARKET_DATA = """
+    SELECT t.symbol, t.name, s.price, s.movement
+    FROM tracked_assets t
+    LEFT JOIN market_snapshots s ON s.symbol = t.symbol
+    WHERE t.user_id = ?
+"""
+
+LATEST_RISK_ANALYSES = """
+    SELECT
+        symbol,
+        name,
+        risk_level,
+        volatility_score,
+        sector_trend_score,
+        dip_count_last_month,
+        sentiment_class,
+        volatility_breakdown,
+        sector_breakdown,
+        sentiment_breakdown,
+        risk_confidence,
+        risk_recommendation,
+        realized_volatility,
+        max_drawdown,
+        sector_beta,
+        moving_average_short,
+        moving_average_long,
+        risk_analysis_updated_at
+    FROM tracked_assets
+    WHERE symbol IN ({placeholders}) AND risk_level IS NOT NULL
+"""
+
+# --- Market data ---
+
+MARKET_SNAPSHOTS = """
+    SELECT * FROM market_snapshots WHERE symbol IN ({placeholders})
+"""
+
+# Most recently refreshed first, so a capped peer list keeps the symbols with current prices
+SECTOR_SYMBOLS = """
+    SELECT symbol FROM market_snapshots WHERE sector = ? AND symbol != ?
+    ORDER BY last_updated DESC LIMIT ?
+"""
+
+PRICE_SERIES_FOR_SYMBOLS = """
+    SELECT symbol, date, close FROM price_points
+    WHERE symbol IN ({placeholders}) AND date >= ? AND date <= ?
+    ORDER BY symbol ASC, date ASC
+"""
+
+RECENT_CLOSES = """
+    SELECT close FROM price_points
+    WHERE symbol = ? AND date < ?
+    ORDER BY date DESC LIMIT ?
+"""
+
+# --- Response cache ---
+
+RESPONSE_CACHE_ENTRY = """
+    SELECT value, stored_at, expires_at, evict_at FROM response_cache
+    WHERE cache_key = ? AND evict_at > ?
+"""
+
+# --- Jobs ---
+
+JOB_FOR_USER = """
+    SELECT * FROM jobs WHERE id = ? AND user_id = ?
+"""
+
+LATEST_JOB_FOR_INPUT = """
+    SELECT * FROM jobs
+    WHERE kind = ? AND input_hash = ?
+    ORDER BY created_at DESC LIMIT 1
+"""
+
+QUEUED_JOBS = """
+    SELECT id, kind FROM jobs
+    WHERE status = 'queued'
+    ORDER BY created_at ASC
+"""
+
+# A worker claims a queued job by moving it to running; the update only matches
+# while the job is still queued, so exactly one worker wins
+CLAIM_JOB = """
+    UPDATE jobs SET status = 'running', started_at = ?, heartbeat = ?
+    WHERE id = ? AND status = 'queued'
+"""
+
+RENEW_JOB_LEASE = """
+    UPDATE jobs SET heartbeat = ?
+    WHERE id = ? AND status = 'running'
+"""
+
+# Running jobs whose lease ran out lost their worker; jobs other workers are still
+# running keep renewing their lease and are left alone. Returns the requeued jobs.
+REQUEUE_STALE_JOBS = """
+    UPDATE jobs SET status = 'queued', started_at = NULL, heartbeat = NULL
+    WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)
+    RETURNING id, kind
+"""
+
+DELETE_EXPIRED_JOBS = """
+    DELETE FROM jobs
+    WHERE status IN ('succeeded', 'failed') AND finished_at < ?
+"""
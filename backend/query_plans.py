@@ -0,0 +1,105 @@
+"""
+Query plan checks for the hot raw SQL queries.
+
+Every query the chat, asset chat, tracker, news, risk and job paths run on each
+request is defined in the queries module and listed in HOT_QUERIES with sample
+parameters. check_query_plans() builds the schema (tables and indexes) in an
+empty in-memory database, runs EXPLAIN QUERY PLAN on each of them and reports any
+that fall back to a full table or index SCAN.
+
+tests/test_query_plans.py runs the check with the test suite; it can also be run
+on its own from the backend directory:
+
+    python -m query_plans
+
+The exit status is non-zero when at least one hot query scans.
+"""
+from typing import Dict, List, Tuple
+import sqlite3
+import sys
+from database import _create_tables, _add_missing_columns, _create_indexes
+import queries
+
+# name -> (sql, sample parameters); the SQL is the text the services execute
+HOT_QUERIES: Dict[str, Tuple[str, tuple]] = {
+    "chat.conversation_history": (queries.CHAT_CONVERSATION_HISTORY, ("conversation", "chat", 1, 0)),
+    "chat.conversation_summary": (queries.CONVERSATION_SUMMARY, ("chat", 1, "conversation", "")),
+    "chat.history_first_page": (queries.conversation_page(exclude_type=True, after_cursor=False), (1, "chat", "", "guide", 51)),
+    "chat.history": (
+        queries.conversation_page(exclude_type=True, after_cursor=True),
+        (1, "chat", "", "guide", "2024-01-01 00:00:00", "conversation", 51),
+    ),
+    "chat.messages": (queries.CHAT_MESSAGES, ("conversation", 1)),
+    "asset_chat.conversation_history": (queries.ASSET_CHAT_CONVERSATION_HISTORY, ("conversation", "AAPL", 1, 0)),
+    "asset_chat.history_first_page": (queries.conversation_page(exclude_type=False, after_cursor=False), (1, "asset", "AAPL", 51)),
+    "asset_chat.history": (
+        queries.conversation_page(exclude_type=False, after_cursor=True),
+        (1, "asset", "AAPL", "2024-01-01 00:00:00", "conversation", 51),
+    ),
+    "asset_chat.messages": (queries.ASSET_CHAT_MESSAGES, ("conversation", "AAPL", 1)),
+    "asset_chat.other_assets": (queries.OTHER_TRACKED_ASSETS, (1, "AAPL")),
+    "tracker.asset_for_user": (queries.TRACKED_ASSET_BY_SYMBOL, ("AAPL", 1)),
+    "tracker.assets_for_user": (queries.TRACKED_ASSETS_FOR_USER, (1,)),
+    "tracker.asset_by_id": (queries.TRACKED_ASSET_BY_ID, ("asset", 1)),
+    "risk.latest_analyses": (
+        queries.LATEST_RISK_ANALYSES.format(placeholders=queries.in_placeholders(2)), ("AAPL", "MSFT")
+    ),
+    "risk.portfolio_symbols": (queries.TRACKED_SYMBOLS_FOR_USER, (1,)),
+    "assets.import_existing": (queries.TRACKED_ASSET_IDS_FOR_USER, (1,)),
+    "news.tracked_assets": (queries.TRACKED_ASSETS_WITH_MARKET_DATA, (1,)),
+    "market_data.snapshot": (queries.MARKET_SNAPSHOTS.format(placeholders=queries.in_placeholders(2)), ("AAPL", "MSFT")),
+    "market_data.sector_peers": (queries.SECTOR_SYMBOLS, ("Technology", "AAPL", 10)),
+    "prices.series_for_symbols": (
+        queries.PRICE_SERIES_FOR_SYMBOLS.format(placeholders=queries.in_placeholders(2)),
+        ("AAPL", "MSFT", "2024-01-01", "2024-06-30"),
+    ),
+    "prices.recent_closes": (queries.RECENT_CLOSES, ("AAPL", "2024-06-30", 6)),
+    "response_cache.entry": (queries.RESPONSE_CACHE_ENTRY, ("key", 0)),
+    "jobs.for_user": (queries.JOB_FOR_USER, ("job", "1")),
+    "jobs.latest_for_input": (queries.LATEST_JOB_FOR_INPUT, ("news", "hash")),
+    "jobs.queued": (queries.QUEUED_JOBS, ()),
+    "jobs.claim": (queries.CLAIM_JOB, (0, 0, "job")),
+    "jobs.renew_lease": (queries.RENEW_JOB_LEASE, (0, "job")),
+    "jobs.requeue_stale": (queries.REQUEUE_STALE_JOBS, (0,)),
+    "jobs.expired": (queries.DELETE_EXPIRED_JOBS, (0,)),
+}
+
+def _build_schema() -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    _create_tables(conn)
+    _add_missing_columns(conn)
+    _create_indexes(conn)
+    return conn
+
+def explain(conn: sqlite3.Connection, sql: str, params: tuple) -> List[str]:
+    """Return the detail column of EXPLAIN QUERY PLAN for a query."""
+    cursor = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    return [row[3] for row in cursor.fetchall()]
+
+def check_query_plans() -> Dict[str, List[str]]:
+    """
+    Run EXPLAIN QUERY PLAN on every hot query against a freshly built schema.
+
+    Returns:
+        Dict[str, List[str]]: Query name -> plan steps that scan, for each failing query
+    """
+    conn = _build_schema()
+    try:
+        failures = {}
+        for name, (sql, params) in HOT_QUERIES.items():
+            scans = [step for step in explain(conn, sql, params) if step.startswith("SCAN")]
+            if scans:
+                failures[name] = scans
+        return failures
+    finally:
+        conn.close()
+
+def main() -> int:
+    failures = check_query_plans()
+    for name, scans in failures.items():
+        print(f"FAIL {name}: {'; '.join(scans)}")
+    print(f"{len(HOT_QUERIES) - len(failures)} of {len(HOT_QUERIES)} hot queries use an index")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
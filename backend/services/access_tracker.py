@@ -0,0 +1,39 @@
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Hashable, List, Tuple
+import threading
+
+
+class AccessTracker:
+    """
+    Remembers when cached items were last requested, per kind of item.
+
+    The cache warmer uses this to decide what is worth refreshing ahead of expiry
+    and in which order. Each kind keeps at most max_entries keys, dropping the
+    least recently accessed ones first.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._accesses: Dict[str, "OrderedDict[Hashable, datetime]"] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, key: Hashable) -> None:
+        """Record that key of the given kind was just requested."""
+        with self._lock:
+            entries = self._accesses.setdefault(kind, OrderedDict())
+            entries[key] = datetime.now(timezone.utc)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def recent(self, kind: str, window: timedelta) -> List[Tuple[Hashable, datetime]]:
+        """Return keys of the given kind accessed within window, most recent first."""
+        cutoff = datetime.now(timezone.utc) - window
+        with self._lock:
+            entries = list(self._accesses.get(kind, {}).items())
+        return [(key, accessed_at) for key, accessed_at in reversed(entries) if accessed_at >= cutoff]
+
+
+# Shared by all services so the cache warmer sees every access in the process
+access_tracker = AccessTracker()
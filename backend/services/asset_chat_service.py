@@ -1,6 +1,4 @@
-from openai import AsyncOpenAI
-import os
-from typing import Dict, Any, Union, List
+from typing import AsyncIterator, Dict, Any, Optional, Tuple, Union, List
 from fastapi import HTTPException
 import sqlite3
 import json
@@ -9,6 +7,13 @@ import pathlib
 import yaml
 import logging
 import asyncio
+from services.market_data_service import MarketDataService
+from database import db_connection, db_transaction, init_db
+from queries import ASSET_CHAT_CONVERSATION_HISTORY, ASSET_CHAT_MESSAGES, OTHER_TRACKED_ASSETS
+from services.context_window import ContextWindow
+from services.conversation_cache import ConversationCache
+from services.conversation_store import INTERRUPTED_NOTE, list_conversations, load_summary, record_message, save_summary
+from services.llm_gateway import llm_gateway
 
 # Configure logging
 logging.basicConfig(
@@ -20,15 +25,8 @@ logger = logging.getLogger(__name__)
 class AssetChatService:
     def __init__(self):
         logger.info("Initializing AssetChatService")
-        try:
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("PERPLEXITY_API_KEY"),
-                base_url="https://api.perplexity.ai",
-            )
-            logger.info("AsyncOpenAI client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize AsyncOpenAI client: {str(e)}")
-            raise
+        # Upstream calls share the gateway's connection pool, concurrency budget and retries
+        self.client = llm_gateway.client("asset_chat")
 
         self.model = "sonar-pro"
         logger.info(f"Using model: {self.model}")
@@ -50,134 +48,118 @@ class AssetChatService:
         # Initialize database
         self._init_db()
 
+        # Asset details come from the shared per-symbol market snapshots
+        self.market_data = MarketDataService()
+
+        # Keeps the history sent upstream within a token budget
+        self.context_window = ContextWindow(self.client)
+
+        # Active conversations, keyed by (user_id, conversation_id, symbol)
+        self.conversation_cache = ConversationCache()
+
     def _init_db(self):
-        """Initialize SQLite database and create necessary tables."""
-        db_path = os.path.expanduser("~/perplexity_hack.db")
-        logger.info(f"AssetChatService is connecting to database at: {db_path}")
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS asset_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                conversation_id TEXT NOT NULL,
-                symbol TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        self.conn.execute(""" 
-            CREATE TABLE IF NOT EXISTS tracked_assets (
-                id TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL, -- Assuming assets are tied to users
-                symbol TEXT NOT NULL UNIQUE, -- Added UNIQUE constraint based on typical usage
-                name TEXT NOT NULL,
-                price REAL,
-                movement REAL,
-                reason TEXT,
-                sector TEXT,
-                news TEXT, -- Storing as JSON string
-                price_history TEXT, -- Storing as JSON string
-                created_at DATETIME,
-                last_updated DATETIME,
-                FOREIGN KEY (user_id) REFERENCES users (id) -- If you have a users table
-            )
-        """)
-        self.conn.commit()
+        """Make sure the shared database schema exists."""
+        init_db()
 
     async def clear_database(self):
         """Clear all data from the asset_messages table."""
         loop = asyncio.get_event_loop()
         try:
             def db_clear():
-                self.conn.execute("DROP TABLE IF EXISTS asset_messages")
-                self.conn.execute(""" 
-                    CREATE TABLE IF NOT EXISTS asset_messages (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        conversation_id TEXT NOT NULL,
-                        symbol TEXT NOT NULL,
-                        role TEXT NOT NULL,
-                        content TEXT NOT NULL,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                self.conn.commit()
+                with db_transaction() as conn:
+                    conn.execute("DELETE FROM asset_messages")
+                    conn.execute("DELETE FROM conversations WHERE kind = 'asset'")
                 return True
             
             success = await loop.run_in_executor(None, db_clear)
+            self.conversation_cache.invalidate()
             logger.info("Successfully cleared asset_messages table.")
             return success
         except Exception as e:
             logger.error(f"Error clearing asset_messages database: {str(e)}")
             return False
 
-    async def _get_conversation_history(self, conversation_id: str, symbol: str) -> List[Dict[str, str]]:
-        """Retrieve conversation history from database."""
+    async def _get_conversation_history(self, conversation_id: str, symbol: str, user_id: int) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """
+        Retrieve the conversation history that fits the context budget.
+
+        Active conversations are served from the conversation cache. Otherwise only messages
+        after the rolling summary checkpoint are read. Returns the summary of the older turns
+        and the recent messages to send verbatim.
+        """
         loop = asyncio.get_event_loop()
-        def db_query():
-            cursor = self.conn.execute(
-                """
-                SELECT role, content 
-                FROM asset_messages 
-                WHERE conversation_id = ? AND symbol = ?
-                ORDER BY timestamp ASC
-                """,
-                (conversation_id, symbol)
-            )
-            return [{"role": row["role"], "content": row["content"]} for row in cursor.fetchall()]
-        
-        history = await loop.run_in_executor(None, db_query)
-        return history
+        cache_key = (user_id, conversation_id, symbol)
+        cached = self.conversation_cache.get(cache_key)
+        if cached is not None:
+            summary, rows = cached
+        else:
+            def db_query():
+                with db_connection() as conn:
+                    summary, checkpoint = load_summary(conn, "asset", user_id, conversation_id, symbol)
+                    cursor = conn.execute(
+                        ASSET_CHAT_CONVERSATION_HISTORY,
+                        (conversation_id, symbol, user_id, checkpoint)
+                    )
+                    return summary, [dict(row) for row in cursor.fetchall()]
+            
+            summary, rows = await loop.run_in_executor(None, db_query)
+
+        summary, history, checkpoint = await self.context_window.compact(summary, rows, ("asset", user_id, conversation_id, symbol))
+        if checkpoint is not None:
+            def db_update():
+                with db_transaction() as conn:
+                    save_summary(conn, "asset", user_id, conversation_id, summary, checkpoint, symbol)
+            await loop.run_in_executor(None, db_update)
+            rows = [row for row in rows if row["id"] > checkpoint]
+        self.conversation_cache.put(cache_key, summary, rows)
+        return summary, [{"role": row["role"], "content": row["content"]} for row in history]
 
-    async def _save_message(self, conversation_id: str, symbol: str, role: str, content: str):
-        """Save a message to the database."""
+    async def _save_messages(self, conversation_id: str, symbol: str, user_id: int, messages: List[Dict[str, str]]):
+        """Save the messages of one turn to the database in a single transaction, updating the conversation cache."""
         loop = asyncio.get_event_loop()
         def db_insert():
-            self.conn.execute(
-                """
-                INSERT INTO asset_messages (conversation_id, symbol, role, content)
-                VALUES (?, ?, ?, ?)
-                """,
-                (conversation_id, symbol, role, content)
-            )
-            self.conn.commit()
+            saved = []
+            with db_transaction() as conn:
+                for message in messages:
+                    cursor = conn.execute(
+                        """
+                        INSERT INTO asset_messages (conversation_id, symbol, role, content, user_id)
+                        VALUES (?, ?, ?, ?, ?)
+                        """,
+                        (conversation_id, symbol, message["role"], message["content"], user_id)
+                    )
+                    record_message(conn, "asset", user_id, conversation_id, message["role"], message["content"], "asset", symbol)
+                    saved.append({"id": cursor.lastrowid, "role": message["role"], "content": message["content"]})
+            return saved
         
-        await loop.run_in_executor(None, db_insert)
+        saved = await loop.run_in_executor(None, db_insert)
+        self.conversation_cache.append((user_id, conversation_id, symbol), saved)
 
     async def _get_asset_details(self, symbol: str) -> Dict[str, Any]:
-        """Retrieve details for a specific asset from the tracked_assets table."""
+        """Retrieve details for a specific asset from the shared market snapshot store."""
         loop = asyncio.get_event_loop()
         def db_query():
             try:
-                cursor = self.conn.execute(
-                    "SELECT * FROM tracked_assets WHERE symbol = ?",
-                    (symbol,)
-                )
-                row = cursor.fetchone()
-                if row:
-                    return dict(row)
-                logger.warning(f"Asset details not found for symbol: {symbol} in tracked_assets table.")
+                snapshot = self.market_data.load_snapshot(symbol)
+                if snapshot:
+                    return snapshot
+                logger.warning(f"Asset details not found for symbol: {symbol} in market_snapshots table.")
                 return {} 
             except sqlite3.Error as e:
-                if "no such table" in str(e).lower() and "tracked_assets" in str(e).lower():
-                    logger.error(f"The 'tracked_assets' table does not exist. Error: {str(e)}")
-                else:
-                    logger.error(f"Error fetching asset details for {symbol}: {str(e)}")
+                logger.error(f"Error fetching asset details for {symbol}: {str(e)}")
                 return {}
         
         details = await loop.run_in_executor(None, db_query)
         return details
 
-    async def _get_other_asset_symbols(self, current_symbol: str) -> List[Dict[str, Any]]:
-        """Retrieve symbols of other tracked assets, excluding the current one."""
+    async def _get_other_asset_symbols(self, current_symbol: str, user_id: int) -> List[Dict[str, Any]]:
+        """Retrieve symbols of the user's other tracked assets, excluding the current one."""
         loop = asyncio.get_event_loop()
         def db_query():
             try:
-                cursor = self.conn.execute(
-                    "SELECT * FROM tracked_assets WHERE symbol != ? ORDER BY symbol ASC",
-                    (current_symbol,)
-                )
-                return [dict(row) for row in cursor.fetchall()]
+                with db_connection() as conn:
+                    cursor = conn.execute(OTHER_TRACKED_ASSETS, (user_id, current_symbol))
+                    return [dict(row) for row in cursor.fetchall()]
             except sqlite3.Error as e:
                 if "no such table" in str(e).lower() and "tracked_assets" in str(e).lower():
                     logger.error(f"The 'tracked_assets' table does not exist. Error: {str(e)}")
@@ -188,9 +170,9 @@ class AssetChatService:
         symbols = await loop.run_in_executor(None, db_query)
         return symbols
 
-    async def _create_messages(self, user_content: str, symbol: str, conversation_id: str) -> list:
+    async def _create_messages(self, user_content: str, symbol: str, conversation_id: str, user_id: int) -> list:
         asset_details = await self._get_asset_details(symbol)
-        other_assets = await self._get_other_asset_symbols(symbol)
+        other_assets = await self._get_other_asset_symbols(symbol, user_id)
         
         context_parts = []
         if asset_details:
@@ -217,8 +199,8 @@ class AssetChatService:
             final_system_content = base_system_content
         
         current_system_message = {"role": "system", "content": final_system_content}
-        messages = [current_system_message]
-        history = await self._get_conversation_history(conversation_id, symbol)
+        summary, history = await self._get_conversation_history(conversation_id, symbol, user_id)
+        messages = [self.context_window.with_summary(current_system_message, summary)]
         messages.extend(history)
         messages.append({"role": "user", "content": user_content})
         return messages
@@ -230,94 +212,142 @@ class AssetChatService:
                 model=self.model, messages=messages
             )
             return {"type": "completion", "data": response}
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Completion error: {str(e)}")
 
-    async def _update_conversation_history(self, conversation_id: str, symbol: str, messages: List[Dict[str, str]], response: Dict[str, Any]):
-        await self._save_message(conversation_id, symbol, "user", messages[-1]["content"])
+    async def _handle_streaming_response(self, messages: list) -> Dict[str, Any]:
+        """Handle streaming response from the API."""
+        try:
+            response_stream = await self.client.chat.completions.create(
+                model=self.model, messages=messages, stream=True
+            )
+            return {"type": "stream", "data": response_stream}
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Streaming error: {str(e)}")
+
+    async def _stream_events(
+        self, response_stream, messages: list, conversation_id: str, symbol: str, user_id: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Forward tokens as they arrive and persist the turn once the stream ends.
+
+        If the client disconnects or the upstream fails mid-stream, the question and the
+        partial answer are still saved.
+        """
+        parts = []
+        finished = False
+        try:
+            async for chunk in response_stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield {"event": "token", "data": {"content": chunk.choices[0].delta.content}}
+            finished = True
+        finally:
+            # Frees the upstream connection and concurrency slot if the client went away mid-stream
+            await response_stream.close()
+            answer = "".join(parts) if finished else "".join(parts + ["\n\n", INTERRUPTED_NOTE]).lstrip()
+            # Shielded so a cancelled request still saves its turn
+            await asyncio.shield(asyncio.ensure_future(self._save_messages(conversation_id, symbol, user_id, [
+                {"role": "user", "content": messages[-1]["content"]},
+                {"role": "assistant", "content": answer},
+            ])))
+            if finished:
+                logger.info(f"Stream finished and saved for symbol {symbol}, convo ID {conversation_id}")
+            else:
+                logger.warning(f"Stream interrupted, partial answer saved for symbol {symbol}, convo ID {conversation_id}")
+
+        yield {"event": "done", "data": {"conversation_id": conversation_id, "symbol": symbol}}
+
+    async def stream_chat_request(
+        self, user_content: str, symbol: str, conversation_id: str, user_id: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Start a streamed asset chat completion.
+
+        The upstream request is made before returning, so errors up to the first token
+        still surface as HTTP errors. The messages are saved when the stream ends, completed or not.
+
+        Returns:
+            AsyncIterator[Dict[str, Any]]: "token" and "done" events
+        """
+        messages = await self._create_messages(user_content, symbol, conversation_id, user_id)
+        logger.info(f"Messages prepared for streamed AssetChat for symbol {symbol}, convo ID {conversation_id}")
+        result = await self._handle_streaming_response(messages)
+        return self._stream_events(result["data"], messages, conversation_id, symbol, user_id)
+
+    async def _update_conversation_history(self, conversation_id: str, symbol: str, messages: List[Dict[str, str]], response: Dict[str, Any], user_id: int):
+        turn = [{"role": "user", "content": messages[-1]["content"]}]
         
         if response["type"] == "completion":
             assistant_content = response["data"].choices[0].message.content
-            await self._save_message(conversation_id, symbol, "assistant", assistant_content)
+            turn.append({"role": "assistant", "content": assistant_content})
+        await self._save_messages(conversation_id, symbol, user_id, turn)
 
     async def process_chat_request(
-        self, user_content: str, symbol: str, conversation_id: str
+        self, user_content: str, symbol: str, conversation_id: str, user_id: int
     ) -> Dict[str, Any]:
         try:
-            messages = await self._create_messages(user_content, symbol, conversation_id)
+            messages = await self._create_messages(user_content, symbol, conversation_id, user_id)
             logger.info(f"Messages prepared for AssetChat for symbol {symbol}, convo ID {conversation_id}")
             result = await self._handle_completion_response(messages)
-            await self._update_conversation_history(conversation_id, symbol, messages, result)
+            await self._update_conversation_history(conversation_id, symbol, messages, result, user_id)
             logger.info(f"Successfully processed AssetChat request for symbol {symbol}, convo ID {conversation_id}")
             return result
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error processing asset chat request for {symbol}, convo ID {conversation_id}: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    async def get_chat_history(self, symbol: str, user_id: int) -> List[Dict[str, Any]]:
-        """Get chat history summaries for a specific asset, associated with a user."""
+    async def get_chat_history(self, symbol: str, user_id: int, limit: int = 50, cursor: str = None) -> Dict[str, Any]:
+        """
+        Get one page of chat history summaries for a specific asset, associated with a user.
+
+        Returns:
+            Dict[str, Any]: "history" with the conversations and "next_cursor" for the following page
+        """
         loop = asyncio.get_event_loop()
         def db_query():
-            cursor = self.conn.execute("""
-                SELECT 
-                    conversation_id,
-                    MIN(timestamp) as first_message_time,
-                    (
-                        SELECT content 
-                        FROM asset_messages m2 
-                        WHERE m2.conversation_id = m1.conversation_id 
-                        AND m2.symbol = ? 
-                        AND m2.role = 'user'
-                        ORDER BY m2.timestamp ASC 
-                        LIMIT 1
-                    ) as first_message
-                FROM asset_messages m1
-                WHERE m1.symbol = ? 
-                GROUP BY conversation_id
-                ORDER BY first_message_time DESC
-            """, (symbol, symbol))
+            with db_connection() as conn:
+                rows, next_cursor = list_conversations(conn, "asset", user_id, limit, cursor, symbol=symbol)
             
             history_data = []
-            for row in cursor.fetchall():
+            for row in rows:
+                title = row["title"] or ""
                 history_data.append({
                     "id": row["conversation_id"],
-                    "title": row["first_message"][:50] + ("..." if len(row["first_message"]) > 50 else ""),
-                    "timestamp": row["first_message_time"],
+                    "title": title[:50] + ("..." if len(title) > 50 else ""),
+                    "timestamp": row["created_at"],
                     "symbol": symbol
                 })
-            return history_data
+            return {"history": history_data, "next_cursor": next_cursor}
         
-        history = await loop.run_in_executor(None, db_query)
-        logger.info(f"Retrieved {len(history)} conversation histories for asset: {symbol}")
-        return history
+        page = await loop.run_in_executor(None, db_query)
+        logger.info(f"Retrieved {len(page['history'])} conversation histories for asset: {symbol}")
+        return page
 
     async def get_chat_messages(self, conversation_id: str, symbol: str, user_id: int) -> List[Dict[str, Any]]:
         """Get all messages for a specific asset chat conversation."""
         loop = asyncio.get_event_loop()
         def db_query():
-            cursor = self.conn.execute("""
-                SELECT id, role, content, timestamp
-                FROM asset_messages
-                WHERE conversation_id = ? AND symbol = ?
-                ORDER BY timestamp ASC
-            """, (conversation_id, symbol))
+            with db_connection() as conn:
+                cursor = conn.execute(ASSET_CHAT_MESSAGES, (conversation_id, symbol, user_id))
             
-            messages_data = []
-            for row in cursor.fetchall():
-                messages_data.append({
-                    "id": row["id"],
-                    "text": row["content"],
-                    "sender": "user" if row["role"] == "user" else "bot",
-                    "timestamp": row["timestamp"],
-                    "symbol": symbol
-                })
-            return messages_data
+                messages_data = []
+                for row in cursor.fetchall():
+                    messages_data.append({
+                        "id": row["id"],
+                        "text": row["content"],
+                        "sender": "user" if row["role"] == "user" else "bot",
+                        "timestamp": row["timestamp"],
+                        "symbol": symbol
+                    })
+                return messages_data
 
         messages = await loop.run_in_executor(None, db_query)
         logger.info(f"Retrieved {len(messages)} messages for asset {symbol}, conversation {conversation_id}")
         return messages
-
-    def __del__(self):
-        if hasattr(self, 'conn') and self.conn:
-            self.conn.close()
-            logger.info("AssetChatService database connection closed.") 
\ No newline at end of file
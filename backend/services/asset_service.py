@@ -1,23 +1,15 @@
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 import uuid
 from fastapi import HTTPException
 from models.asset import AssetCreate, AssetResponse
 from typing import List, Dict, Any, Optional
+from pathlib import Path
 import logging
-from openai import OpenAI
-import os
+import asyncio
 import yaml
-from pathlib import Path
-import json
-from pydantic import BaseModel
-
-class AssetData(BaseModel):
-    price: float
-    movement: float
-    reason: str
-    sector: str
-    news: str
-    price_history: list[float]
+from services.market_data_service import MarketDataService
+from database import db_connection, db_transaction, init_db
+from queries import TRACKED_ASSET_BY_ID, TRACKED_ASSET_BY_SYMBOL, TRACKED_ASSET_IDS_FOR_USER, TRACKED_ASSETS_FOR_USER
 
 
 # Configure loggingw
@@ -28,244 +20,119 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class AssetService:
-    def __init__(self, db_connection):
+    def __init__(self):
         logger.info("Initializing AssetService")
-        self.conn = db_connection
-        
-        # Initialize OpenAI client for Sonar API
-        try:
-            self.client = OpenAI(
-                api_key=os.getenv("PERPLEXITY_API_KEY"),
-                base_url="https://api.perplexity.ai",
-            )
-            self.model = "sonar-pro"
-            logger.info("OpenAI client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {str(e)}")
-            raise
+        init_db()
+        # Market data is shared per symbol across all users tracking it
+        self.market_data = MarketDataService()
 
-        # Load prompts from YAML
+        # Load import settings from YAML
         try:
             config_path = Path(__file__).parent.parent / "config" / "asset_tracking.yaml"
             with open(config_path, 'r') as file:
-                prompts = yaml.safe_load(file)
-                self.system_message = {
-                    "role": "system",
-                    "content": prompts['asset_tracking']['system_prompt']
-                }
-                self.user_prompt_template = prompts['asset_tracking']['user_prompt_template']
-            logger.info("Successfully loaded prompts from YAML")
+                import_settings = yaml.safe_load(file)['asset_tracking'].get('import', {})
+                self.import_max_assets = int(import_settings.get('max_assets', 200))
         except Exception as e:
-            logger.error(f"Failed to load prompts from YAML: {str(e)}")
+            logger.error(f"Failed to load import settings from YAML: {str(e)}")
             raise
 
-    def _get_cached_asset_details(self, symbol: str, user_id: int) -> Optional[Dict[str, Any]]:
-        """Get cached asset details from the database if they exist and are less than 1 day old."""
-        logger.debug(f"Checking cache for asset {symbol} for user {user_id}")
-        try:
-            cursor = self.conn.execute("""
-                SELECT * FROM tracked_assets 
-                WHERE symbol = ? AND user_id = ?
-                ORDER BY last_updated DESC
-                LIMIT 1
-            """, (symbol, user_id))
-            
-            row = cursor.fetchone()
-            if not row:
-                logger.debug(f"Cache MISS: No cached data found for asset {symbol} for user {user_id}")
-                return None
-            
-            # Check if the data is less than 1 day old
-            last_updated = datetime.fromisoformat(row["last_updated"].replace('Z', '+00:00')).replace(tzinfo=timezone.utc)
-            now = datetime.now(timezone.utc)
-            age_hours = (now - last_updated).total_seconds() / 3600
-            
-            if (now - last_updated) < timedelta(days=1):
-                logger.info(f"Cache HIT: Using cached asset details for {symbol} (age: {age_hours:.1f} hours)")
-                return {
-                    "id": row["id"],
-                    "symbol": row["symbol"],
-                    "name": row["name"],
-                    "price": row["price"],
-                    "movement": row["movement"],
-                    "reason": row["reason"],
-                    "sector": row["sector"],
-                    "news": row["news"],
-                    "price_history": json.loads(row["price_history"]) if row["price_history"] else [],
-                    "created_at": row["created_at"],
-                    "last_updated": row["last_updated"]
-                }
-            else:
-                logger.info(f"Cache MISS: Cached asset details for {symbol} are stale (age: {age_hours:.1f} hours), will refresh")
-                return None
-                
-        except Exception as e:
-            logger.error(f"Error getting cached asset details for {symbol}: {str(e)}")
-            return None
-
-    def _update_asset_details(self, asset_id: str, asset_details: Dict[str, Any]) -> None:
-        """Update existing asset with fresh details from API."""
-        try:
-            price_history = asset_details["price_history"]
-            if not isinstance(price_history, list) or len(price_history) != 6:
-                logger.warning(f"Invalid price history format from API. Expected 6 prices, got {len(price_history) if isinstance(price_history, list) else 'non-list'}")
-                # Get current price from existing data if price_history is invalid
-                cursor = self.conn.execute("SELECT price FROM tracked_assets WHERE id = ?", (asset_id,))
-                row = cursor.fetchone()
-                current_price = row["price"] if row else asset_details["price"]
-                price_history = [current_price] * 6
-            
-            self.conn.execute("""
-                UPDATE tracked_assets 
-                SET price = ?, movement = ?, reason = ?, sector = ?, news = ?, 
-                    price_history = ?, last_updated = ?
-                WHERE id = ?
-            """, (
-                asset_details["price"],
-                asset_details["movement"],
-                asset_details["reason"],
-                asset_details["sector"],
-                asset_details["news"],
-                json.dumps(price_history),
-                datetime.now(timezone.utc),
-                asset_id
-            ))
-            self.conn.commit()
-            logger.info(f"Successfully updated asset details for asset ID: {asset_id}")
-            
-        except Exception as e:
-            logger.error(f"Error updating asset details for asset ID {asset_id}: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to update asset details: {str(e)}")
-
-    def _fetch_asset_details(self, symbol: str, name: str) -> Dict[str, Any]:
-        """Fetch asset details from Sonar API."""
-        logger.info(f"Fetching details for asset: {symbol} ({name})")
-        try:
-            messages = [
-                self.system_message,
-                {
-                    "role": "user",
-                    "content": self.user_prompt_template.format(symbol=symbol, name=name)
-                }
-            ]
-
-            response = self.client.chat.completions.create(
-                extra_body={
-                        "search_domain_filter": [
-                            "tradingview.com",
-                        ]
-                    },
-                model=self.model,
-                messages=messages,
-                response_format={
-                    "type": "json_schema",
-                    "json_schema": {"schema": AssetData.model_json_schema()}
-                }
-            )
-
-            content = response.choices[0].message.content
-
-            try:
-                asset_details = json.loads(content)
-                logger.info("Response is valid JSON")
-            except json.JSONDecodeError as e:
-                logger.error(f"Invalid JSON response: {str(e)}")
-                logger.error(f"Raw response content: {content}")
-                raise HTTPException(status_code=500, detail="Invalid JSON response from Sonar API when fetching asset details")
-            
-            return asset_details
-        
-        except Exception as e:
-            logger.error(f"Error fetching asset details: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to fetch asset details: {str(e)}")
+    def _build_asset_response(self, row, snapshot: Dict[str, Any] | None) -> Dict[str, Any]:
+        """Combine a user's tracked_assets row with the shared market snapshot for its symbol."""
+        if snapshot is None:
+            # No shared data could be obtained; fall back to whatever the row itself holds
+            logger.warning(f"No market snapshot available for asset {row['symbol']}, using tracked row data")
+            return {
+                "id": row["id"],
+                "symbol": row["symbol"],
+                "name": row["name"],
+                "price": row["price"],
+                "movement": row["movement"],
+                "reason": row["reason"],
+                "sector": row["sector"],
+                "news": row["news"],
+                "price_history": [],
+                "created_at": row["created_at"],
+                "last_updated": row["last_updated"]
+            }
+        return {
+            "id": row["id"],
+            "symbol": row["symbol"],
+            "name": row["name"],
+            "price": snapshot["price"],
+            "movement": snapshot["movement"],
+            "reason": snapshot["reason"],
+            "sector": snapshot["sector"],
+            "news": snapshot["news"],
+            "price_history": snapshot["price_history"],
+            "created_at": row["created_at"],
+            "last_updated": snapshot["last_updated"]
+        }
 
-    def create_asset(self, asset: AssetCreate, user_id: int) -> AssetResponse:
+    async def create_asset(self, asset: AssetCreate, user_id: int) -> AssetResponse:
         """Create a new tracked asset for a specific user."""
         logger.info(f"Creating new asset with symbol: {asset.symbol} for user_ID: {user_id}")
+        loop = asyncio.get_event_loop()
         try:
             # First check if we already have this asset for this user
-            cached_asset = self._get_cached_asset_details(asset.symbol, user_id)
-            
-            if cached_asset:
-                logger.info(f"Cache HIT: Asset {asset.symbol} already exists for user {user_id} with recent data (last updated: {cached_asset['last_updated']})")
-                raise HTTPException(status_code=400, detail=f"Asset {asset.symbol} is already being tracked")
-            
-            # Check if asset exists but data is old
-            cursor = self.conn.execute("""
-                SELECT id, last_updated FROM tracked_assets 
-                WHERE symbol = ? AND user_id = ?
-            """, (asset.symbol, user_id))
-            existing_row = cursor.fetchone()
-            
+            def db_query():
+                with db_connection() as conn:
+                    cursor = conn.execute(TRACKED_ASSET_BY_SYMBOL, (asset.symbol, user_id))
+                    return cursor.fetchone()
+
+            existing_row = await loop.run_in_executor(None, db_query)
+
             if existing_row:
-                # Asset exists but data is old, update it
-                logger.info(f"Cache MISS: Asset {asset.symbol} exists but data is stale (last updated: {existing_row['last_updated']}), refreshing with fresh data")
-                fresh_data = self._fetch_asset_details(asset.symbol, asset.name)
-                self._update_asset_details(existing_row["id"], fresh_data)
-                
-                # Return updated asset
-                updated_cursor = self.conn.execute("""
-                    SELECT * FROM tracked_assets WHERE id = ?
-                """, (existing_row["id"],))
-                updated_row = updated_cursor.fetchone()
-                
+                cached_snapshot = await loop.run_in_executor(None, self.market_data.load_snapshot, asset.symbol)
+                if cached_snapshot and self.market_data.is_fresh(cached_snapshot):
+                    logger.info(f"Cache HIT: Asset {asset.symbol} already exists for user {user_id} with recent data (last updated: {cached_snapshot['last_updated']})")
+                    raise HTTPException(status_code=400, detail=f"Asset {asset.symbol} is already being tracked")
+
+                # Asset exists but data is old, refresh the shared snapshot
+                logger.info(f"Cache MISS: Asset {asset.symbol} exists but data is stale, refreshing with fresh data")
+                snapshot = await self.market_data.get_snapshot(asset.symbol, asset.name)
                 logger.info(f"Successfully refreshed cached asset {asset.symbol} for user {user_id}")
-                return {
-                    "id": updated_row["id"],
-                    "symbol": updated_row["symbol"],
-                    "name": updated_row["name"],
-                    "price": updated_row["price"],
-                    "movement": updated_row["movement"],
-                    "reason": updated_row["reason"],
-                    "sector": updated_row["sector"],
-                    "news": updated_row["news"],
-                    "price_history": json.loads(updated_row["price_history"]),
-                    "created_at": updated_row["created_at"],
-                    "last_updated": updated_row["last_updated"]
-                }
-            
-            # Create new asset
-            logger.info(f"Cache MISS: Asset {asset.symbol} not found in cache, creating new asset")
+                return self._build_asset_response(existing_row, snapshot)
+
+            # Reuse the shared snapshot when another user already keeps it fresh
+            snapshot = await self.market_data.get_snapshot(asset.symbol, asset.name)
+
             asset_id = str(uuid.uuid4())
             logger.debug(f"Generated asset ID: {asset_id}")
-            
-            initial_data = self._fetch_asset_details(asset.symbol, asset.name)
-            
-            price_history = initial_data["price_history"]
-            if not isinstance(price_history, list) or len(price_history) != 6:
-                logger.warning(f"Invalid price history format from API. Expected 6 prices, got {len(price_history) if isinstance(price_history, list) else 'non-list'}")
-                price_history = [initial_data["price"]] * 6
-            
+            now = datetime.now(timezone.utc)
+
+            def db_insert():
+                with db_transaction() as conn:
+                    # Market columns are kept only for schema compatibility; market data lives in market_snapshots
+                    conn.execute("""
+                        INSERT INTO tracked_assets (
+                            id, symbol, name, price, movement, reason, sector, news, price_history, created_at, last_updated, user_id
+                        ) VALUES (?, ?, ?, 0, 0, '', '', '', '[]', ?, ?, ?)
+                    """, (
+                        asset_id,
+                        asset.symbol,
+                        asset.name,
+                        now,
+                        now,
+                        user_id
+                    ))
+
             logger.debug("Storing asset in database")
-            cursor = self.conn.execute("""
-                INSERT INTO tracked_assets (
-                    id, symbol, name, price, movement, reason, sector, news, price_history, created_at, last_updated, user_id
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                asset_id,
-                asset.symbol,
-                asset.name,
-                initial_data["price"],
-                initial_data["movement"],
-                initial_data["reason"],
-                initial_data["sector"],
-                initial_data["news"],
-                json.dumps(price_history),
-                datetime.now(timezone.utc),
-                datetime.now(timezone.utc),
-                user_id
-            ))
-            self.conn.commit()
+            await loop.run_in_executor(None, db_insert)
             logger.info(f"Successfully created new asset with ID: {asset_id} for user_ID: {user_id}")
-            
+
             # Return the created asset
             return {
                 "id": asset_id,
                 "symbol": asset.symbol,
                 "name": asset.name,
-                **initial_data,
-                "created_at": datetime.now(timezone.utc),
-                "last_updated": datetime.now(timezone.utc)
+                "price": snapshot["price"],
+                "movement": snapshot["movement"],
+                "reason": snapshot["reason"],
+                "sector": snapshot["sector"],
+                "news": snapshot["news"],
+                "price_history": snapshot["price_history"],
+                "created_at": now,
+                "last_updated": snapshot["last_updated"]
             }
         except HTTPException:
             raise
@@ -273,128 +140,215 @@ class AssetService:
             logger.error(f"Error creating asset for user_ID {user_id}: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    def get_assets(self, user_id: int) -> List[AssetResponse]:
-        """Get all tracked assets for a specific user, refreshing stale data."""
+    async def import_assets(self, assets: List[AssetCreate], user_id: int) -> List[Dict[str, Any]]:
+        """
+        Start tracking many assets at once, without waiting for their market data.
+
+        A placeholder row is inserted for every symbol the user does not track yet, all in
+        one transaction. Symbols whose shared snapshot is already fresh are ready straight
+        away; the rest are pending until enrich_assets has fetched them.
+
+        Args:
+            assets (List[AssetCreate]): Assets to import; repeated symbols are imported once
+            user_id (int): The importing user
+
+        Returns:
+            List[Dict[str, Any]]: One item per symbol with symbol, name, id and status
+        """
+        unique: Dict[str, str] = {}
+        for asset in assets:
+            symbol = asset.symbol.strip()
+            if symbol and symbol not in unique:
+                unique[symbol] = asset.name.strip() or symbol
+        if not unique:
+            raise HTTPException(status_code=400, detail="No assets to import")
+        if len(unique) > self.import_max_assets:
+            raise HTTPException(status_code=400, detail=f"At most {self.import_max_assets} assets can be imported at once")
+
+        logger.info(f"Importing {len(unique)} assets for user_ID: {user_id}")
+        loop = asyncio.get_event_loop()
+        try:
+            now = datetime.now(timezone.utc)
+
+            def db_insert():
+                with db_transaction() as conn:
+                    cursor = conn.execute(TRACKED_ASSET_IDS_FOR_USER, (user_id,))
+                    existing = {row["symbol"]: row["id"] for row in cursor.fetchall()}
+                    new_ids = {symbol: str(uuid.uuid4()) for symbol in unique if symbol not in existing}
+                    # Market columns are kept only for schema compatibility; market data lives in market_snapshots
+                    conn.executemany("""
+                        INSERT INTO tracked_assets (
+                            id, symbol, name, price, movement, reason, sector, news, price_history, created_at, last_updated, user_id
+                        ) VALUES (?, ?, ?, 0, 0, '', '', '', '[]', ?, ?, ?)
+                    """, [(asset_id, symbol, unique[symbol], now, now, user_id) for symbol, asset_id in new_ids.items()])
+                    return existing, new_ids
+
+            existing, new_ids = await loop.run_in_executor(None, db_insert)
+            snapshots = await loop.run_in_executor(None, self.market_data.load_snapshots, list(new_ids.keys()))
+        except Exception as e:
+            logger.error(f"Error importing assets for user_ID {user_id}: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+        items = []
+        for symbol, name in unique.items():
+            if symbol in existing:
+                items.append({"symbol": symbol, "name": name, "id": existing[symbol], "status": "exists"})
+                continue
+            snapshot = snapshots.get(symbol)
+            # Another user already keeps this symbol fresh, so there is nothing to fetch
+            status = "ready" if snapshot is not None and self.market_data.is_fresh(snapshot) else "pending"
+            items.append({"symbol": symbol, "name": name, "id": new_ids[symbol], "status": status})
+
+        logger.info(
+            f"Inserted {len(new_ids)} placeholder assets for user_ID: {user_id} "
+            f"({sum(item['status'] == 'pending' for item in items)} pending, {len(existing.keys() & unique.keys())} already tracked)"
+        )
+        return items
+
+    async def enrich_assets(self, assets: Dict[str, str]) -> Dict[str, List[str]]:
+        """
+        Fetch market data for imported assets.
+
+        Symbols are split into chunks of the market data batch size, which run concurrently
+        (at most refresh max_concurrency at a time) and are each stored as soon as they
+        complete, so import progress advances chunk by chunk.
+
+        Args:
+            assets (Dict[str, str]): Asset names keyed by symbol
+
+        Returns:
+            Dict[str, List[str]]: The symbols that are "ready" and those that "failed"
+        """
+        symbols = list(assets.keys())
+        chunk_size = self.market_data.batch_size
+        chunks = [symbols[i:i + chunk_size] for i in range(0, len(symbols), chunk_size)]
+        semaphore = asyncio.Semaphore(self.market_data.refresh_max_concurrency)
+
+        async def enrich_chunk(chunk: List[str]) -> Dict[str, Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return await self.market_data.get_snapshots({symbol: assets[symbol] for symbol in chunk})
+                except Exception as e:
+                    logger.error(f"Failed to enrich imported assets {', '.join(chunk)}: {str(e)}")
+                    return {}
+
+        snapshots: Dict[str, Dict[str, Any]] = {}
+        for chunk_snapshots in await asyncio.gather(*(enrich_chunk(chunk) for chunk in chunks)):
+            snapshots.update(chunk_snapshots)
+
+        ready = [symbol for symbol in symbols if symbol in snapshots]
+        failed = [symbol for symbol in symbols if symbol not in snapshots]
+        logger.info(f"Enriched {len(ready)} of {len(symbols)} imported assets")
+        return {"ready": ready, "failed": failed}
+
+    async def import_progress(self, items: List[Dict[str, Any]], job: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Current per-symbol status of an import.
+
+        Pending symbols become ready once their shared snapshot is fresh, and failed if the
+        enrichment job finished without one.
+
+        Args:
+            items (List[Dict[str, Any]]): Items as returned by import_assets
+            job (Optional[Dict[str, Any]]): The enrichment job, None if nothing had to be fetched
+
+        Returns:
+            Dict[str, Any]: job_id, status, total, done and assets
+        """
+        pending = [item["symbol"] for item in items if item["status"] == "pending"]
+        job_status = job["status"] if job is not None else "succeeded"
+
+        loop = asyncio.get_event_loop()
+        snapshots = await loop.run_in_executor(None, self.market_data.load_snapshots, pending) if pending else {}
+
+        assets = []
+        for item in items:
+            status = item["status"]
+            if status == "pending":
+                snapshot = snapshots.get(item["symbol"])
+                if snapshot is not None and self.market_data.is_fresh(snapshot):
+                    status = "ready"
+                elif job_status in ("succeeded", "failed"):
+                    status = "failed"
+            assets.append({**item, "status": status})
+
+        return {
+            "job_id": job["job_id"] if job is not None else None,
+            "status": job_status,
+            "total": len(assets),
+            "done": sum(asset["status"] != "pending" for asset in assets),
+            "assets": assets,
+        }
+
+    async def get_assets(self, user_id: int) -> List[AssetResponse]:
+        """Get all tracked assets for a specific user, refreshing stale shared snapshots concurrently."""
         logger.info(f"Fetching all tracked assets for user_ID: {user_id}")
+        loop = asyncio.get_event_loop()
         try:
-            cursor = self.conn.execute("""
-                SELECT * FROM tracked_assets
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-            """, (user_id,))
-            
-            assets = []
-            cache_hits = 0
-            cache_misses = 0
-            
-            for row in cursor.fetchall():
-                # Check if data is stale (older than 1 day)
-                last_updated = datetime.fromisoformat(row["last_updated"].replace('Z', '+00:00')).replace(tzinfo=timezone.utc)
-                now = datetime.now(timezone.utc)
-                
-                if (now - last_updated) >= timedelta(days=1):
-                    cache_misses += 1
-                    logger.info(f"Cache MISS: Asset {row['symbol']} data is stale (last updated: {last_updated}), refreshing from API")
-                    try:
-                        fresh_data = self._fetch_asset_details(row["symbol"], row["name"])
-                        self._update_asset_details(row["id"], fresh_data)
-                        
-                        # Get updated row
-                        updated_cursor = self.conn.execute("""
-                            SELECT * FROM tracked_assets WHERE id = ?
-                        """, (row["id"],))
-                        row = updated_cursor.fetchone()
-                        logger.info(f"Successfully refreshed asset {row['symbol']} from API")
-                    except Exception as e:
-                        logger.error(f"Failed to refresh data for asset {row['symbol']}: {str(e)}")
-                        logger.warning(f"Continuing with stale data for asset {row['symbol']}")
-                        # Continue with stale data if refresh fails
-                else:
-                    cache_hits += 1
-                    logger.debug(f"Cache HIT: Asset {row['symbol']} data is fresh (last updated: {last_updated})")
-                
-                assets.append({
-                    "id": row["id"],
-                    "symbol": row["symbol"],
-                    "name": row["name"],
-                    "price": row["price"],
-                    "movement": row["movement"],
-                    "reason": row["reason"],
-                    "sector": row["sector"],
-                    "news": row["news"],
-                    "price_history": json.loads(row["price_history"]),
-                    "created_at": row["created_at"],
-                    "last_updated": row["last_updated"]
-                })
-            
-            logger.info(f"Successfully retrieved {len(assets)} assets for user_ID: {user_id} (Cache hits: {cache_hits}, Cache misses: {cache_misses})")
+            def db_query():
+                with db_connection() as conn:
+                    cursor = conn.execute(TRACKED_ASSETS_FOR_USER, (user_id,))
+                    return cursor.fetchall()
+
+            rows = await loop.run_in_executor(None, db_query)
+            snapshots = await self.market_data.get_snapshots({row["symbol"]: row["name"] for row in rows})
+
+            assets = [self._build_asset_response(row, snapshots.get(row["symbol"])) for row in rows]
+            logger.info(f"Successfully retrieved {len(assets)} assets for user_ID: {user_id}")
             return assets
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error fetching assets for user_ID {user_id}: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    def refresh_asset_details(self, asset_id: str, user_id: int) -> AssetResponse:
+    async def refresh_asset_details(self, asset_id: str, user_id: int) -> AssetResponse:
         """Manually refresh asset details for a specific asset."""
         logger.info(f"Manually refreshing asset details for asset ID: {asset_id}")
+        loop = asyncio.get_event_loop()
         try:
             # Get current asset
-            cursor = self.conn.execute("""
-                SELECT * FROM tracked_assets 
-                WHERE id = ? AND user_id = ?
-            """, (asset_id, user_id))
-            
-            row = cursor.fetchone()
+            def db_query():
+                with db_connection() as conn:
+                    cursor = conn.execute(TRACKED_ASSET_BY_ID, (asset_id, user_id))
+                    return cursor.fetchone()
+
+            row = await loop.run_in_executor(None, db_query)
             if not row:
                 raise HTTPException(status_code=404, detail="Asset not found or not owned by user")
-            
-            # Fetch fresh data
-            fresh_data = self._fetch_asset_details(row["symbol"], row["name"])
-            self._update_asset_details(asset_id, fresh_data)
-            
-            # Return updated asset
-            updated_cursor = self.conn.execute("""
-                SELECT * FROM tracked_assets WHERE id = ?
-            """, (asset_id,))
-            updated_row = updated_cursor.fetchone()
-            
-            return {
-                "id": updated_row["id"],
-                "symbol": updated_row["symbol"],
-                "name": updated_row["name"],
-                "price": updated_row["price"],
-                "movement": updated_row["movement"],
-                "reason": updated_row["reason"],
-                "sector": updated_row["sector"],
-                "news": updated_row["news"],
-                "price_history": json.loads(updated_row["price_history"]),
-                "created_at": updated_row["created_at"],
-                "last_updated": updated_row["last_updated"]
-            }
-            
+
+            # Fetch fresh data for the shared snapshot
+            snapshot = await self.market_data.get_snapshot(row["symbol"], row["name"], force_refresh=True)
+            return self._build_asset_response(row, snapshot)
+
         except HTTPException:
             raise
         except Exception as e:
             logger.error(f"Error refreshing asset details for asset ID {asset_id}: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    def delete_asset(self, asset_id: str, user_id: int) -> dict:
+    async def delete_asset(self, asset_id: str, user_id: int) -> dict:
         """Delete a tracked asset for a specific user."""
         logger.info(f"Deleting asset with ID: {asset_id} for user_ID: {user_id}")
         try:
-            cursor = self.conn.execute("""
-                DELETE FROM tracked_assets
-                WHERE id = ? AND user_id = ?
-            """, (asset_id, user_id))
-            self.conn.commit()
-            
-            if cursor.rowcount == 0:
+            def db_delete():
+                with db_transaction() as conn:
+                    return conn.execute("""
+                        DELETE FROM tracked_assets
+                        WHERE id = ? AND user_id = ?
+                    """, (asset_id, user_id)).rowcount
+
+            loop = asyncio.get_event_loop()
+            deleted = await loop.run_in_executor(None, db_delete)
+
+            if deleted == 0:
                 logger.warning(f"Asset not found with ID: {asset_id} for user_ID: {user_id} or user does not own asset")
                 raise HTTPException(status_code=404, detail="Asset not found or not owned by user")
-            
+
             logger.info(f"Successfully deleted asset with ID: {asset_id} for user_ID: {user_id}")
             return {"message": "Asset deleted successfully"}
         except HTTPException as e:
             raise e
         except Exception as e:
             logger.error(f"Error deleting asset for user_ID {user_id}: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
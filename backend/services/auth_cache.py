@@ -0,0 +1,64 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+from pydantic import BaseModel, ConfigDict
+import threading
+import time
+
+
+class Principal(BaseModel):
+    """The authenticated user as request handlers see it; immutable, so one instance can be shared."""
+    model_config = ConfigDict(frozen=True)
+
+    id: int
+    email: str
+    is_active: bool
+
+
+class PrincipalCache:
+    """
+    Short-lived cache of authenticated principals, keyed by token jti (or subject for older tokens).
+
+    An authenticated request then costs a signature check and a dictionary lookup instead
+    of a database query. Entries expire after ttl_seconds, or earlier when the token does,
+    and are dropped as soon as the user is updated or deleted in this process. Other
+    processes see such changes within ttl_seconds.
+    """
+
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> (user id, principal, expires at)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, Principal, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Principal]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, principal: Principal, token_expires_in: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if token_expires_in is None else min(self.ttl_seconds, token_expires_in)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (principal.id, principal, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: Any) -> None:
+        """Drop every cached token of a user, e.g. after deactivation."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
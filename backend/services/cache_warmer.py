@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, List, Tuple
+from pathlib import Path
+import asyncio
+import logging
+import yaml
+from services.access_tracker import access_tracker
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class CacheWarmer:
+    """
+    Background loop that refreshes cached data shortly before it goes stale.
+
+    Only entries requested within the recency window are considered, and the most
+    recently requested ones are refreshed first under a fixed concurrency budget,
+    so foreground requests almost always hit warm data.
+    """
+
+    def __init__(self, market_data_service, risk_analysis_service, news_service, stock_recommendation_service):
+        logger.info("Initializing CacheWarmer")
+        self.market_data_service = market_data_service
+        self.risk_analysis_service = risk_analysis_service
+        self.news_service = news_service
+        self.stock_recommendation_service = stock_recommendation_service
+        self._task: asyncio.Task | None = None
+
+        # Load settings from YAML
+        try:
+            config_path = Path(__file__).parent.parent / "config" / "cache_warmer.yaml"
+            with open(config_path, "r") as file:
+                settings = yaml.safe_load(file)["cache_warmer"]
+                self.enabled = bool(settings.get("enabled", True))
+                self.interval_seconds = float(settings.get("interval_seconds", 300))
+                self.lead_time = timedelta(minutes=float(settings.get("lead_minutes", 60)))
+                self.recency_window = timedelta(hours=float(settings.get("recency_window_hours", 48)))
+                self.max_concurrency = int(settings.get("max_concurrency", 2))
+                self.max_items_per_cycle = int(settings.get("max_items_per_cycle", 50))
+                self.warm_assets = bool(settings.get("warm_assets", True))
+                self.warm_risk = bool(settings.get("warm_risk", True))
+                self.warm_news = bool(settings.get("warm_news", True))
+                self.warm_stock_recommendations = bool(settings.get("warm_stock_recommendations", True))
+            logger.info("Successfully loaded cache warmer settings from YAML")
+        except Exception as e:
+            logger.error(f"Failed to load cache warmer settings from YAML: {str(e)}")
+            raise
+
+    def start(self):
+        """Start the background loop on the running event loop."""
+        if not self.enabled:
+            logger.info("CacheWarmer is disabled, not starting")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"CacheWarmer started (interval: {self.interval_seconds}s, concurrency: {self.max_concurrency})")
+
+    async def stop(self):
+        """Cancel the background loop and wait for it to finish."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            logger.info("CacheWarmer stopped")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"CacheWarmer cycle failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def _collect_work(self) -> List[Tuple[datetime, str, Callable[[], Awaitable[Any]]]]:
+        """Find recently accessed entries that expire within the lead time."""
+        work = []
+
+        if self.warm_assets:
+            recent = access_tracker.recent("market_data", self.recency_window)
+            accessed_at = dict(recent)
+            expiring = await self.market_data_service.expiring_symbols([symbol for symbol, _ in recent], self.lead_time)
+            for symbol, name in expiring.items():
+                work.append((
+                    accessed_at[symbol],
+                    f"market data for {symbol}",
+                    lambda symbol=symbol, name=name: self.market_data_service.refresh_symbols({symbol: name})
+                ))
+
+        if self.warm_risk:
+            for symbol, accessed_at in access_tracker.recent("risk_analysis", self.recency_window):
+                if await self.risk_analysis_service.needs_refresh(symbol, self.lead_time):
+                    work.append((
+                        accessed_at,
+                        f"risk analysis for {symbol}",
+                        lambda symbol=symbol: self.risk_analysis_service.refresh_asset_risk(symbol)
+                    ))
+
+        if self.warm_news:
+            for (user_id, topics, model), accessed_at in access_tracker.recent("news", self.recency_window):
+                if await self.news_service.needs_refresh(user_id, topics, model, self.lead_time):
+                    work.append((
+                        accessed_at,
+                        f"news for user {user_id}",
+                        lambda user_id=user_id, topics=topics, model=model: self.news_service.refresh_news(user_id, topics, model)
+                    ))
+
+        if self.warm_stock_recommendations:
+            for model, accessed_at in access_tracker.recent("stock_recommendation", self.recency_window):
+                if await self.stock_recommendation_service.needs_refresh(model, self.lead_time):
+                    work.append((
+                        accessed_at,
+                        f"shared stock recommendation ({model})",
+                        lambda model=model: self.stock_recommendation_service.refresh_recommendation(model, self.lead_time)
+                    ))
+
+        # Most recently accessed first
+        work.sort(key=lambda item: item[0], reverse=True)
+        return work[:self.max_items_per_cycle]
+
+    async def run_once(self) -> int:
+        """
+        Run a single warming cycle.
+
+        Returns:
+            int: Number of entries refreshed successfully
+        """
+        work = await self._collect_work()
+        if not work:
+            logger.debug("CacheWarmer found nothing to refresh")
+            return 0
+
+        logger.info(f"CacheWarmer refreshing {len(work)} entries")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def refresh(description: str, func: Callable[[], Awaitable[Any]]) -> bool:
+            async with semaphore:
+                try:
+                    await func()
+                    logger.info(f"CacheWarmer refreshed {description}")
+                    return True
+                except Exception as e:
+                    logger.warning(f"CacheWarmer failed to refresh {description}: {str(e)}")
+                    return False
+
+        results = await asyncio.gather(*(refresh(description, func) for _, description, func in work))
+        refreshed = sum(results)
+        logger.info(f"CacheWarmer cycle done ({refreshed} of {len(work)} entries refreshed)")
+        return refreshed
@@ -1,16 +1,19 @@
-from openai import AsyncOpenAI
-import os
-from typing import Dict, Any, Union, List
+from typing import AsyncIterator, Dict, Any, Optional, Tuple, Union, List
 from fastapi import HTTPException
 from collections import defaultdict
-import sqlite3
 import json
 from datetime import datetime
-import pprint
 import pathlib
 import yaml
 import logging
 import asyncio
+from database import db_connection, db_transaction, init_db, reset_tables
+from queries import CHAT_CONVERSATION_HISTORY
+from services.context_window import ContextWindow
+from services.conversation_cache import ConversationCache
+from services.conversation_store import INTERRUPTED_NOTE, load_summary, record_message, save_summary
+from services.llm_gateway import llm_gateway
+from services.structured_logging import bind_log_context, log_payload
 
 # Configure logging
 logging.basicConfig(
@@ -22,15 +25,8 @@ logger = logging.getLogger(__name__)
 class ChatService:
     def __init__(self):
         logger.info("Initializing ChatService")
-        try:
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("PERPLEXITY_API_KEY"),
-                base_url="https://api.perplexity.ai",
-            )
-            logger.info("AsyncOpenAI client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize AsyncOpenAI client: {str(e)}")
-            raise
+        # Upstream calls share the gateway's connection pool, concurrency budget and retries
+        self.client = llm_gateway.client("chat")
 
         self.model = "sonar-pro"
         logger.info(f"Using model: {self.model}")
@@ -61,123 +57,15 @@ class ChatService:
         # Initialize database
         self._init_db()
 
-    def _init_db(self):
-        """Initialize SQLite database and create necessary tables."""
-        db_path = "finsight.db"
-        logger.info(f"ChatService is connecting to database at: {os.path.abspath(db_path)}")
-
-        # Connect to database
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        
-        # Create messages table if it doesn't exist
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                conversation_id TEXT NOT NULL,
-                user_id INTEGER NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                type TEXT NOT NULL,
-                citations TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-
-        # Create tracked_assets table if it doesn't exist
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS tracked_assets (
-                id TEXT PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                symbol TEXT NOT NULL,
-                name TEXT NOT NULL,
-                price REAL NOT NULL,
-                movement REAL NOT NULL,
-                reason TEXT NOT NULL,
-                sector TEXT NOT NULL,
-                news TEXT NOT NULL,
-                price_history TEXT NOT NULL,
-                risk_level TEXT,
-                volatility_score REAL,
-                sector_trend_score REAL,
-                dip_count_last_month INTEGER,
-                sentiment_class TEXT,
-                volatility_breakdown TEXT,
-                sector_breakdown TEXT,
-                sentiment_breakdown TEXT,
-                risk_confidence REAL,
-                risk_recommendation TEXT,
-                risk_analysis_updated_at DATETIME,
-                created_at DATETIME NOT NULL,
-                last_updated DATETIME NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        print("tracked_assets table created with risk analysis columns")
-        # Add risk analysis columns if they don't exist
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN risk_level TEXT")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN volatility_score REAL")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN sector_trend_score REAL")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN dip_count_last_month INTEGER")
-        except sqlite3.OperationalError:
-            pass
+        # Keeps the history sent upstream within a token budget
+        self.context_window = ContextWindow(self.client)
 
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN sentiment_class TEXT")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN volatility_breakdown TEXT")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN sector_breakdown TEXT")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN sentiment_breakdown TEXT")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN risk_confidence REAL")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN risk_recommendation TEXT")
-        except sqlite3.OperationalError:
-            pass
-
-        try:
-            self.conn.execute("ALTER TABLE tracked_assets ADD COLUMN risk_analysis_updated_at DATETIME")
-        except sqlite3.OperationalError:
-            pass
-
-        # Add citations column if it doesn't exist
-        try:
-            self.conn.execute("ALTER TABLE messages ADD COLUMN citations TEXT")
-        except sqlite3.OperationalError:
-            pass  # Column already exists
+        # Active conversations, keyed by (user_id, conversation_id, type)
+        self.conversation_cache = ConversationCache()
 
-        self.conn.commit()
+    def _init_db(self):
+        """Make sure the shared database schema exists."""
+        init_db()
 
     async def clear_database(self, user_id: Union[int, None] = None):
         """Clear data from the database. If user_id is provided, clears only for that user."""
@@ -186,116 +74,103 @@ class ChatService:
             def db_clear():
                 if user_id is not None:
                     logger.info(f"Clearing database for user_id: {user_id}")
-                    self.conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
-                    self.conn.execute("DELETE FROM tracked_assets WHERE user_id = ?", (user_id,))
+                    with db_transaction() as conn:
+                        conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+                        conn.execute("DELETE FROM conversations WHERE kind = 'chat' AND user_id = ?", (user_id,))
+                        conn.execute("DELETE FROM tracked_assets WHERE user_id = ?", (user_id,))
                 else:
                     # This is the old behavior, clears everything. 
                     # Consider restricting this to admin users in the future.
                     logger.warning("Clearing all data from messages and tracked_assets tables (no user_id provided).")
-                    self.conn.execute("DROP TABLE IF EXISTS messages")
-                    self.conn.execute("DROP TABLE IF EXISTS tracked_assets")
-                    
-                    # recreate the tables with user_id
-                    self.conn.execute("""
-                        CREATE TABLE IF NOT EXISTS messages (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            conversation_id TEXT NOT NULL,
-                            user_id INTEGER NOT NULL,
-                            role TEXT NOT NULL,
-                            content TEXT NOT NULL,
-                            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                            type TEXT NOT NULL,
-                            citations TEXT,
-                            FOREIGN KEY (user_id) REFERENCES users (id)
-                        )
-                    """)
-
-                    self.conn.execute("""
-                        CREATE TABLE IF NOT EXISTS tracked_assets (
-                            id TEXT PRIMARY KEY,
-                            user_id INTEGER NOT NULL,
-                            symbol TEXT NOT NULL,
-                            name TEXT NOT NULL,
-                            price REAL NOT NULL,
-                            movement REAL NOT NULL,
-                            reason TEXT NOT NULL,
-                            sector TEXT NOT NULL,
-                            news TEXT NOT NULL,
-                            price_history TEXT NOT NULL,
-                            created_at DATETIME NOT NULL,
-                            last_updated DATETIME NOT NULL,
-                            risk_level TEXT,
-                            volatility_score REAL,
-                            sector_trend_score REAL,
-                            dip_count_last_month INTEGER,
-                            sentiment_class TEXT,
-                            volatility_breakdown TEXT,
-                            sector_breakdown TEXT,
-                            sentiment_breakdown TEXT,
-                            risk_confidence REAL,
-                            risk_recommendation TEXT,
-                            risk_analysis_updated_at DATETIME,
-                            FOREIGN KEY (user_id) REFERENCES users (id)
-                        )
-                    """)
-                
-                self.conn.commit()
+                    reset_tables()
                 return True
             
             success = await loop.run_in_executor(None, db_clear)
+            if user_id is not None:
+                self.conversation_cache.invalidate(lambda key: key[0] == user_id)
+            else:
+                self.conversation_cache.invalidate()
             return success
         except Exception as e:
             logger.error(f"Error clearing database: {e}")
             # Ensure we return False on exception after logging
             return False
 
-    async def _get_conversation_history(self, conversation_id: str, type: str, user_id: int) -> List[Dict[str, str]]:
-        """Retrieve conversation history from database for a specific user."""
+    async def _get_conversation_history(self, conversation_id: str, type: str, user_id: int) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """
+        Retrieve the conversation history that fits the context budget for a specific user.
+
+        Active conversations are served from the conversation cache. Otherwise only messages
+        after the rolling summary checkpoint are read. Returns the summary of the older turns
+        and the recent messages to send verbatim.
+        """
         loop = asyncio.get_event_loop()
-        def db_query():
-            cursor = self.conn.execute(
-                """
-                SELECT role, content 
-                FROM messages 
-                WHERE conversation_id = ? AND type = ? AND user_id = ?
-                ORDER BY timestamp ASC
-                """,
-                (conversation_id, type, user_id)
-            )
-            return [{"role": row["role"], "content": row["content"]} for row in cursor.fetchall()]
-        
-        history = await loop.run_in_executor(None, db_query)
-        return history
+        cache_key = (user_id, conversation_id, type)
+        cached = self.conversation_cache.get(cache_key)
+        if cached is not None:
+            summary, rows = cached
+        else:
+            def db_query():
+                with db_connection() as conn:
+                    summary, checkpoint = load_summary(conn, "chat", user_id, conversation_id)
+                    cursor = conn.execute(
+                        CHAT_CONVERSATION_HISTORY,
+                        (conversation_id, type, user_id, checkpoint)
+                    )
+                    return summary, [dict(row) for row in cursor.fetchall()]
+            
+            summary, rows = await loop.run_in_executor(None, db_query)
+
+        summary, history, checkpoint = await self.context_window.compact(summary, rows, ("chat", user_id, conversation_id))
+        if checkpoint is not None:
+            def db_update():
+                with db_transaction() as conn:
+                    save_summary(conn, "chat", user_id, conversation_id, summary, checkpoint)
+            await loop.run_in_executor(None, db_update)
+            rows = [row for row in rows if row["id"] > checkpoint]
+        self.conversation_cache.put(cache_key, summary, rows)
+        return summary, [{"role": row["role"], "content": row["content"]} for row in history]
+
+    async def _save_messages(self, conversation_id: str, type: str, user_id: int, messages: List[Dict[str, Any]]):
+        """
+        Save the messages of one turn to the database for a specific user, in a single transaction.
 
-    async def _save_message(self, conversation_id: str, role: str, content: str, type: str, user_id: int, citations: list = None):
-        """Save a message to the database for a specific user."""
+        Each message has a role, content and optional citations. Cached conversations are
+        updated as well.
+        """
         loop = asyncio.get_event_loop()
         def db_insert():
-            citations_json = json.dumps(citations) if citations else None
-            
-            self.conn.execute(
-                """
-                INSERT INTO messages (conversation_id, role, content, type, user_id, citations)
-                VALUES (?, ?, ?, ?, ?, ?)
-                """,
-                (conversation_id, role, content, type, user_id, citations_json)
-            )
-            self.conn.commit()
+            saved = []
+            with db_transaction() as conn:
+                for message in messages:
+                    citations = message.get("citations")
+                    cursor = conn.execute(
+                        """
+                        INSERT INTO messages (conversation_id, role, content, type, user_id, citations)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        (conversation_id, message["role"], message["content"], type, user_id,
+                         json.dumps(citations) if citations else None)
+                    )
+                    record_message(conn, "chat", user_id, conversation_id, message["role"], message["content"], type)
+                    saved.append({"id": cursor.lastrowid, "role": message["role"], "content": message["content"]})
+            return saved
         
-        await loop.run_in_executor(None, db_insert)
+        saved = await loop.run_in_executor(None, db_insert)
+        self.conversation_cache.append((user_id, conversation_id, type), saved)
 
     async def _create_messages_chat(self, user_content: str, conversation_id: str, user_id: int) -> list:
         """Create message list with chat message and user content, including conversation history."""
-        messages = [self.system_message_chat]
-        history = await self._get_conversation_history(conversation_id, "chat", user_id)
+        summary, history = await self._get_conversation_history(conversation_id, "chat", user_id)
+        messages = [self.context_window.with_summary(self.system_message_chat, summary)]
         messages.extend(history)
         messages.append({"role": "user", "content": user_content})
         return messages
 
     async def _create_messages_newbie(self, user_content: str, conversation_id: str, user_id: int) -> list:
         """Create message list with newbie message and user content, including conversation history."""
-        messages = [self.system_message_newbie]
-        history = await self._get_conversation_history(conversation_id, "newbie", user_id)
+        summary, history = await self._get_conversation_history(conversation_id, "newbie", user_id)
+        messages = [self.context_window.with_summary(self.system_message_newbie, summary)]
         messages.extend(history)
         messages.append({"role": "user", "content": user_content})
         return messages
@@ -304,23 +179,33 @@ class ChatService:
         """Create message list with guide-specific system message, section context, and user content, including conversation history."""
         # Format the system message with the current section name
         system_message_content = self.system_message_guide["content"].format(guide_text=yaml.dump(self.guide_content))
-        print(system_message_content)
-        messages = [{"role": "system", "content": system_message_content}]
+        summary, history = await self._get_conversation_history(conversation_id, "guide", user_id)
+        messages = [self.context_window.with_summary({"role": "system", "content": system_message_content}, summary)]
         
-        history = await self._get_conversation_history(conversation_id, "guide", user_id)
         messages.extend(history)
         messages.append({"role": "user", "content": user_content})
-        logger.info(f"Created messages for guide: {pprint.pformat(messages)}")
+        log_payload(logger, "Created messages for guide", messages)
         return messages
 
+    async def _create_messages(self, type: str, user_content: str, conversation_id: str, user_id: int) -> list:
+        """Create the message list for the given request type."""
+        if type == "chat":
+            return await self._create_messages_chat(user_content, conversation_id, user_id)
+        elif type == "newbie":
+            return await self._create_messages_newbie(user_content, conversation_id, user_id)
+        elif type == "guide":
+            return await self._create_messages_guide(user_content, conversation_id, user_id)
+        raise HTTPException(status_code=400, detail="Invalid request type")
+
     async def _update_conversation_history(self, conversation_id: str, messages: List[Dict[str, str]], response: Dict[str, Any], type: str, user_id: int):
         """Update conversation history with both user message and assistant response."""
-        await self._save_message(conversation_id, "user", messages[-1]["content"], type, user_id)
+        turn = [{"role": "user", "content": messages[-1]["content"]}]
         
         if response["type"] == "completion":
             assistant_content = response["data"].choices[0].message.content
             citations = response.get("citations", [])
-            await self._save_message(conversation_id, "assistant", assistant_content, type, user_id, citations)
+            turn.append({"role": "assistant", "content": assistant_content, "citations": citations})
+        await self._save_messages(conversation_id, type, user_id, turn)
 
     async def _handle_streaming_response(self, messages: list) -> Dict[str, Any]:
         """Handle streaming response from the API."""
@@ -329,9 +214,68 @@ class ChatService:
                 model=self.model, messages=messages, stream=True
             )
             return {"type": "stream", "data": response_stream}
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Streaming error: {str(e)}")
 
+    async def _stream_events(
+        self, response_stream, messages: list, conversation_id: str, type: str, user_id: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Forward tokens as they arrive and persist the turn once the stream ends.
+
+        If the client disconnects or the upstream fails mid-stream, the question and the
+        partial answer are still saved.
+        """
+        parts = []
+        citations = []
+        finished = False
+        try:
+            async for chunk in response_stream:
+                # Perplexity sends citations on the chunks alongside the deltas
+                chunk_citations = getattr(chunk, "citations", None)
+                if chunk_citations:
+                    citations = chunk_citations
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield {"event": "token", "data": {"content": chunk.choices[0].delta.content}}
+            finished = True
+
+            if citations:
+                yield {"event": "citations", "data": {"citations": citations}}
+        finally:
+            # Frees the upstream connection and concurrency slot if the client went away mid-stream
+            await response_stream.close()
+            answer = "".join(parts) if finished else "".join(parts + ["\n\n", INTERRUPTED_NOTE]).lstrip()
+            # Shielded so a cancelled request still saves its turn
+            await asyncio.shield(asyncio.ensure_future(self._save_messages(conversation_id, type, user_id, [
+                {"role": "user", "content": messages[-1]["content"]},
+                {"role": "assistant", "content": answer, "citations": citations},
+            ])))
+            if finished:
+                logger.info(f"Stream finished and saved for conversation {conversation_id} (type: {type})")
+            else:
+                logger.warning(f"Stream interrupted, partial answer saved for conversation {conversation_id} (type: {type})")
+
+        yield {"event": "done", "data": {"conversation_id": conversation_id}}
+
+    async def stream_chat_request(
+        self, type: str, user_content: str, conversation_id: str, user_id: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Start a streamed chat completion.
+
+        The upstream request is made before returning, so errors up to the first token
+        still surface as HTTP errors. The messages are saved when the stream ends, completed or not.
+
+        Returns:
+            AsyncIterator[Dict[str, Any]]: "token", "citations" and "done" events
+        """
+        messages = await self._create_messages(type, user_content, conversation_id, user_id)
+        result = await self._handle_streaming_response(messages)
+        return self._stream_events(result["data"], messages, conversation_id, type, user_id)
+
     async def _handle_completion_response(self, messages: list) -> Dict[str, Any]:
         """Handle non-streaming response from the API."""
         try:
@@ -351,6 +295,8 @@ class ChatService:
                 "data": response,
                 "citations": citations
             }
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Completion error: {str(e)}")
 
@@ -372,17 +318,12 @@ class ChatService:
         """
         messages: list = []
         try:
-            print(f"Processing chat request for type: {type}")
-            if type == "chat":
-                messages = await self._create_messages_chat(user_content, conversation_id, user_id)
-            elif type == "newbie":
-                messages = await self._create_messages_newbie(user_content, conversation_id, user_id)
-            elif type == "guide":
-                messages = await self._create_messages_guide(user_content, conversation_id, user_id)
-            else:
-                raise HTTPException(status_code=400, detail="Invalid request type")
+            bind_log_context(conversation_id=conversation_id, chat_type=type)
+            logger.info("Processing chat request")
+            messages = await self._create_messages(type, user_content, conversation_id, user_id)
 
-            logger.info(f"Context messages for conversation {conversation_id} (type: {type}): {pprint.pformat(messages)}")
+            logger.info(f"Sending {len(messages)} context messages")
+            log_payload(logger, "Context messages", messages)
 
             if stream:
                 result = await self._handle_streaming_response(messages)
@@ -390,7 +331,8 @@ class ChatService:
                 result = await self._handle_completion_response(messages)
                 await self._update_conversation_history(conversation_id, messages, result, type, user_id)
             
-            logger.info(f"Result for conversation {conversation_id} (type: {type}): {result}")
+            if not stream:
+                log_payload(logger, "Result", result)
             return result
             
         except HTTPException as he:
@@ -399,8 +341,3 @@ class ChatService:
         except Exception as e:
             logger.error(f"Error in process_chat_request: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail=str(e))
-
-    def __del__(self):
-        """Cleanup database connection when the service is destroyed."""
-        if hasattr(self, 'conn'):
-            self.conn.close()
@@ -0,0 +1,131 @@
+from typing import Any, Dict, List, Optional, Tuple
+from pathlib import Path
+import logging
+import yaml
+from services.single_flight import single_flight
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Rough per-message overhead for role and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Cheap token estimate (about four characters per token for English text)."""
+    return len(text) // 4 + 1 if text else 0
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextWindow:
+    """
+    Caps the conversation history sent upstream by an estimated token budget.
+
+    Recent turns are kept verbatim. Once the history goes over budget, the older
+    turns are folded into a rolling summary that is stored with the conversation,
+    together with the id of the last message it covers. Later turns only read the
+    messages after that checkpoint, so both the prompt and the DB read stay bounded
+    however long the conversation gets.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+        # Load settings from YAML
+        try:
+            config_path = Path(__file__).parent.parent / "config" / "context_window.yaml"
+            with open(config_path, "r") as file:
+                settings = yaml.safe_load(file)["context_window"]
+                self.max_history_tokens = int(settings.get("max_history_tokens", 4000))
+                self.fold_target_ratio = float(settings.get("fold_target_ratio", 0.5))
+                self.min_recent_messages = int(settings.get("min_recent_messages", 4))
+                self.summary_max_tokens = int(settings.get("summary_max_tokens", 500))
+                self.summary_model = settings.get("summary_model", "sonar")
+                self.summary_prompt = settings["summary_prompt"]
+        except Exception as e:
+            logger.error(f"Failed to load context window settings from YAML: {str(e)}")
+            raise
+
+    def fit(self, summary: Optional[str], rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Split the messages after the checkpoint into the ones to send and the ones to fold.
+
+        Args:
+            summary (Optional[str]): Current rolling summary
+            rows (List[Dict[str, Any]]): Messages after the checkpoint, oldest first, with id, role and content
+
+        Returns:
+            Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]: (messages kept verbatim, older messages to fold)
+        """
+        total = estimate_tokens(summary) + sum(message_tokens(row) for row in rows)
+        if total <= self.max_history_tokens:
+            return rows, []
+
+        target = int(self.max_history_tokens * self.fold_target_ratio)
+        keep_count = 0
+        used = 0
+        for row in reversed(rows):
+            tokens = message_tokens(row)
+            if keep_count >= self.min_recent_messages and used + tokens > target:
+                break
+            keep_count += 1
+            used += tokens
+
+        split = len(rows) - keep_count
+        # The verbatim part has to start with a user turn for roles to keep alternating
+        while split < len(rows) and rows[split]["role"] != "user":
+            split += 1
+        return rows[split:], rows[:split]
+
+    async def summarize(self, summary: Optional[str], rows: List[Dict[str, Any]], cache_key: Tuple) -> str:
+        """Fold rows into summary with one upstream call, coalescing concurrent folds of the same checkpoint."""
+        transcript = "\n\n".join(f"{row['role']}: {row['content']}" for row in rows)
+        max_words = int(self.summary_max_tokens * 0.75)
+        messages = [
+            {"role": "system", "content": self.summary_prompt.format(max_words=max_words)},
+            {"role": "user", "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ]
+
+        async def call():
+            response = await self.client.chat.completions.create(
+                model=self.summary_model, messages=messages, max_tokens=self.summary_max_tokens
+            )
+            return response.choices[0].message.content.strip()
+
+        key = single_flight.make_key("conversation_summary", self.summary_model, *cache_key, rows[-1]["id"])
+        return await single_flight.do(key, call)
+
+    async def compact(self, summary: Optional[str], rows: List[Dict[str, Any]], cache_key: Tuple) -> Tuple[Optional[str], List[Dict[str, Any]], Optional[int]]:
+        """
+        Fit the history into the budget, folding older turns into the summary if needed.
+
+        Returns:
+            Tuple[Optional[str], List[Dict[str, Any]], Optional[int]]: The summary to send, the
+            verbatim messages, and the new checkpoint message id if the summary changed
+        """
+        keep, fold = self.fit(summary, rows)
+        if not fold:
+            return summary, keep, None
+        try:
+            new_summary = await self.summarize(summary, fold, cache_key)
+            logger.info(f"Folded {len(fold)} messages into the conversation summary, keeping {len(keep)} verbatim")
+            return new_summary, keep, fold[-1]["id"]
+        except Exception as e:
+            # Still stay within budget; the unsummarized turns are retried on the next fold
+            logger.warning(f"Failed to update conversation summary, dropping {len(fold)} older messages from the prompt: {str(e)}")
+            return summary, keep, None
+
+    @staticmethod
+    def with_summary(system_message: Dict[str, str], summary: Optional[str]) -> Dict[str, str]:
+        """Return the system message with the rolling summary appended."""
+        if not summary:
+            return system_message
+        return {
+            "role": "system",
+            "content": f"{system_message['content']}\n\nSummary of the earlier conversation:\n{summary}"
+        }
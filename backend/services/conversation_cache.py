@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from pathlib import Path
+import logging
+import threading
+import time
+import yaml
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class ConversationCache:
+    """
+    In-memory LRU of active conversations, kept in step with the database by write-through.
+
+    Each entry holds what the context window needs for the next turn: the rolling
+    summary and the messages after its checkpoint. A turn on a cached conversation
+    reads nothing from the database. Entries are evicted least recently used first
+    once max_conversations is reached, and dropped after idle_minutes without use.
+
+    The cache assumes this process is the only writer for the conversations it holds.
+    """
+
+    def __init__(self):
+        # Load settings from YAML
+        try:
+            config_path = Path(__file__).parent.parent / "config" / "conversation_cache.yaml"
+            with open(config_path, "r") as file:
+                settings = yaml.safe_load(file)["conversation_cache"]
+                self.max_conversations = int(settings.get("max_conversations", 1000))
+                self.idle_seconds = float(settings.get("idle_minutes", 30)) * 60
+        except Exception as e:
+            logger.error(f"Failed to load conversation cache settings from YAML: {str(e)}")
+            raise
+
+        # key -> (summary, messages after the summary checkpoint, last used)
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[str], List[Dict[str, Any]], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Tuple[Optional[str], List[Dict[str, Any]]]]:
+        """Return (summary, messages) for a cached conversation, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            summary, messages, last_used = entry
+            if now - last_used > self.idle_seconds:
+                del self._entries[key]
+                return None
+            self._entries[key] = (summary, messages, now)
+            self._entries.move_to_end(key)
+            return summary, list(messages)
+
+    def put(self, key: Hashable, summary: Optional[str], messages: List[Dict[str, Any]]) -> None:
+        """Cache a conversation's summary and the messages after its checkpoint."""
+        with self._lock:
+            self._entries[key] = (summary, list(messages), time.monotonic())
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def append(self, key: Hashable, messages: List[Dict[str, Any]]) -> None:
+        """Add messages that were just saved; conversations that are not cached are left alone."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            summary, cached, _ = entry
+            self._entries[key] = (summary, cached + list(messages), time.monotonic())
+            self._entries.move_to_end(key)
+
+    def invalidate(self, predicate=None) -> None:
+        """Drop every entry whose key matches predicate, or all entries."""
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            oldest_key, (_, _, last_used) = next(iter(self._entries.items()))
+            if len(self._entries) > self.max_conversations or now - last_used > self.idle_seconds:
+                del self._entries[oldest_key]
+            else:
+                break
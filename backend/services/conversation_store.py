@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+import binascii
+import json
+import sqlite3
+from fastapi import HTTPException
+from queries import CONVERSATION_SUMMARY, conversation_page
+
+# Longest first user message kept as a conversation title; endpoints shorten it further for display
+TITLE_MAX_LENGTH = 200
+
+# Ends the saved answer of a streamed turn that was cut off, so the history still alternates
+INTERRUPTED_NOTE = "[The answer was interrupted]"
+
+def record_message(conn: sqlite3.Connection, kind: str, user_id: Optional[int], conversation_id: str,
+                   role: str, content: str, type: str, symbol: str = "") -> None:
+    """
+    Keep the conversation summary row in step with a message inserted on the same connection.
+
+    Call this inside the transaction that inserts the message. The first user message
+    becomes the title; the conversation type is the one it was started with.
+    """
+    title = content[:TITLE_MAX_LENGTH] if role == "user" else None
+    conn.execute("""
+        INSERT INTO conversations (
+            kind, user_id, conversation_id, symbol, type, title, created_at, updated_at, message_count
+        ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP, 1)
+        ON CONFLICT (kind, user_id, conversation_id, symbol) DO UPDATE SET
+            title = COALESCE(conversations.title, excluded.title),
+            updated_at = excluded.updated_at,
+            message_count = conversations.message_count + 1
+    """, (kind, user_id, conversation_id, symbol, type, title))
+
+def load_summary(conn: sqlite3.Connection, kind: str, user_id: int, conversation_id: str,
+                 symbol: str = "") -> Tuple[Optional[str], int]:
+    """
+    Return the rolling summary of a conversation and the id of the last message it covers.
+
+    Messages up to and including that id only need to be read through the summary.
+    """
+    row = conn.execute(CONVERSATION_SUMMARY, (kind, user_id, conversation_id, symbol)).fetchone()
+    if not row:
+        return None, 0
+    return row[0], row[1] or 0
+
+def save_summary(conn: sqlite3.Connection, kind: str, user_id: int, conversation_id: str,
+                 summary: str, summary_message_id: int, symbol: str = "") -> None:
+    """Store a new rolling summary, unless a concurrent turn already stored a later one."""
+    conn.execute("""
+        UPDATE conversations SET summary = ?, summary_message_id = ?
+        WHERE kind = ? AND user_id = ? AND conversation_id = ? AND symbol = ? AND summary_message_id < ?
+    """, (summary, summary_message_id, kind, user_id, conversation_id, symbol, summary_message_id))
+
+def encode_cursor(created_at: str, conversation_id: str) -> str:
+    """Encode the position after a listed conversation as an opaque cursor."""
+    raw = json.dumps([created_at, conversation_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a cursor from encode_cursor, raising a 400 if it was tampered with."""
+    try:
+        created_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_at), str(conversation_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def list_conversations(conn: sqlite3.Connection, kind: str, user_id: int, limit: int,
+                       cursor: Optional[str] = None, symbol: str = "",
+                       exclude_type: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Return one page of a user's conversations, newest first.
+
+    Pages are keyed on (created_at, conversation_id) so every page is a single index
+    range read, however many conversations the user has.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], Optional[str]]: The rows and the cursor for the next page, if any
+    """
+    params: list = [user_id, kind, symbol]
+    if exclude_type is not None:
+        params.append(exclude_type)
+    if cursor:
+        params.extend(decode_cursor(cursor))
+    # One extra row tells us whether there is a next page
+    params.append(limit + 1)
+
+    query = conversation_page(exclude_type is not None, bool(cursor))
+    rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["conversation_id"])
+    return rows, next_cursor
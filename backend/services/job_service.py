@@ -0,0 +1,332 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+import yaml
+from database import db_connection, db_transaction, init_db
+from queries import (
+    CLAIM_JOB, DELETE_EXPIRED_JOBS, JOB_FOR_USER, LATEST_JOB_FOR_INPUT, QUEUED_JOBS,
+    RENEW_JOB_LEASE, REQUEUE_STALE_JOBS,
+)
+from services.structured_logging import log_context
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Handler for one kind of job: (user_id, params) -> JSON-serializable result
+JobHandler = Callable[[str, Dict[str, Any]], Awaitable[Any]]
+
+FINISHED_STATUSES = ("succeeded", "failed")
+
+
+class JobService:
+    """
+    Runs long upstream requests (e.g. deep research) as background jobs persisted in the jobs table.
+
+    Submitting returns a job id straight away; the result is stored with the job, so a
+    client that reconnects reads it instead of starting the work again. A job with the
+    same input as one that is queued, running or recently finished is returned instead
+    of a new one. Each kind has its own bounded queue and a fixed number of workers,
+    which caps concurrent upstream calls of that kind.
+
+    Workers run in every process that calls start(). A worker holds a lease on the job
+    it runs and keeps renewing it; running jobs whose lease ran out (their worker died)
+    are requeued on startup and periodically after that, while jobs still running in
+    another process are left alone.
+    """
+
+    def __init__(self):
+        # Load settings from YAML
+        try:
+            config_path = Path(__file__).parent.parent / "config" / "job_service.yaml"
+            with open(config_path, "r") as file:
+                settings = yaml.safe_load(file)["job_service"]
+                self.max_queued = int(settings.get("max_queued", 100))
+                self.reuse_results_seconds = float(settings.get("reuse_results_minutes", 30)) * 60
+                self.retention_seconds = float(settings.get("retention_hours", 24)) * 3600
+                self.heartbeat_seconds = float(settings.get("heartbeat_seconds", 15))
+                self.lease_seconds = float(settings.get("lease_seconds", 60))
+                self.concurrency = {
+                    kind: int((kind_settings or {}).get("max_concurrency", 1))
+                    for kind, kind_settings in settings.get("kinds", {}).items()
+                }
+        except Exception as e:
+            logger.error(f"Failed to load job service settings from YAML: {str(e)}")
+            raise
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: List[asyncio.Task] = []
+        # job id -> one event per event stream, set on the job's next status change
+        self._changed: Dict[str, Set[asyncio.Event]] = {}
+
+        init_db()
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """Register the coroutine function that runs jobs of kind."""
+        self._handlers[kind] = handler
+        self._queues.setdefault(kind, asyncio.Queue())
+
+    @staticmethod
+    def _input_hash(kind: str, user_id: str, params: Dict[str, Any]) -> str:
+        payload = json.dumps([kind, str(user_id), params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def _row_to_job(row) -> Dict[str, Any]:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "params": json.loads(row["params"]),
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "result": json.loads(row["result"]) if row["result"] is not None else None,
+            "error": row["error"],
+        }
+
+    async def submit(self, kind: str, user_id: str, params: Dict[str, Any], force: bool = False) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a job, or return the existing job for the same input.
+
+        Args:
+            kind (str): Registered job kind
+            user_id (str): Owner of the job
+            params (Dict[str, Any]): JSON-serializable input passed to the handler
+            force (bool): Do not reuse a finished job's result
+
+        Returns:
+            Tuple[Dict[str, Any], bool]: The job, and whether it was newly created
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        input_hash = self._input_hash(kind, user_id, params)
+        queue = self._queues[kind]
+
+        def db_call():
+            now = time.time()
+            with db_transaction() as conn:
+                conn.execute(DELETE_EXPIRED_JOBS, (now - self.retention_seconds,))
+                existing = conn.execute(LATEST_JOB_FOR_INPUT, (kind, input_hash)).fetchone()
+                if existing is not None:
+                    if existing["status"] not in FINISHED_STATUSES:
+                        return existing, False
+                    if (existing["status"] == "succeeded" and not force
+                            and existing["finished_at"] >= now - self.reuse_results_seconds):
+                        return existing, False
+
+                if queue.qsize() >= self.max_queued:
+                    return None, False
+                job_id = uuid.uuid4().hex
+                conn.execute("""
+                    INSERT INTO jobs (id, kind, user_id, input_hash, params, status, created_at)
+                    VALUES (?, ?, ?, ?, ?, 'queued', ?)
+                """, (job_id, kind, user_id, input_hash, json.dumps(params), now))
+                return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone(), True
+
+        loop = asyncio.get_event_loop()
+        row, created = await loop.run_in_executor(None, db_call)
+        if row is None:
+            logger.warning(f"Rejecting {kind} job for user '{user_id}': {queue.qsize()} jobs already queued")
+            raise HTTPException(status_code=503, detail="Too many jobs are queued, please retry later")
+
+        job = self._row_to_job(row)
+        if created:
+            queue.put_nowait(job["job_id"])
+            logger.info(f"Queued {kind} job {job['job_id']} for user '{user_id}'")
+        else:
+            logger.info(f"Reusing {job['status']} {kind} job {job['job_id']} for user '{user_id}'")
+        return job, created
+
+    async def get(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job owned by user_id, or None."""
+        def db_call():
+            with db_connection() as conn:
+                return conn.execute(JOB_FOR_USER, (job_id, user_id)).fetchone()
+
+        loop = asyncio.get_event_loop()
+        row = await loop.run_in_executor(None, db_call)
+        return self._row_to_job(row) if row is not None else None
+
+    async def events(self, job_id: str, user_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield a "status" event on every status change (and as a heartbeat), then a final
+        "result" or "error" event once the job has finished.
+        """
+        changed = asyncio.Event()
+        self._changed.setdefault(job_id, set()).add(changed)
+        try:
+            while True:
+                # Reset before reading so a change in between is not missed
+                changed.clear()
+                job = await self.get(job_id, user_id)
+                if job is None:
+                    raise HTTPException(status_code=404, detail="Job not found")
+
+                yield {"event": "status", "data": {key: value for key, value in job.items() if key not in ("result", "params")}}
+                if job["status"] == "succeeded":
+                    yield {"event": "result", "data": job["result"]}
+                    return
+                if job["status"] == "failed":
+                    yield {"event": "error", "data": {"detail": job["error"]}}
+                    return
+
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Also runs when the client disconnects and the stream is closed
+            subscribers = self._changed.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(changed)
+                if not subscribers:
+                    del self._changed[job_id]
+
+    def _notify(self, job_id: str) -> None:
+        for changed in self._changed.get(job_id, ()):
+            changed.set()
+
+    async def _requeue_stale(self, include_queued: bool = False):
+        """
+        Requeue running jobs whose lease ran out and put them on this process's queues.
+
+        With include_queued (once, on startup) every queued job is put on the queues too.
+        Queued jobs may also be in another process's queue; whichever worker claims one
+        first runs it and the others skip it.
+        """
+        def db_call():
+            with db_transaction() as conn:
+                requeued = conn.execute(REQUEUE_STALE_JOBS, (time.time() - self.lease_seconds,)).fetchall()
+                if include_queued:
+                    return requeued, conn.execute(QUEUED_JOBS).fetchall()
+                return requeued, requeued
+
+        loop = asyncio.get_event_loop()
+        requeued, queued = await loop.run_in_executor(None, db_call)
+        if requeued:
+            logger.info(f"Requeued {len(requeued)} jobs whose worker stopped renewing their lease")
+        for row in queued:
+            if row["kind"] in self._queues:
+                self._queues[row["kind"]].put_nowait(row["id"])
+            else:
+                await self._finish(row["id"], error=f"Unknown job kind: {row['kind']}")
+
+    async def _sweeper(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                await self._requeue_stale()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to requeue stale jobs: {str(e)}")
+
+    async def start(self):
+        """Requeue jobs left behind by stopped workers and start the workers on the running event loop."""
+        if self._workers:
+            return
+
+        await self._requeue_stale(include_queued=True)
+
+        for kind in self._handlers:
+            for _ in range(self.concurrency.get(kind, 1)):
+                self._workers.append(asyncio.create_task(self._worker(kind)))
+        self._workers.append(asyncio.create_task(self._sweeper()))
+        logger.info(f"JobService started ({len(self._workers) - 1} workers)")
+
+    async def stop(self):
+        """Cancel the workers; interrupted jobs are requeued once their lease runs out."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("JobService stopped")
+
+    async def _worker(self, kind: str):
+        queue = self._queues[kind]
+        while True:
+            job_id = await queue.get()
+            try:
+                # Job logs are tagged with the job rather than the request that submitted it
+                with log_context(request_id=f"job-{job_id[:8]}", job_kind=kind):
+                    await self._run(kind, job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker for {kind} failed on job {job_id}: {str(e)}")
+            finally:
+                queue.task_done()
+
+    async def _run(self, kind: str, job_id: str):
+        def claim():
+            now = time.time()
+            with db_transaction() as conn:
+                claimed = conn.execute(CLAIM_JOB, (now, now, job_id)).rowcount
+                if not claimed:
+                    return None
+                return conn.execute("SELECT user_id, params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+        loop = asyncio.get_event_loop()
+        row = await loop.run_in_executor(None, claim)
+        if row is None:
+            return
+        self._notify(job_id)
+
+        logger.info(f"Running {kind} job {job_id}")
+        lease = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            result = await self._handlers[kind](str(row["user_id"]), json.loads(row["params"]))
+        except Exception as e:
+            logger.error(f"{kind} job {job_id} failed: {str(e)}")
+            await self._finish(job_id, error=getattr(e, "detail", None) or str(e))
+            return
+        finally:
+            lease.cancel()
+        await self._finish(job_id, result=result)
+        logger.info(f"{kind} job {job_id} succeeded")
+
+    async def _renew_lease(self, job_id: str):
+        def db_call():
+            with db_transaction() as conn:
+                conn.execute(RENEW_JOB_LEASE, (time.time(), job_id))
+
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await loop.run_in_executor(None, db_call)
+            except Exception as e:
+                logger.error(f"Failed to renew the lease on job {job_id}: {str(e)}")
+
+    async def _finish(self, job_id: str, result: Any = None, error: Optional[str] = None):
+        def db_call():
+            with db_transaction() as conn:
+                conn.execute("""
+                    UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?
+                    WHERE id = ?
+                """, (
+                    "failed" if error is not None else "succeeded",
+                    json.dumps(result) if error is None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ))
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, db_call)
+        self._notify(job_id)
+
+
+# Shared by the routers that submit jobs and the jobs router that reports on them
+job_service = JobService()
@@ -0,0 +1,315 @@
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Callable, Dict
+from fastapi import HTTPException
+from openai import AsyncOpenAI
+from pathlib import Path
+import openai
+import asyncio
+import httpx
+import logging
+import os
+import random
+import time
+import yaml
+from services.metrics import (
+    UPSTREAM_IN_FLIGHT, UPSTREAM_QUEUE_SECONDS, UPSTREAM_REQUEST_SECONDS, UPSTREAM_TOKENS, record_stage,
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Upstream failures worth another attempt: 429, 5xx, timeouts and dropped connections
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class TokenBucket:
+    """Admits rate requests per second on average, with bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        # Waiters are served in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _record_usage(service: str, model: str, usage: Any) -> None:
+    """Count the prompt and completion tokens of a completion's usage, object or dict."""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if tokens:
+            UPSTREAM_TOKENS.labels(service=service, model=model, kind=kind.split("_")[0]).inc(tokens)
+
+
+class _GatedStream:
+    """
+    A streamed completion that keeps its concurrency slot until the stream ends.
+
+    The slot is released once: when iteration ends, on close(), or when the stream is
+    dropped without either (e.g. the client went away before the body was sent).
+    """
+
+    def __init__(self, stream, release: Callable[[], None], service: str, model: str):
+        self._stream = stream
+        self._release = release
+        self._service = service
+        self._model = model
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        try:
+            async for chunk in self._stream:
+                # Usage arrives on the last chunk
+                _record_usage(self._service, self._model, getattr(chunk, "usage", None))
+                yield chunk
+        finally:
+            self._release()
+
+    async def close(self) -> None:
+        try:
+            await self._stream.close()
+        finally:
+            self._release()
+
+    def __del__(self):
+        self._release()
+
+
+class LLMGateway:
+    """
+    The single way services talk to the Sonar API.
+
+    Owns one pooled HTTP client, bounds upstream requests in flight globally and per
+    model, spaces request starts with a token bucket, and retries 429/5xx/connection
+    errors with jittered exponential backoff. A request that cannot get a slot within
+    its model's queue timeout, or is still rate limited after its last attempt, fails
+    with 503 and Retry-After rather than 500, so load is shed instead of piling up.
+
+    client(service) returns an AsyncOpenAI look-alike (chat.completions.create) whose
+    calls are labelled with the service in metrics.
+    """
+
+    def __init__(self):
+        # Load settings from YAML
+        try:
+            config_path = Path(__file__).parent.parent / "config" / "llm_gateway.yaml"
+            with open(config_path, "r") as file:
+                settings = yaml.safe_load(file)["llm_gateway"]
+                self.base_url = os.getenv("PERPLEXITY_BASE_URL") or settings.get("base_url", "https://api.perplexity.ai")
+                connection = settings.get("connection", {})
+                self.max_concurrency = int(settings.get("max_concurrency", 16))
+                self.default_model_concurrency = int(settings.get("default_model_concurrency", 8))
+                self.model_concurrency = {
+                    model: int((model_settings or {}).get("max_concurrency", self.default_model_concurrency))
+                    for model, model_settings in settings.get("models", {}).items()
+                }
+                rate_limit = settings.get("rate_limit", {})
+                self.requests_per_second = float(rate_limit.get("requests_per_second", 10))
+                self.burst = float(rate_limit.get("burst", 20))
+                self.queue_timeout_seconds = float(settings.get("queue_timeout_seconds", 30))
+                self.model_queue_timeout_seconds = {
+                    model: float(model_settings["queue_timeout_seconds"])
+                    for model, model_settings in settings.get("models", {}).items()
+                    if model_settings and "queue_timeout_seconds" in model_settings
+                }
+                self.slow_queue_seconds = float(settings.get("slow_queue_seconds", 2))
+                retries = settings.get("retries", {})
+                self.max_attempts = max(int(retries.get("max_attempts", 4)), 1)
+                self.base_delay_seconds = float(retries.get("base_delay_seconds", 0.5))
+                self.max_delay_seconds = float(retries.get("max_delay_seconds", 8))
+        except Exception as e:
+            logger.error(f"Failed to load LLM gateway settings from YAML: {str(e)}")
+            raise
+
+        try:
+            # Retries are done here, with the shared budget, not inside the SDK
+            self._client = AsyncOpenAI(
+                api_key=os.getenv("PERPLEXITY_API_KEY"),
+                base_url=self.base_url,
+                max_retries=0,
+                timeout=httpx.Timeout(
+                    float(connection.get("timeout_seconds", 300)),
+                    connect=float(connection.get("connect_timeout_seconds", 10)),
+                ),
+                http_client=httpx.AsyncClient(limits=httpx.Limits(
+                    max_connections=int(connection.get("max_connections", 50)),
+                    max_keepalive_connections=int(connection.get("max_keepalive_connections", 20)),
+                    keepalive_expiry=float(connection.get("keepalive_expiry_seconds", 30)),
+                )),
+            )
+            logger.info(f"LLM gateway client initialized for {self.base_url}")
+        except Exception as e:
+            logger.error(f"Failed to initialize LLM gateway client: {str(e)}")
+            raise
+
+        self._global_slots = asyncio.Semaphore(self.max_concurrency)
+        self._model_slots: Dict[str, asyncio.Semaphore] = {}
+        self._bucket = TokenBucket(self.requests_per_second, self.burst)
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def client(self, service: str) -> SimpleNamespace:
+        """Drop-in for an AsyncOpenAI client, with calls attributed to service."""
+        async def create(**kwargs):
+            return await self.create_chat_completion(service=service, **kwargs)
+
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_slots:
+            self._model_slots[model] = asyncio.Semaphore(self.model_concurrency.get(model, self.default_model_concurrency))
+        return self._model_slots[model]
+
+    def _queue_timeout(self, model: str) -> float:
+        return self.model_queue_timeout_seconds.get(model, self.queue_timeout_seconds)
+
+    def _model_stats(self, model: str) -> Dict[str, float]:
+        return self._stats.setdefault(model, {
+            "requests": 0, "attempts": 0, "retries": 0, "failures": 0, "rejected": 0,
+            "in_flight": 0, "waiting": 0, "queue_seconds_total": 0.0, "queue_seconds_max": 0.0,
+        })
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-model request, retry and queue-time counters since startup."""
+        return {model: dict(model_stats) for model, model_stats in self._stats.items()}
+
+    async def _acquire(self, model: str) -> Callable[[], None]:
+        """Wait for a model slot, a global slot and a rate-limit token; returns the release callback."""
+        model_slots = self._model_semaphore(model)
+        # The model slot comes first so a saturated model does not hold global slots while it waits
+        await model_slots.acquire()
+        try:
+            await self._global_slots.acquire()
+            try:
+                await self._bucket.acquire()
+            except BaseException:
+                self._global_slots.release()
+                raise
+        except BaseException:
+            model_slots.release()
+            raise
+
+        model_stats = self._model_stats(model)
+        model_stats["in_flight"] += 1
+        UPSTREAM_IN_FLIGHT.labels(model=model).inc()
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                model_stats["in_flight"] -= 1
+                UPSTREAM_IN_FLIGHT.labels(model=model).dec()
+                self._global_slots.release()
+                model_slots.release()
+
+        return release
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Seconds before the next attempt: upstream's Retry-After if given, else full jitter."""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay_seconds)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay_seconds, self.base_delay_seconds * 2 ** attempt))
+
+    def _busy(self, detail: str, retry_after: float) -> HTTPException:
+        return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(max(int(retry_after), 1))})
+
+    async def create_chat_completion(self, model: str, messages: list, stream: bool = False,
+                                     service: str = "other", **kwargs) -> Any:
+        """
+        Request a chat completion through the shared budget.
+
+        Takes the same arguments as AsyncOpenAI's chat.completions.create, plus the
+        calling service for metrics. A streamed completion keeps its slot until the
+        stream has been consumed or closed.
+        """
+        model_stats = self._model_stats(model)
+        model_stats["requests"] += 1
+
+        queue_timeout = self._queue_timeout(model)
+        for attempt in range(self.max_attempts):
+            queued_at = time.monotonic()
+            model_stats["waiting"] += 1
+            try:
+                release = await asyncio.wait_for(self._acquire(model), timeout=queue_timeout)
+            except asyncio.TimeoutError:
+                model_stats["rejected"] += 1
+                logger.warning(f"Rejecting {model} request: no upstream slot within {queue_timeout}s")
+                raise self._busy("The upstream API is busy, please retry later", queue_timeout)
+            finally:
+                model_stats["waiting"] -= 1
+
+            queue_seconds = time.monotonic() - queued_at
+            UPSTREAM_QUEUE_SECONDS.labels(service=service, model=model).observe(queue_seconds)
+            record_stage("upstream_queue", queue_seconds)
+            model_stats["queue_seconds_total"] += queue_seconds
+            model_stats["queue_seconds_max"] = max(model_stats["queue_seconds_max"], queue_seconds)
+            if queue_seconds >= self.slow_queue_seconds:
+                logger.warning(f"{model} request waited {queue_seconds:.2f}s for an upstream slot")
+
+            model_stats["attempts"] += 1
+            started = time.perf_counter()
+            try:
+                response = await self._client.chat.completions.create(
+                    model=model, messages=messages, stream=stream, **kwargs
+                )
+            except RETRYABLE_ERRORS as e:
+                release()
+                outcome = "rate_limited" if isinstance(e, openai.RateLimitError) else "retryable_error"
+                self._observe(service, model, outcome, started)
+                if attempt + 1 >= self.max_attempts:
+                    model_stats["failures"] += 1
+                    logger.error(f"{model} request failed after {self.max_attempts} attempts: {str(e)}")
+                    if isinstance(e, openai.RateLimitError):
+                        raise self._busy("The upstream API is rate limiting requests, please retry later", self._backoff(attempt, e))
+                    raise
+                delay = self._backoff(attempt, e)
+                model_stats["retries"] += 1
+                logger.warning(f"{model} request attempt {attempt + 1} failed ({type(e).__name__}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                release()
+                self._observe(service, model, "error", started)
+                model_stats["failures"] += 1
+                raise
+
+            self._observe(service, model, "ok", started)
+            if stream:
+                return _GatedStream(response, release, service, model)
+            release()
+            _record_usage(service, model, getattr(response, "usage", None))
+            return response
+
+    @staticmethod
+    def _observe(service: str, model: str, outcome: str, started: float) -> None:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_REQUEST_SECONDS.labels(service=service, model=model, outcome=outcome).observe(elapsed)
+        record_stage("upstream", elapsed)
+
+
+# Shared by all services so they draw on one connection pool and one concurrency budget
+llm_gateway = LLMGateway()
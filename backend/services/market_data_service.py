@@ -0,0 +1,472 @@
+from datetime import date, datetime, timezone, timedelta
+from fastapi import HTTPException
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+import logging
+import asyncio
+import yaml
+from pathlib import Path
+import json
+from pydantic import BaseModel
+from services.single_flight import single_flight
+from services.access_tracker import access_tracker
+from services.price_store import append_prices, dated_history, downsample, last_trading_day, load_series
+from services.llm_gateway import llm_gateway
+from services.metrics import record_cache
+from services.structured_logging import preview
+from database import db_connection, db_transaction, init_db
+from queries import MARKET_SNAPSHOTS, SECTOR_SYMBOLS, in_placeholders
+
+class AssetData(BaseModel):
+    price: float
+    movement: float
+    reason: str
+    sector: str
+    news: str
+    price_history: list[float]
+
+class SymbolAssetData(AssetData):
+    symbol: str
+
+class AssetDataBatch(BaseModel):
+    assets: list[SymbolAssetData]
+
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+class MarketDataService:
+    """
+    Symbol-keyed store of market snapshots shared by every user tracking a symbol.
+
+    Each symbol is fetched from Sonar at most once per TTL, regardless of how many
+    users track it. Per-user tracked_assets rows reference snapshots by symbol.
+    """
+
+    def __init__(self):
+        logger.info("Initializing MarketDataService")
+        init_db()
+
+        # Upstream calls share the gateway's connection pool, concurrency budget and retries
+        self.client = llm_gateway.client("market_data")
+        self.model = "sonar-pro"
+
+        # Load prompts from YAML
+        try:
+            config_path = Path(__file__).parent.parent / "config" / "asset_tracking.yaml"
+            with open(config_path, 'r') as file:
+                prompts = yaml.safe_load(file)
+                self.system_message = {
+                    "role": "system",
+                    "content": prompts['asset_tracking']['system_prompt']
+                }
+                self.user_prompt_template = prompts['asset_tracking']['user_prompt_template']
+                self.batch_user_prompt_template = prompts['asset_tracking']['batch_user_prompt_template']
+                refresh_settings = prompts['asset_tracking'].get('refresh', {})
+                self.ttl = timedelta(hours=float(refresh_settings.get('ttl_hours', 24)))
+                self.refresh_max_concurrency = int(refresh_settings.get('max_concurrency', 5))
+                self.refresh_timeout_seconds = float(refresh_settings.get('timeout_seconds', 45))
+                self.batch_size = max(int(refresh_settings.get('batch_size', 10)), 1)
+                self.batch_timeout_seconds = float(refresh_settings.get('batch_timeout_seconds', 90))
+                price_settings = prompts['asset_tracking'].get('prices', {})
+                self.sparkline_days = int(price_settings.get('sparkline_days', 6))
+                self.sparkline_points = int(price_settings.get('sparkline_points', 6))
+            logger.info("Successfully loaded prompts from YAML")
+        except Exception as e:
+            logger.error(f"Failed to load prompts from YAML: {str(e)}")
+            raise
+
+    @staticmethod
+    def _snapshot_date(snapshot_row) -> date:
+        return datetime.fromisoformat(str(snapshot_row["last_updated"]).replace('Z', '+00:00')).date()
+
+    def _sparkline_window(self, as_of: date) -> Tuple[date, date]:
+        """First and last day of the sparkline: the trading days before as_of within sparkline_days."""
+        # The snapshot's price is stored on the last trading day, which may precede a weekend as_of
+        current_day = last_trading_day(as_of)
+        return current_day - timedelta(days=self.sparkline_days), current_day - timedelta(days=1)
+
+    def _sparklines(self, conn, rows) -> Dict[str, List[float]]:
+        """Downsampled sparkline closes for each snapshot row, read with a single query."""
+        windows = {row["symbol"]: self._sparkline_window(self._snapshot_date(row)) for row in rows}
+        if not windows:
+            return {}
+        series = load_series(
+            conn, windows.keys(),
+            min(start for start, _ in windows.values()), max(end for _, end in windows.values()),
+        )
+        sparklines = {}
+        for symbol, (start, end) in windows.items():
+            # Snapshots refreshed on different days have different windows
+            points = [point for point in series[symbol] if start.isoformat() <= point[0] <= end.isoformat()]
+            sparklines[symbol] = [close for _, close in downsample(points, self.sparkline_points)]
+        return sparklines
+
+    def _row_to_snapshot(self, row, price_history: List[float]) -> Dict[str, Any]:
+        return {
+            "symbol": row["symbol"],
+            "name": row["name"],
+            "price": row["price"],
+            "movement": row["movement"],
+            "reason": row["reason"],
+            "sector": row["sector"],
+            "news": row["news"],
+            "price_history": price_history,
+            "last_updated": row["last_updated"]
+        }
+
+    def is_fresh(self, snapshot: Dict[str, Any], margin: timedelta = timedelta(0)) -> bool:
+        """Whether a snapshot stays within the configured TTL for at least another margin."""
+        last_updated = datetime.fromisoformat(str(snapshot["last_updated"]).replace('Z', '+00:00')).replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - last_updated) < self.ttl - margin
+
+    def load_snapshots(self, symbols: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Read the stored snapshots for the given symbols without refreshing them."""
+        symbols = list(dict.fromkeys(symbols))
+        if not symbols:
+            return {}
+        with db_connection() as conn:
+            rows = conn.execute(MARKET_SNAPSHOTS.format(placeholders=in_placeholders(len(symbols))), symbols).fetchall()
+            sparklines = self._sparklines(conn, rows)
+            return {row["symbol"]: self._row_to_snapshot(row, sparklines[row["symbol"]]) for row in rows}
+
+    def load_sector_symbols(self, sector: str, exclude_symbol: Optional[str] = None, limit: int = -1) -> List[str]:
+        """Symbols with a stored snapshot in a sector, most recently refreshed first, optionally leaving one out."""
+        with db_connection() as conn:
+            cursor = conn.execute(SECTOR_SYMBOLS, (sector, exclude_symbol or "", limit))
+            return [row["symbol"] for row in cursor.fetchall()]
+
+    def load_price_series(self, symbols: Iterable[str], start: Optional[date] = None,
+                          end: Optional[date] = None) -> Dict[str, List[Tuple[str, float]]]:
+        """Dated daily closes of each symbol between start and end, oldest first."""
+        with db_connection() as conn:
+            return load_series(conn, symbols, start, end)
+
+    def load_snapshot(self, symbol: str) -> Optional[Dict[str, Any]]:
+        """Read the stored snapshot for a single symbol without refreshing it."""
+        return self.load_snapshots([symbol]).get(symbol)
+
+    async def _fetch_asset_details(self, symbol: str, name: str) -> Dict[str, Any]:
+        """Fetch asset details from Sonar API."""
+        logger.info(f"Fetching details for asset: {symbol} ({name})")
+        try:
+            messages = [
+                self.system_message,
+                {
+                    "role": "user",
+                    "content": self.user_prompt_template.format(symbol=symbol, name=name)
+                }
+            ]
+
+            response = await self.client.chat.completions.create(
+                extra_body={
+                        "search_domain_filter": [
+                            "tradingview.com",
+                        ]
+                    },
+                model=self.model,
+                messages=messages,
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {"schema": AssetData.model_json_schema()}
+                }
+            )
+
+            content = response.choices[0].message.content
+
+            try:
+                asset_details = json.loads(content)
+                logger.info("Response is valid JSON")
+            except json.JSONDecodeError as e:
+                logger.error(f"Invalid JSON response: {str(e)}")
+                logger.error(f"Raw response content: {preview(content)}")
+                raise HTTPException(status_code=500, detail="Invalid JSON response from Sonar API when fetching asset details")
+
+            try:
+                return AssetData(**asset_details).model_dump()
+            except Exception as e:
+                logger.error(f"Malformed asset details for {symbol}: {str(e)}")
+                logger.error(f"Raw response content: {preview(content)}")
+                raise HTTPException(status_code=500, detail="Malformed response from Sonar API when fetching asset details")
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching asset details: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to fetch asset details: {str(e)}")
+
+    async def _fetch_asset_details_bounded(self, semaphore: asyncio.Semaphore, symbol: str, name: str) -> Dict[str, Any]:
+        """
+        Fetch asset details while holding a concurrency slot, giving up after the configured timeout.
+
+        Concurrent fetches of the same symbol share a single upstream call.
+        """
+        async def bounded_fetch():
+            async with semaphore:
+                try:
+                    return await asyncio.wait_for(
+                        self._fetch_asset_details(symbol, name),
+                        timeout=self.refresh_timeout_seconds
+                    )
+                except asyncio.TimeoutError:
+                    logger.error(f"Timed out after {self.refresh_timeout_seconds}s fetching details for asset {symbol}")
+                    raise HTTPException(status_code=504, detail=f"Timed out fetching asset details for {symbol}")
+
+        key = single_flight.make_key("market_data", self.model, symbol)
+        return await single_flight.do(key, bounded_fetch)
+
+    async def _fetch_asset_details_batch(self, assets: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch details for several assets in one Sonar call.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Details keyed by symbol, only for requested symbols
+                whose entry in the answer is well formed
+        """
+        logger.info(f"Fetching details for {len(assets)} assets in one batch: {', '.join(assets)}")
+        asset_lines = "\n".join(f"- {symbol} ({name})" for symbol, name in assets.items())
+        messages = [
+            self.system_message,
+            {
+                "role": "user",
+                "content": self.batch_user_prompt_template.format(assets=asset_lines)
+            }
+        ]
+
+        response = await self.client.chat.completions.create(
+            extra_body={
+                    "search_domain_filter": [
+                        "tradingview.com",
+                    ]
+                },
+            model=self.model,
+            messages=messages,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"schema": AssetDataBatch.model_json_schema()}
+            }
+        )
+
+        content = response.choices[0].message.content
+        try:
+            entries = json.loads(content)["assets"]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logger.error(f"Invalid batch response for {', '.join(assets)}: {str(e)}")
+            return {}
+
+        requested = {symbol.upper(): symbol for symbol in assets}
+        details = {}
+        for entry in entries if isinstance(entries, list) else []:
+            try:
+                asset_details = SymbolAssetData(**entry)
+            except Exception as e:
+                logger.warning(f"Skipping malformed entry in batch response: {str(e)}")
+                continue
+            symbol = requested.get(asset_details.symbol.strip().upper())
+            if symbol is not None:
+                details[symbol] = asset_details.model_dump(exclude={"symbol"})
+        return details
+
+    async def _fetch_asset_details_batch_bounded(self, semaphore: asyncio.Semaphore, assets: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch one batch while holding a concurrency slot; a failed batch yields no details."""
+        async def bounded_fetch():
+            async with semaphore:
+                return await asyncio.wait_for(
+                    self._fetch_asset_details_batch(assets),
+                    timeout=self.batch_timeout_seconds
+                )
+
+        key = single_flight.make_key("market_data_batch", self.model, sorted(assets))
+        try:
+            return await single_flight.do(key, bounded_fetch)
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out after {self.batch_timeout_seconds}s fetching batch: {', '.join(assets)}")
+        except Exception as e:
+            logger.error(f"Error fetching batch {', '.join(assets)}: {str(e)}")
+        return {}
+
+    async def _fetch_many(self, assets: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Fetch details for every asset, in batches of batch_size where possible.
+
+        Returns:
+            Dict[str, Any]: Details, or the exception that prevented them, keyed by symbol
+        """
+        semaphore = asyncio.Semaphore(self.refresh_max_concurrency)
+        symbols = list(assets.keys())
+        results: Dict[str, Any] = {}
+
+        if self.batch_size > 1 and len(symbols) > 1:
+            chunks = [symbols[i:i + self.batch_size] for i in range(0, len(symbols), self.batch_size)]
+            # A lone leftover symbol goes through the per-symbol prompt below
+            chunks = [chunk for chunk in chunks if len(chunk) > 1]
+            batches = await asyncio.gather(
+                *(self._fetch_asset_details_batch_bounded(semaphore, {symbol: assets[symbol] for symbol in chunk}) for chunk in chunks)
+            )
+            for batch in batches:
+                results.update(batch)
+            if len(results) < len(symbols):
+                logger.info(f"Batch responses covered {len(results)} of {len(symbols)} symbols, fetching the rest one by one")
+
+        # Single symbols, and symbols missing from or malformed in a batch answer
+        remaining = [symbol for symbol in symbols if symbol not in results]
+        singles = await asyncio.gather(
+            *(self._fetch_asset_details_bounded(semaphore, symbol, assets[symbol]) for symbol in remaining),
+            return_exceptions=True
+        )
+        results.update(zip(remaining, singles))
+        return results
+
+    def _dated_prices(self, symbol: str, asset_details: Dict[str, Any], as_of: date) -> List[Tuple[str, float]]:
+        """Daily closes from the API answer: the price history before as_of plus the current price."""
+        price_history = asset_details["price_history"]
+        if not isinstance(price_history, list) or not all(isinstance(price, (int, float)) for price in price_history):
+            logger.warning(f"Invalid price history format from API for {symbol}, storing only the current price")
+            price_history = []
+        elif len(price_history) != 6:
+            logger.warning(f"Expected 6 prices in the price history for {symbol}, got {len(price_history)}")
+        return dated_history(price_history, asset_details["price"], as_of)
+
+    def _store_snapshots(self, updates: Dict[str, Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        Upsert fresh snapshots, keyed by symbol with (name, details) values, in a single transaction.
+
+        Prices go to the price_points series; the snapshot's own price_history column is
+        kept only for schema compatibility.
+        """
+        if not updates:
+            return
+        try:
+            now = datetime.now(timezone.utc)
+            with db_transaction() as conn:
+                params = []
+                for symbol, (name, asset_details) in updates.items():
+                    append_prices(conn, symbol, self._dated_prices(symbol, asset_details, now.date()), as_of=now.date())
+                    params.append((
+                        symbol,
+                        name,
+                        asset_details["price"],
+                        asset_details["movement"],
+                        asset_details["reason"],
+                        asset_details["sector"],
+                        asset_details["news"],
+                        now
+                    ))
+
+                conn.executemany("""
+                    INSERT INTO market_snapshots (
+                        symbol, name, price, movement, reason, sector, news, price_history, last_updated
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, '[]', ?)
+                    ON CONFLICT(symbol) DO UPDATE SET
+                        name = excluded.name,
+                        price = excluded.price,
+                        movement = excluded.movement,
+                        reason = excluded.reason,
+                        sector = excluded.sector,
+                        news = excluded.news,
+                        last_updated = excluded.last_updated
+                """, params)
+            logger.info(f"Successfully stored market snapshots for symbols: {', '.join(updates.keys())}")
+
+        except Exception as e:
+            logger.error(f"Error storing market snapshots for symbols {', '.join(updates.keys())}: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Failed to update asset details: {str(e)}")
+
+    async def refresh_symbols(self, assets: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch fresh snapshots for the given symbols and persist them in one transaction.
+
+        Several symbols are fetched in batched requests of batch_size, with per-symbol
+        calls as the fallback.
+
+        Args:
+            assets (Dict[str, str]): Asset names keyed by symbol
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Stored snapshots keyed by symbol, only for successful fetches
+        """
+        if not assets:
+            return {}
+
+        results = await self._fetch_many(assets)
+
+        updates = {}
+        for symbol, result in results.items():
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to refresh market data for {symbol}: {str(result)}")
+                continue
+            # Checked before the shared transaction, so one bad answer cannot roll back the others
+            try:
+                details = AssetData(**result).model_dump()
+            except Exception as e:
+                logger.error(f"Failed to refresh market data for {symbol}, malformed details: {str(e)}")
+                continue
+            updates[symbol] = (assets[symbol], details)
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._store_snapshots, updates)
+        return await loop.run_in_executor(None, self.load_snapshots, list(updates.keys()))
+
+    async def get_snapshots(self, assets: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get snapshots for the given symbols, refreshing missing or stale ones once per TTL.
+
+        Symbols whose refresh fails are returned with their stale snapshot if one exists,
+        and omitted otherwise.
+
+        Args:
+            assets (Dict[str, str]): Asset names keyed by symbol
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Snapshots keyed by symbol
+        """
+        for symbol in assets:
+            access_tracker.record("market_data", symbol)
+
+        loop = asyncio.get_event_loop()
+        snapshots = await loop.run_in_executor(None, self.load_snapshots, list(assets.keys()))
+
+        stale = {}
+        for symbol, name in assets.items():
+            snapshot = snapshots.get(symbol)
+            if snapshot is None:
+                logger.info(f"Cache MISS: No market snapshot for {symbol}, fetching from API")
+                record_cache("asset_snapshot", "miss")
+                stale[symbol] = name
+            elif not self.is_fresh(snapshot):
+                logger.info(f"Cache MISS: Market snapshot for {symbol} is stale (last updated: {snapshot['last_updated']}), refreshing from API")
+                record_cache("asset_snapshot", "stale")
+                stale[symbol] = snapshot["name"]
+            else:
+                record_cache("asset_snapshot", "hit")
+                logger.debug(f"Cache HIT: Market snapshot for {symbol} is fresh (last updated: {snapshot['last_updated']})")
+
+        if stale:
+            refreshed = await self.refresh_symbols(stale)
+            snapshots.update(refreshed)
+            logger.info(f"Refreshed {len(refreshed)} of {len(stale)} stale market snapshots (Cache hits: {len(assets) - len(stale)})")
+        return snapshots
+
+    async def expiring_symbols(self, symbols: List[str], margin: timedelta) -> Dict[str, str]:
+        """Return names keyed by symbol for stored snapshots that go stale within margin."""
+        loop = asyncio.get_event_loop()
+        snapshots = await loop.run_in_executor(None, self.load_snapshots, symbols)
+        return {
+            symbol: snapshot["name"]
+            for symbol, snapshot in snapshots.items()
+            if not self.is_fresh(snapshot, margin)
+        }
+
+    async def get_snapshot(self, symbol: str, name: str, force_refresh: bool = False) -> Dict[str, Any]:
+        """Get the snapshot for one symbol, raising if no data could be obtained."""
+        if force_refresh:
+            snapshots = await self.refresh_symbols({symbol: name})
+        else:
+            snapshots = await self.get_snapshots({symbol: name})
+        snapshot = snapshots.get(symbol)
+        if snapshot is None:
+            raise HTTPException(status_code=500, detail=f"Failed to fetch asset details for {symbol}")
+        return snapshot
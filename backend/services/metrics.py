@@ -0,0 +1,114 @@
+"""
+Process-wide Prometheus metrics, exposed on /metrics.
+
+Besides the metrics themselves, this module keeps a per-request stage breakdown in a
+context variable: record_stage adds time spent in a stage (database, upstream, ...) to
+the request being served, which the HTTP middleware can return as a Server-Timing
+header in debug mode.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from typing import Dict, List, Optional
+from prometheus_client import Counter, Gauge, Histogram
+import threading
+
+# Upstream answers take seconds, deep research minutes
+UPSTREAM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+# Statements and waits on the local database are expected to take milliseconds
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Sonar call latency per attempt (time to headers for streams)",
+    ["service", "model", "outcome"], buckets=UPSTREAM_BUCKETS,
+)
+UPSTREAM_QUEUE_SECONDS = Histogram(
+    "upstream_queue_duration_seconds", "Time waiting for an LLM gateway slot and rate-limit token",
+    ["service", "model"], buckets=UPSTREAM_BUCKETS,
+)
+UPSTREAM_TOKENS = Counter(
+    "upstream_tokens_total", "Tokens reported by Sonar", ["service", "model", "kind"],
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    "upstream_requests_in_flight", "Sonar requests holding an LLM gateway slot", ["model"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit, stale or miss)", ["cache", "result"],
+)
+DB_STATEMENT_SECONDS = Histogram(
+    "sqlite_statement_duration_seconds", "Time to execute a statement (first step for queries)",
+    ["operation"], buckets=DB_BUCKETS,
+)
+DB_CONNECTION_SECONDS = Histogram(
+    "sqlite_connection_duration_seconds", "Time a pooled connection is held, including fetching rows",
+    ["mode"], buckets=DB_BUCKETS,
+)
+DB_WRITE_LOCK_WAIT_SECONDS = Histogram(
+    "sqlite_write_lock_wait_seconds", "Time writers wait for the process-wide write lock",
+    buckets=DB_BUCKETS,
+)
+EXECUTOR_QUEUE_DEPTH = Gauge(
+    "executor_queue_depth", "Work items waiting for a thread", ["pool"],
+)
+EXECUTOR_THREADS = Gauge(
+    "executor_threads", "Threads started by the pool", ["pool"],
+)
+
+# stage -> [total seconds, count] for the request being served, None outside requests
+_stages: ContextVar[Optional[Dict[str, List[float]]]] = ContextVar("request_stages", default=None)
+_stages_lock = threading.Lock()
+
+
+def start_request_stages() -> Dict[str, List[float]]:
+    """Begin collecting stage timings for the current request."""
+    stages: Dict[str, List[float]] = {}
+    _stages.set(stages)
+    return stages
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add time spent in a stage to the current request, if there is one."""
+    stages = _stages.get()
+    if stages is None:
+        return
+    # Executor threads of the same request may record at the same time
+    with _stages_lock:
+        totals = stages.setdefault(stage, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+
+def record_cache(cache: str, result: str) -> None:
+    """Count a cache lookup; result is "hit", "stale" or "miss"."""
+    CACHE_REQUESTS.labels(cache=cache, result=result).inc()
+
+
+def server_timing(stages: Dict[str, List[float]], total_seconds: float) -> str:
+    """Format stage timings as a Server-Timing header value, durations in milliseconds."""
+    entries = [f"total;dur={total_seconds * 1000:.1f}"]
+    with _stages_lock:
+        for stage, (seconds, count) in sorted(stages.items()):
+            entries.append(f'{stage};dur={seconds * 1000:.1f};desc="{count}x"')
+    return ", ".join(entries)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    Thread pool that runs work in the submitter's context, like asyncio.to_thread.
+
+    loop.run_in_executor does not carry context variables into the thread; this pool
+    does, so database time spent in a worker is attributed to the request that asked for it.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(copy_context().run, fn, *args, **kwargs)
+
+
+def track_executor(pool: str, executor: ThreadPoolExecutor) -> None:
+    """Report an executor's queue depth and thread count on every scrape."""
+    # ThreadPoolExecutor keeps pending work in _work_queue and started threads in _threads
+    EXECUTOR_QUEUE_DEPTH.labels(pool=pool).set_function(lambda: executor._work_queue.qsize())
+    EXECUTOR_THREADS.labels(pool=pool).set_function(lambda: len(executor._threads))
@@ -1,15 +1,21 @@
-from openai import AsyncOpenAI
-import os
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Set
 from fastapi import HTTPException
+import hashlib
 import logging
 import json
 import yaml
 from pathlib import Path
 from pydantic import BaseModel
-from datetime import datetime, timezone
-import sqlite3
+from datetime import timedelta
 import asyncio
+from services.single_flight import single_flight
+from services.access_tracker import access_tracker
+from services.response_cache import response_cache
+from services.metrics import record_cache
+from services.structured_logging import bind_log_context, log_payload, preview
+from database import db_connection, init_db
+from queries import TRACKED_ASSETS_WITH_MARKET_DATA
+from services.llm_gateway import llm_gateway
 
 # Configure logging
 logging.basicConfig(
@@ -36,27 +42,14 @@ class NewsResponse(BaseModel):
 class NewsService:
     def __init__(self):
         logger.info("Initializing NewsService")
-        try:
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("PERPLEXITY_API_KEY"),
-                base_url="https://api.perplexity.ai",
-            )
-            logger.info("AsyncOpenAI client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize AsyncOpenAI client: {str(e)}")
-            raise
+        # Upstream calls share the gateway's connection pool, concurrency budget and retries
+        self.client = llm_gateway.client("news")
 
         self.model = "sonar-pro"
+        # Keeps stale-while-revalidate refreshes referenced until they finish
+        self._background_refreshes: Set[asyncio.Task] = set()
 
-        try:
-            db_path = "finsight.db"
-            logger.info(f"NewsService is connecting to database at: {os.path.abspath(db_path)}")
-            self.conn = sqlite3.connect(db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row # To access columns by name
-            logger.info(f"Successfully connected to database at {db_path}")
-        except Exception as e:
-            logger.error(f"Failed to connect to database: {str(e)}")
-            self.conn = None # Allow service to run but log error; or raise
+        init_db()
 
         # Load prompts from YAML
         try:
@@ -70,49 +63,36 @@ class NewsService:
                 self.user_prompt_template = prompts["news_service"][
                     "user_prompt_template"
                 ]
+                cache_settings = prompts["news_service"].get("cache", {})
+                self.cache_refresh_interval = timedelta(
+                    hours=float(cache_settings.get("refresh_interval_hours", 6))
+                )
+                self.cache_stale_while_revalidate = timedelta(
+                    hours=float(cache_settings.get("stale_while_revalidate_hours", 48))
+                )
             logger.info("Successfully loaded prompts from YAML")
         except Exception as e:
             logger.error(f"Failed to load prompts from YAML: {str(e)}")
             raise
-        
-        # Cache setup
-        self.CACHE_DIR = Path(__file__).parent.parent / "cache"
-        # self.CACHE_FILE = self.CACHE_DIR / "news_cache.json" # Removed: Will be user-specific
-        try:
-            self.CACHE_DIR.mkdir(parents=True, exist_ok=True)
-            logger.info(f"Cache directory ensured at: {self.CACHE_DIR}")
-        except Exception as e:
-            logger.error(f"Failed to create cache directory {self.CACHE_DIR}: {str(e)}")
-            # Depending on desired behavior, you might want to raise an error here
-            # or allow the service to run without caching if directory creation fails.
 
     async def _get_tracked_assets(self, user_id: str) -> List[Dict[str, Any]]:
         """Fetch tracked assets for a given user from the database."""
-        if not self.conn:
-            logger.error("Database connection not available, cannot fetch tracked assets.")
-            return []
         try:
             # Run synchronous DB call in a thread pool
             def db_call():
-                cursor = self.conn.execute("SELECT symbol, name, price, price_history, movement FROM tracked_assets WHERE user_id = ?", (user_id,))
-                fetched_rows = cursor.fetchall()
-                assets = []
-                for row in fetched_rows:
-                    asset_data = {
-                        "symbol": row["symbol"], 
+                # Market data is read from the shared per-symbol snapshots, not the user's rows
+                with db_connection() as conn:
+                    cursor = conn.execute(TRACKED_ASSETS_WITH_MARKET_DATA, (user_id,))
+                    fetched_rows = cursor.fetchall()
+                assets = [
+                    {
+                        "symbol": row["symbol"],
                         "name": row["name"],
                         "price": row["price"],
                         "movement": row["movement"]
                     }
-                    try:
-                        asset_data["price_history"] = json.loads(row["price_history"]) if row["price_history"] else []
-                    except json.JSONDecodeError:
-                        logger.warning(f"Failed to parse price_history for asset {row['symbol']}. Setting to empty list.")
-                        asset_data["price_history"] = []
-                    except TypeError: 
-                        logger.warning(f"price_history for asset {row['symbol']} is None or not a string. Setting to empty list.")
-                        asset_data["price_history"] = []
-                    assets.append(asset_data)
+                    for row in fetched_rows
+                ]
                 return assets
 
             loop = asyncio.get_event_loop()
@@ -124,58 +104,56 @@ class NewsService:
             logger.error(f"Error fetching tracked assets for user_id {user_id}: {str(e)}")
             return []
 
-    def _get_cache_file_for_user(self, user_id: str) -> Path:
-        return self.CACHE_DIR / f"news_cache_{user_id}.json"
-
-    async def _load_from_cache(self, requested_topics: str, user_id: str) -> Dict[str, Any] | None:
-        cache_file = self._get_cache_file_for_user(user_id)
-        logger.info(f"Attempting to load news from cache for user \'{user_id}\' from \'{cache_file}\' for topics: {requested_topics}")
-        if not cache_file.exists():
-            logger.info(f"Cache file \'{cache_file}\' does not exist for user \'{user_id}\'.")
-            return None
-        try:
-            # Run synchronous file I/O in a thread pool
-            def file_read():
-                with open(cache_file, "r") as f:
-                    return json.load(f)
-            
-            loop = asyncio.get_event_loop()
-            cache_content = await loop.run_in_executor(None, file_read)
-            
-            if not (isinstance(cache_content, dict) and \
-                    "news_data" in cache_content and \
-                    "topics_cached_for" in cache_content):
-                logger.warning(f"Cache file \'{cache_file}\' for user \'{user_id}\' has invalid structure. Ignoring cache.")
-                return None
-
-            logger.info(f"Successfully loaded news from cache for user \'{user_id}\' (cached for topics: \'{cache_content.get('topics_cached_for')}\')")
-            return cache_content["news_data"]
-        except json.JSONDecodeError:
-            logger.warning(f"Failed to decode JSON from cache file \'{cache_file}\' for user \'{user_id}\'. Ignoring cache.")
-            return None
-        except Exception as e:
-            logger.error(f"Error loading from cache for user \'{user_id}\' from \'{cache_file}\': {str(e)}")
-            return None
-
-    async def _save_to_cache(self, data: Dict[str, Any], topics_for_cache: str, user_id: str):
-        cache_file = self._get_cache_file_for_user(user_id)
-        logger.info(f"Saving news to cache for user \'{user_id}\' at \'{cache_file}\' for topics: {topics_for_cache}")
-        cache_content = {
-            "cached_at_iso": datetime.now(timezone.utc).isoformat(),
-            "topics_cached_for": topics_for_cache,
-            "news_data": data 
-        }
-        try:
-            # Run synchronous file I/O in a thread pool
-            def file_write():
-                with open(cache_file, "w") as f:
-                    json.dump(cache_content, f, indent=4)
-            
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, file_write)
-            logger.info(f"Successfully saved news to cache for user \'{user_id}\' at {cache_file}.")
-        except Exception as e:
-            logger.error(f"Error saving to cache for user \'{user_id}\' at \'{cache_file}\': {str(e)}")
+    @staticmethod
+    def _normalize_topics(topics: str) -> str:
+        """Order- and case-insensitive form of a comma separated topic list."""
+        normalized = {" ".join(topic.split()).lower() for topic in (topics or "").split(",")}
+        return ", ".join(sorted(topic for topic in normalized if topic))
+
+    @staticmethod
+    def _assets_fingerprint(tracked_assets: List[Dict[str, Any]]) -> str:
+        """Short hash of the tracked symbols, so news is refetched when the portfolio changes."""
+        symbols = sorted({asset["symbol"].upper() for asset in tracked_assets})
+        return hashlib.sha1(",".join(symbols).encode()).hexdigest()[:16]
+
+    def _cache_key(self, user_id: str, topics: str, model: str, tracked_assets: List[Dict[str, Any]]) -> tuple:
+        return (user_id, self._normalize_topics(topics), model, self._assets_fingerprint(tracked_assets))
+
+    async def needs_refresh(self, user_id: str, topics: str, model: str, margin: timedelta) -> bool:
+        """Whether the user's cached news for topics and model is missing or due for a refresh within margin."""
+        tracked_assets = await self._get_tracked_assets(user_id)
+        entry = await response_cache.get("news", self._cache_key(user_id, topics, model, tracked_assets))
+        return entry is None or entry.expires_within(margin)
+
+    async def refresh_news(self, user_id: str, topics: str, model: str = "sonar-pro") -> Dict[str, Any]:
+        """Fetch fresh news for the user and topics and store it in the cache."""
+        tracked_assets = await self._get_tracked_assets(user_id)
+        return await self._refresh(user_id, topics, model, tracked_assets)
+
+    async def _refresh(self, user_id: str, topics: str, model: str, tracked_assets: List[Dict[str, Any]]) -> Dict[str, Any]:
+        cache_key = self._cache_key(user_id, topics, model, tracked_assets)
+        # Concurrent identical requests (e.g. a double-clicked force_reload) share one completion
+        key = single_flight.make_key("news", *cache_key)
+        return await single_flight.do(key, lambda: self._fetch_fresh_news(topics, user_id, model, tracked_assets))
+
+    def _refresh_in_background(self, user_id: str, topics: str, model: str, tracked_assets: List[Dict[str, Any]]):
+        """Revalidate a stale entry without making the caller wait."""
+        def on_done(task: asyncio.Task):
+            self._background_refreshes.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"Background news refresh failed for user '{user_id}': {str(task.exception())}")
+
+        task = asyncio.ensure_future(self._refresh(user_id, topics, model, tracked_assets))
+        self._background_refreshes.add(task)
+        task.add_done_callback(on_done)
+
+    async def _save_to_cache(self, data: Dict[str, Any], topics: str, user_id: str, model: str,
+                             tracked_assets: List[Dict[str, Any]]):
+        logger.info(f"Saving news to cache for user '{user_id}' for topics: {topics}, model: {model}")
+        await response_cache.set(
+            "news", self._cache_key(user_id, topics, model, tracked_assets), data,
+            ttl=self.cache_refresh_interval, stale_ttl=self.cache_stale_while_revalidate
+        )
 
     def _extract_valid_json(self, response_dict: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -262,7 +240,7 @@ class NewsService:
             user_content = self.user_prompt_template.format(focus_topics=focus_topics, tracked_assets_info=assets_str)
             
             messages.append({"role": "user", "content": user_content})
-            logger.debug(f"Created messages: {json.dumps(messages, indent=2)}")
+            log_payload(logger, "Created messages", messages)
             return messages
         except Exception as e:
             logger.error(f"Error creating messages: {str(e)}")
@@ -276,11 +254,7 @@ class NewsService:
         api_response = None
         try:
             if model == "sonar-pro":
-                logger.debug(
-                    f"Sending request to API with messages: {json.dumps(messages, indent=2)}, model: {model}"
-                )
-
-                print("messages:", messages)
+                log_payload(logger, f"Sending request to {model} with messages", messages)
                 self.model = "sonar-pro"
                 response = await self.client.chat.completions.create(
                     extra_body={
@@ -306,17 +280,11 @@ class NewsService:
                 )
                 logger.info("Successfully received response from API")
                 response_dict = response.model_dump(exclude_none=True)
-                logger.debug(
-                    f"API response dictionary: {json.dumps(response_dict, indent=2)}"
-                )
+                log_payload(logger, "API response", response_dict)
 
-                parsed_json_content = self._extract_valid_json(response_dict)
-                print("sonar pro parsed_json_content:", parsed_json_content)
-                return parsed_json_content
+                return self._extract_valid_json(response_dict)
             else:
-                logger.debug(
-                    f"Sending request to API with messages: {json.dumps(messages, indent=2)}, model: {model}"
-                )
+                log_payload(logger, f"Sending request to {model} with messages", messages)
                 self.model = "sonar-deep-research"
                 api_response = await self.client.chat.completions.create(
                     extra_body={"return_images": True},
@@ -330,12 +298,9 @@ class NewsService:
                 logger.info("Successfully received response from API")
 
                 api_response_dict = api_response.model_dump(exclude_none=True)
-                logger.debug(
-                    f"API response dictionary: {json.dumps(api_response_dict, indent=2)}"
-                )
+                log_payload(logger, "API response", api_response_dict)
 
                 parsed_json_content = self._extract_valid_json(api_response_dict)
-                print("deep research parsed_json_content:", parsed_json_content)
 
                 logger.info("Successfully extracted and parsed JSON content.")
                 return parsed_json_content
@@ -351,12 +316,14 @@ class NewsService:
             except Exception:
                 pass
             logger.error(
-                f"Raw response content that failed parsing: {raw_content_for_logging}"
+                f"Raw response content that failed parsing: {preview(raw_content_for_logging)}"
             )
             raise HTTPException(
                 status_code=500,
                 detail=f"Invalid or malformed JSON response from Sonar API: {str(ve)}, model: {model}",
             )
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error in completion response: {str(e)}")
             raise HTTPException(
@@ -366,35 +333,48 @@ class NewsService:
     async def process_news_request(
         self, topics: str, user_id: str, model: str = "sonar-pro", force_reload: bool = False
     ) -> Dict[str, Any]:
+        bind_log_context(news_model=model)
         logger.info(
             f"Processing news request for user '{user_id}', topics: '{topics}', model: {model}, force_reload: {force_reload}"
         )
 
+        access_tracker.record("news", (user_id, self._normalize_topics(topics), model))
+        tracked_assets = await self._get_tracked_assets(user_id)
+
         if not force_reload:
-            cached_news_data = await self._load_from_cache(requested_topics=topics, user_id=user_id)
-            if cached_news_data:
+            entry = await response_cache.get("news", self._cache_key(user_id, topics, model, tracked_assets))
+            if entry is not None:
                 try:
-                    NewsResponse(**cached_news_data) 
-                    logger.info(f"Returning news from cache for user '{user_id}'.")
-                    return {"news_data": cached_news_data, "retrieved_from_cache": True}
+                    NewsResponse(**entry.value)
+                    record_cache("news", "hit" if entry.is_fresh else "stale")
+                    if entry.is_fresh:
+                        logger.info(f"Returning news from cache for user '{user_id}'.")
+                    else:
+                        logger.info(f"Returning stale news for user '{user_id}' (age: {entry.age}) and refreshing it in the background.")
+                        self._refresh_in_background(user_id, topics, model, tracked_assets)
+                    return {"news_data": entry.value, "retrieved_from_cache": True, "is_stale": not entry.is_fresh}
                 except Exception as e: 
                     logger.warning(f"Cached data for user '{user_id}' is not valid NewsResponse structure: {e}. Fetching fresh data.")
+            record_cache("news", "miss")
 
         logger.info(f"Cache miss for user '{user_id}', invalid cache, or force_reload=True. Fetching fresh news for topics: {topics}.")
         try:
-            tracked_assets = await self._get_tracked_assets(user_id)
-            messages = self._create_messages(topics, tracked_assets)
-            logger.info(f"Messages created successfully for API call for user '{user_id}'.")
-
-            result = await self._handle_completion_response(messages, model)
-            logger.info(f"Successfully received news from API for user '{user_id}'.")
-            
-            await self._save_to_cache(result, topics_for_cache=topics, user_id=user_id)
-            
-            return {"news_data": result, "retrieved_from_cache": False}
+            result = await self._refresh(user_id, topics, model, tracked_assets)
+            return {"news_data": result, "retrieved_from_cache": False, "is_stale": False}
 
         except HTTPException: 
             raise 
         except Exception as e:
             logger.error(f"Critical error processing news request for user '{user_id}': {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to process news request for user '{user_id}': {str(e)}")
+
+    async def _fetch_fresh_news(self, topics: str, user_id: str, model: str, tracked_assets: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Fetch news from the API for the user's tracked assets and store it in the cache."""
+        messages = self._create_messages(topics, tracked_assets)
+        logger.info(f"Messages created successfully for API call for user '{user_id}'.")
+
+        result = await self._handle_completion_response(messages, model)
+        logger.info(f"Successfully received news from API for user '{user_id}'.")
+        
+        await self._save_to_cache(result, topics, user_id, model, tracked_assets)
+        return result
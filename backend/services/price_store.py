@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import sqlite3
+from queries import PRICE_SERIES_FOR_SYMBOLS, RECENT_CLOSES, in_placeholders
+
+# One daily close per (symbol, date) in the price_points table, dates as ISO strings
+PricePointRow = Tuple[str, float]
+
+def last_trading_day(day: date) -> date:
+    """day itself on a weekday, otherwise the Friday before it."""
+    return day - timedelta(days=max(day.weekday() - 4, 0))
+
+def trading_days_before(day: date, count: int) -> List[date]:
+    """The count weekdays before day, oldest first."""
+    days = []
+    while len(days) < count:
+        day -= timedelta(days=1)
+        if day.weekday() < 5:
+            days.append(day)
+    return days[::-1]
+
+def dated_history(price_history: Sequence[float], price: float, as_of: date) -> List[PricePointRow]:
+    """
+    Date a snapshot's price list: price_history holds the closes of the trading days
+    before as_of, oldest first, and price is the price on as_of.
+
+    Closes are placed on weekdays (a weekend as_of counts as the Friday before).
+    Exchange holidays are not known here, so around them the history lands one
+    trading day off; it is stored append-only and never replaces an existing close.
+    """
+    current_day = last_trading_day(as_of)
+    points = [
+        (day.isoformat(), float(close))
+        for day, close in zip(trading_days_before(current_day, len(price_history)), price_history)
+    ]
+    points.append((current_day.isoformat(), float(price)))
+    return points
+
+def append_prices(conn: sqlite3.Connection, symbol: str, points: Iterable[PricePointRow],
+                  as_of: Optional[date] = None) -> None:
+    """
+    Add daily closes for a symbol on the given connection, inside the caller's transaction.
+
+    The series is append-only: closes dated before as_of are only added for dates not
+    stored yet. Closes on or after as_of, the day still trading, take the latest value.
+    Without as_of every date is append-only.
+    """
+    current = last_trading_day(as_of).isoformat() if as_of else None
+    rows = [(symbol, point_date, close) for point_date, close in points]
+    conn.executemany("""
+        INSERT INTO price_points (symbol, date, close) VALUES (?, ?, ?)
+        ON CONFLICT (symbol, date) DO NOTHING
+    """, [row for row in rows if current is None or row[1] < current])
+    if current is not None:
+        conn.executemany("""
+            INSERT INTO price_points (symbol, date, close) VALUES (?, ?, ?)
+            ON CONFLICT (symbol, date) DO UPDATE SET close = excluded.close
+        """, [row for row in rows if row[1] >= current])
+
+def load_series(conn: sqlite3.Connection, symbols: Iterable[str], start: Optional[date] = None,
+                end: Optional[date] = None) -> Dict[str, List[PricePointRow]]:
+    """Closes of several symbols from start up to and including end in one query, oldest first."""
+    symbols = list(dict.fromkeys(symbols))
+    series = {symbol: [] for symbol in symbols}
+    if not symbols:
+        return series
+    cursor = conn.execute(
+        PRICE_SERIES_FOR_SYMBOLS.format(placeholders=in_placeholders(len(symbols))),
+        (*symbols, start.isoformat() if start else "", end.isoformat() if end else "9999-12-31"),
+    )
+    for row in cursor.fetchall():
+        series[row[0]].append((row[1], row[2]))
+    return series
+
+def load_recent_closes(conn: sqlite3.Connection, symbols: Iterable[str], limit: int,
+                       before: Optional[date] = None) -> Dict[str, List[float]]:
+    """The last limit closes of each symbol before a date (all dates if None), oldest first."""
+    cutoff = before.isoformat() if before else "9999-12-31"
+    closes = {}
+    for symbol in dict.fromkeys(symbols):
+        cursor = conn.execute(RECENT_CLOSES, (symbol, cutoff, limit))
+        closes[symbol] = [row[0] for row in reversed(cursor.fetchall())]
+    return closes
+
+def downsample(points: Sequence[PricePointRow], max_points: int) -> List[PricePointRow]:
+    """
+    Reduce a series to at most max_points for sparklines.
+
+    Points are grouped into equal buckets and each bucket is represented by its mean
+    close at its last date, so the final point stays the most recent close.
+    """
+    if max_points <= 0 or len(points) <= max_points:
+        return list(points)
+    bucket_size = len(points) / max_points
+    sampled = []
+    for i in range(max_points):
+        bucket = points[int(round(i * bucket_size)):int(round((i + 1) * bucket_size))]
+        if bucket:
+            sampled.append((bucket[-1][0], sum(close for _, close in bucket) / len(bucket)))
+    # The latest close is shown exactly
+    sampled[-1] = points[-1]
+    return sampled
@@ -0,0 +1,247 @@
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Hashable, Optional
+from pathlib import Path
+from pydantic import BaseModel
+import asyncio
+import json
+import logging
+import threading
+import time
+import yaml
+from database import db_connection, db_transaction, init_db
+from queries import RESPONSE_CACHE_ENTRY
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry(BaseModel):
+    value: Any
+    stored_at: float
+    expires_at: float
+    evict_at: float
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def expires_within(self, margin: timedelta) -> bool:
+        return time.time() + margin.total_seconds() >= self.expires_at
+
+    @property
+    def age(self) -> timedelta:
+        return timedelta(seconds=time.time() - self.stored_at)
+
+
+class SQLiteCacheStore:
+    """
+    Durable cache tier in the response_cache table; every write is a single atomic upsert.
+
+    Size bounds are enforced every evict_every writes rather than on each one, so the
+    table may briefly hold up to that many rows over its bounds. Reads record the keys
+    they hit in memory; the access times are written with the next write, or once
+    touch_batch_size keys are pending, so a read does not take the write lock.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, evict_every: int = 100, touch_batch_size: int = 100):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evict_every = max(evict_every, 1)
+        self.touch_batch_size = max(touch_batch_size, 1)
+        # Counted inside the write transaction, which serializes writers process-wide
+        self._writes = 0
+        self._touched: Dict[str, float] = {}
+        self._touched_lock = threading.Lock()
+        init_db()
+
+    def get(self, cache_key: str) -> Optional[CacheEntry]:
+        now = time.time()
+        with db_connection() as conn:
+            row = conn.execute(RESPONSE_CACHE_ENTRY, (cache_key, now)).fetchone()
+        if row is None:
+            return None
+        return CacheEntry(
+            value=json.loads(row["value"]), stored_at=row["stored_at"],
+            expires_at=row["expires_at"], evict_at=row["evict_at"]
+        )
+
+    def set(self, cache_key: str, namespace: str, entry: CacheEntry) -> None:
+        value = json.dumps(entry.value, separators=(",", ":"))
+        now = time.time()
+        with db_transaction() as conn:
+            self._flush_touches(conn)
+            conn.execute("""
+                INSERT INTO response_cache (cache_key, namespace, value, size, stored_at, expires_at, evict_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (cache_key) DO UPDATE SET
+                    namespace = excluded.namespace,
+                    value = excluded.value,
+                    size = excluded.size,
+                    stored_at = excluded.stored_at,
+                    expires_at = excluded.expires_at,
+                    evict_at = excluded.evict_at,
+                    accessed_at = excluded.accessed_at
+            """, (cache_key, namespace, value, len(value), entry.stored_at, entry.expires_at, entry.evict_at, now))
+            self._writes += 1
+            if self._writes % self.evict_every == 0:
+                self._evict(conn, now)
+
+    def touch(self, cache_key: str) -> None:
+        """Mark a row as recently used so size eviction keeps it; written in batches."""
+        with self._touched_lock:
+            self._touched[cache_key] = time.time()
+            if len(self._touched) < self.touch_batch_size:
+                return
+        with db_transaction() as conn:
+            self._flush_touches(conn)
+
+    def _flush_touches(self, conn) -> None:
+        with self._touched_lock:
+            touched, self._touched = self._touched, {}
+        if touched:
+            conn.executemany(
+                "UPDATE response_cache SET accessed_at = ? WHERE cache_key = ?",
+                [(accessed_at, cache_key) for cache_key, accessed_at in touched.items()],
+            )
+
+    def delete(self, cache_key: str) -> None:
+        with db_transaction() as conn:
+            conn.execute("DELETE FROM response_cache WHERE cache_key = ?", (cache_key,))
+
+    def _evict(self, conn, now: float) -> None:
+        conn.execute("DELETE FROM response_cache WHERE evict_at <= ?", (now,))
+        count, total_size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache").fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+        # Drop least recently used rows until both bounds hold again
+        removed = 0
+        for cache_key, size in conn.execute(
+            "SELECT cache_key, size FROM response_cache ORDER BY accessed_at ASC"
+        ).fetchall():
+            if count <= self.max_entries and total_size <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM response_cache WHERE cache_key = ?", (cache_key,))
+            count -= 1
+            total_size -= size
+            removed += 1
+        logger.info(f"Evicted {removed} least recently used response cache rows")
+
+
+class ResponseCache:
+    """
+    Two-tier cache for upstream responses: an in-memory LRU in front of SQLite.
+
+    Entries live in a namespace whose version comes from config, so bumping the version
+    invalidates every entry of that namespace. Each entry is fresh for its ttl and then
+    kept as stale for stale_ttl (callers decide whether to serve stale data) before it
+    is evicted. Memory hits cost a dictionary lookup; misses fall through to SQLite,
+    off the event loop, and are promoted to memory. Cached values are shared between
+    callers and must not be mutated.
+    """
+
+    def __init__(self, store: Optional[SQLiteCacheStore] = None):
+        # Load settings from YAML
+        try:
+            config_path = Path(__file__).parent.parent / "config" / "response_cache.yaml"
+            with open(config_path, "r") as file:
+                settings = yaml.safe_load(file)["response_cache"]
+                self.memory_max_entries = int(settings.get("memory_max_entries", 1024))
+                disk_max_entries = int(settings.get("disk_max_entries", 10000))
+                disk_max_bytes = int(float(settings.get("disk_max_megabytes", 64)) * 1024 * 1024)
+                disk_evict_every = int(settings.get("disk_evict_every_writes", 100))
+                disk_touch_batch_size = int(settings.get("disk_touch_batch_size", 100))
+                self.namespace_versions = {name: int(version) for name, version in settings.get("namespaces", {}).items()}
+        except Exception as e:
+            logger.error(f"Failed to load response cache settings from YAML: {str(e)}")
+            raise
+
+        self._store = store
+        self._store_settings = (disk_max_entries, disk_max_bytes, disk_evict_every, disk_touch_batch_size)
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def store(self) -> SQLiteCacheStore:
+        # Created on first use so importing this module does not touch the database
+        if self._store is None:
+            self._store = SQLiteCacheStore(*self._store_settings)
+        return self._store
+
+    def make_key(self, namespace: str, key: Hashable) -> str:
+        """Versioned cache key; equal keys built from the same parts always match."""
+        version = self.namespace_versions.get(namespace, 1)
+        parts = key if isinstance(key, tuple) else (key,)
+        return f"{namespace}:v{version}:" + json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+
+    def _memory_get(self, cache_key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._memory.get(cache_key)
+            if entry is None:
+                return None
+            if time.time() >= entry.evict_at:
+                del self._memory[cache_key]
+                return None
+            self._memory.move_to_end(cache_key)
+            return entry
+
+    def _memory_set(self, cache_key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._memory[cache_key] = entry
+            self._memory.move_to_end(cache_key)
+            while len(self._memory) > self.memory_max_entries:
+                self._memory.popitem(last=False)
+
+    async def get(self, namespace: str, key: Hashable) -> Optional[CacheEntry]:
+        """Return the entry for key, fresh or stale, or None if there is none."""
+        cache_key = self.make_key(namespace, key)
+        entry = self._memory_get(cache_key)
+        if entry is not None:
+            return entry
+
+        loop = asyncio.get_event_loop()
+        try:
+            def disk_get():
+                found = self.store.get(cache_key)
+                if found is not None:
+                    self.store.touch(cache_key)
+                return found
+            entry = await loop.run_in_executor(None, disk_get)
+        except Exception as e:
+            logger.error(f"Error reading response cache entry {cache_key}: {str(e)}")
+            return None
+        if entry is not None:
+            self._memory_set(cache_key, entry)
+        return entry
+
+    async def set(self, namespace: str, key: Hashable, value: Any, ttl: timedelta,
+                  stale_ttl: timedelta = timedelta(0)) -> CacheEntry:
+        """Store value as fresh for ttl, then stale for stale_ttl."""
+        cache_key = self.make_key(namespace, key)
+        now = time.time()
+        expires_at = now + ttl.total_seconds()
+        entry = CacheEntry(value=value, stored_at=now, expires_at=expires_at, evict_at=expires_at + stale_ttl.total_seconds())
+        self._memory_set(cache_key, entry)
+
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, self.store.set, cache_key, namespace, entry)
+        except Exception as e:
+            # The memory tier still serves it; the next write retries the durable copy
+            logger.error(f"Error writing response cache entry {cache_key}: {str(e)}")
+        return entry
+
+    async def delete(self, namespace: str, key: Hashable) -> None:
+        cache_key = self.make_key(namespace, key)
+        with self._lock:
+            self._memory.pop(cache_key, None)
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.store.delete, cache_key)
+
+
+# Shared by all services so the memory tier is bounded process-wide
+response_cache = ResponseCache()
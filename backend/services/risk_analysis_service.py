@@ -1,5 +1,3 @@
-from openai import AsyncOpenAI
-import os
 from typing import Dict, Any, List
 from fastapi import HTTPException
 import logging
@@ -7,9 +5,16 @@ import json
 import yaml
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
-from models.risk_analysis import RiskAnalysisResponse, RiskFactors, PricePoint
-import sqlite3
+from models.risk_analysis import RiskAnalysisResponse, PortfolioRiskResponse, QualitativeRiskAssessment, RiskFactors, PricePoint
+from services.risk_metrics import RiskMetrics, compute_risk_metrics
+from services.market_data_service import MarketDataService
+from services.single_flight import single_flight
+from services.access_tracker import access_tracker
+from services.metrics import record_cache
+from database import db_connection, db_transaction, init_db
+from queries import LATEST_RISK_ANALYSES, TRACKED_SYMBOLS_FOR_USER, in_placeholders
 import asyncio
+from services.llm_gateway import llm_gateway
 
 # Configure logging
 logging.basicConfig(
@@ -20,27 +25,17 @@ logger = logging.getLogger(__name__)
 class RiskAnalysisService:
     def __init__(self):
         logger.info("Initializing RiskAnalysisService")
-        try:
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("PERPLEXITY_API_KEY"),
-                base_url="https://api.perplexity.ai",
-            )
-            logger.info("AsyncOpenAI client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize AsyncOpenAI client: {str(e)}")
-            raise
+        # Upstream calls share the gateway's connection pool, concurrency budget and retries
+        self.client = llm_gateway.client("risk_analysis")
 
         self.model = "sonar-pro"
+        # Stored analyses are reused for this long before a new one is requested
+        self.cache_ttl = timedelta(days=1)
 
-        try:
-            db_path = "finsight.db"
-            logger.info(f"RiskAnalysisService is connecting to database at: {os.path.abspath(db_path)}")
-            self.conn = sqlite3.connect(db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
-            logger.info(f"Successfully connected to database at {db_path}")
-        except Exception as e:
-            logger.error(f"Failed to connect to database: {str(e)}")
-            self.conn = None
+        init_db()
+
+        # Price data comes from the shared per-symbol market snapshots
+        self.market_data = MarketDataService()
 
         # Load prompts from YAML
         try:
@@ -52,6 +47,23 @@ class RiskAnalysisService:
                     "content": prompts["risk_analysis"]["system_prompt"],
                 }
                 self.user_prompt_template = prompts["risk_analysis"]["user_prompt_template"]
+                metrics_settings = prompts["risk_analysis"].get("metrics", {})
+                self.history_days = int(metrics_settings.get("history_days", 180))
+                self.prompt_history_points = int(metrics_settings.get("prompt_history_points", 10))
+                self.metrics_settings = {
+                    "periods_per_year": int(metrics_settings.get("periods_per_year", 252)),
+                    "volatility_cap": float(metrics_settings.get("volatility_cap", 0.8)),
+                    "trend_cap": float(metrics_settings.get("trend_cap", 0.2)),
+                    "dip_threshold": float(metrics_settings.get("dip_threshold_percent", 0)) / 100,
+                    "dip_window": int(metrics_settings.get("dip_window_days", 21)),
+                    "short_window": int(metrics_settings.get("short_moving_average_days", 5)),
+                    "long_window": int(metrics_settings.get("long_moving_average_days", 20)),
+                    "min_overlap": int(metrics_settings.get("min_overlap_days", 10)),
+                    "min_coverage": float(metrics_settings.get("sector_min_coverage_percent", 50)) / 100,
+                }
+                self.max_sector_peers = int(metrics_settings.get("max_sector_peers", 10))
+                portfolio_settings = prompts["risk_analysis"].get("portfolio", {})
+                self.portfolio_max_concurrency = int(portfolio_settings.get("max_concurrency", 4))
             logger.info("Successfully loaded prompts from YAML")
         except Exception as e:
             logger.error(f"Failed to load prompts from YAML: {str(e)}")
@@ -61,35 +73,45 @@ class RiskAnalysisService:
         """Store risk analysis results in the tracked_assets table."""
         try:
             def db_call():
-                self.conn.execute("""
-                    UPDATE tracked_assets 
-                    SET 
-                        risk_level = ?,
-                        volatility_score = ?,
-                        sector_trend_score = ?,
-                        dip_count_last_month = ?,
-                        sentiment_class = ?,
-                        volatility_breakdown = ?,
-                        sector_breakdown = ?,
-                        sentiment_breakdown = ?,
-                        risk_confidence = ?,
-                        risk_recommendation = ?,
-                        risk_analysis_updated_at = CURRENT_TIMESTAMP
-                    WHERE symbol = ?
-                """, (
-                    analysis.risk_level,
-                    analysis.factors.volatility_score,
-                    analysis.factors.sector_trend_score,
-                    analysis.factors.dip_count_last_month,
-                    analysis.factors.sentiment_class,
-                    analysis.risk_breakdown.volatility,
-                    analysis.risk_breakdown.sector,
-                    analysis.risk_breakdown.sentiment,
-                    analysis.confidence,
-                    analysis.recommendation,
-                    asset_symbol
-                ))
-                self.conn.commit()
+                with db_transaction() as conn:
+                    conn.execute("""
+                        UPDATE tracked_assets 
+                        SET 
+                            risk_level = ?,
+                            volatility_score = ?,
+                            sector_trend_score = ?,
+                            dip_count_last_month = ?,
+                            sentiment_class = ?,
+                            volatility_breakdown = ?,
+                            sector_breakdown = ?,
+                            sentiment_breakdown = ?,
+                            risk_confidence = ?,
+                            risk_recommendation = ?,
+                            realized_volatility = ?,
+                            max_drawdown = ?,
+                            sector_beta = ?,
+                            moving_average_short = ?,
+                            moving_average_long = ?,
+                            risk_analysis_updated_at = CURRENT_TIMESTAMP
+                        WHERE symbol = ?
+                    """, (
+                        analysis.risk_level,
+                        analysis.factors.volatility_score,
+                        analysis.factors.sector_trend_score,
+                        analysis.factors.dip_count_last_month,
+                        analysis.factors.sentiment_class,
+                        analysis.risk_breakdown.volatility,
+                        analysis.risk_breakdown.sector,
+                        analysis.risk_breakdown.sentiment,
+                        analysis.confidence,
+                        analysis.recommendation,
+                        analysis.factors.realized_volatility,
+                        analysis.factors.max_drawdown,
+                        analysis.factors.sector_beta,
+                        analysis.factors.moving_average_short,
+                        analysis.factors.moving_average_long,
+                        asset_symbol
+                    ))
 
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(None, db_call)
@@ -98,84 +120,82 @@ class RiskAnalysisService:
             logger.error(f"Failed to store risk analysis for {asset_symbol}: {str(e)}")
             raise HTTPException(status_code=500, detail="Failed to store risk analysis")
 
-    async def _get_latest_risk_analysis(self, asset_symbol: str) -> Dict[str, Any]:
-        """Get the latest risk analysis for an asset from tracked_assets table."""
+    @staticmethod
+    def _row_to_analysis(row) -> Dict[str, Any]:
+        return {
+            "asset_symbol": row["symbol"],
+            "asset_name": row["name"],
+            "risk_level": row["risk_level"],
+            "factors": {
+                "volatility_score": row["volatility_score"],
+                "sector_trend_score": row["sector_trend_score"],
+                "dip_count_last_month": row["dip_count_last_month"],
+                "sentiment_class": row["sentiment_class"],
+                "realized_volatility": row["realized_volatility"],
+                "max_drawdown": row["max_drawdown"],
+                "sector_beta": row["sector_beta"],
+                "moving_average_short": row["moving_average_short"],
+                "moving_average_long": row["moving_average_long"]
+            },
+            "risk_breakdown": {
+                "volatility": row["volatility_breakdown"],
+                "sector": row["sector_breakdown"],
+                "sentiment": row["sentiment_breakdown"]
+            },
+            "confidence": row["risk_confidence"],
+            "recommendation": row["risk_recommendation"],
+            "risk_analysis_updated_at": row["risk_analysis_updated_at"]
+        }
+
+    async def _get_latest_risk_analyses(self, asset_symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the stored risk analyses for several assets from the tracked_assets table in one query."""
+        if not asset_symbols:
+            return {}
         try:
             def db_call():
-                cursor = self.conn.execute("""
-                    SELECT 
-                        symbol,
-                        name,
-                        risk_level,
-                        volatility_score,
-                        sector_trend_score,
-                        dip_count_last_month,
-                        sentiment_class,
-                        volatility_breakdown,
-                        sector_breakdown,
-                        sentiment_breakdown,
-                        risk_confidence,
-                        risk_recommendation,
-                        risk_analysis_updated_at
-                    FROM tracked_assets 
-                    WHERE symbol = ?
-                """, (asset_symbol,))
-                row = cursor.fetchone()
-                if not row or not row["risk_level"]:
-                    return None
-                
-                return {
-                    "asset_symbol": row["symbol"],
-                    "asset_name": row["name"],
-                    "risk_level": row["risk_level"],
-                    "factors": {
-                        "volatility_score": row["volatility_score"],
-                        "sector_trend_score": row["sector_trend_score"],
-                        "dip_count_last_month": row["dip_count_last_month"],
-                        "sentiment_class": row["sentiment_class"]
-                    },
-                    "risk_breakdown": {
-                        "volatility": row["volatility_breakdown"],
-                        "sector": row["sector_breakdown"],
-                        "sentiment": row["sentiment_breakdown"]
-                    },
-                    "confidence": row["risk_confidence"],
-                    "recommendation": row["risk_recommendation"],
-                    "risk_analysis_updated_at": row["risk_analysis_updated_at"]
-                }
+                with db_connection() as conn:
+                    cursor = conn.execute(
+                        LATEST_RISK_ANALYSES.format(placeholders=in_placeholders(len(asset_symbols))), asset_symbols
+                    )
+                    return {row["symbol"]: self._row_to_analysis(row) for row in cursor.fetchall() if row["risk_level"]}
 
             loop = asyncio.get_event_loop()
             return await loop.run_in_executor(None, db_call)
         except Exception as e:
-            logger.error(f"Failed to get risk analysis for {asset_symbol}: {str(e)}")
-            return None
+            logger.error(f"Failed to get risk analyses for {', '.join(asset_symbols)}: {str(e)}")
+            return {}
 
-    async def _get_asset_data(self, asset_symbol: str) -> Dict[str, Any]:
-        """Fetch asset data from the database."""
-        if not self.conn:
-            logger.error("Database connection not available")
-            raise HTTPException(status_code=500, detail="Database connection not available")
+    async def _get_latest_risk_analysis(self, asset_symbol: str) -> Dict[str, Any]:
+        """Get the latest risk analysis for an asset from tracked_assets table."""
+        analyses = await self._get_latest_risk_analyses([asset_symbol])
+        return analyses.get(asset_symbol)
+
+    def _is_fresh(self, cached_analysis: Dict[str, Any], margin: timedelta = timedelta(0)) -> bool:
+        updated_at = datetime.fromisoformat(cached_analysis["risk_analysis_updated_at"].replace('Z', '+00:00')).replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - updated_at) < self.cache_ttl - margin
 
+    async def _get_asset_data(self, asset_symbol: str) -> Dict[str, Any]:
+        """Fetch asset data, and the price series of its sector peers, from the shared market snapshot store."""
         try:
             def db_call():
-                cursor = self.conn.execute(
-                    "SELECT symbol, name, price, price_history FROM tracked_assets WHERE symbol = ?",
-                    (asset_symbol,)
-                )
-                row = cursor.fetchone()
-                if not row:
+                snapshot = self.market_data.load_snapshot(asset_symbol)
+                if not snapshot:
                     return None
+                start = datetime.now(timezone.utc).date() - timedelta(days=self.history_days)
+                peers = self.market_data.load_sector_symbols(
+                    snapshot["sector"], exclude_symbol=asset_symbol, limit=self.max_sector_peers
+                )
+                series = self.market_data.load_price_series([asset_symbol] + peers, start=start)
                 
-                asset_data = {
-                    "symbol": row["symbol"],
-                    "name": row["name"],
-                    "price": row["price"]
+                return {
+                    "symbol": snapshot["symbol"],
+                    "name": snapshot["name"],
+                    "price": snapshot["price"],
+                    "sector": snapshot["sector"],
+                    # Dated daily closes, oldest first, ending with the snapshot's price
+                    "price_history": series.pop(asset_symbol) or [(str(snapshot["last_updated"])[:10], snapshot["price"])],
+                    "peer_price_histories": list(series.values())
                 }
-                try:
-                    asset_data["price_history"] = json.loads(row["price_history"]) if row["price_history"] else []
-                except (json.JSONDecodeError, TypeError):
-                    asset_data["price_history"] = []
-                return asset_data
 
             loop = asyncio.get_event_loop()
             asset_data = await loop.run_in_executor(None, db_call)
@@ -190,25 +210,51 @@ class RiskAnalysisService:
             logger.error(f"Error fetching asset data for {asset_symbol}: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
 
-    def _create_messages(self, asset_data: Dict[str, Any]) -> list:
-        """Create message list with system message and asset data."""
+    def _compute_metrics(self, asset_data: Dict[str, Any]) -> RiskMetrics:
+        """Numeric risk factors from the stored daily closes."""
+        return compute_risk_metrics(
+            asset_data["price_history"],
+            asset_data.get("peer_price_histories", []),
+            **self.metrics_settings
+        )
+
+    @staticmethod
+    def _format_metrics(metrics: RiskMetrics) -> str:
+        def fmt(value, percent=False):
+            if value is None:
+                return "n/a"
+            return f"{value * 100:.1f}%" if percent else f"{value:.2f}"
+
+        return (
+            f"Volatility score (0 to 1): {metrics.volatility_score:.2f}\n"
+            f"Annualized volatility: {fmt(metrics.realized_volatility, percent=True)}\n"
+            f"Max drawdown: {fmt(metrics.max_drawdown, percent=True)}\n"
+            f"Dips in the last month: {metrics.dip_count_last_month}\n"
+            f"Sector trend score (0 to 1): {metrics.sector_trend_score:.2f}\n"
+            f"Beta vs. sector: {fmt(metrics.sector_beta)}\n"
+            f"Short moving average: {fmt(metrics.moving_average_short)}\n"
+            f"Long moving average: {fmt(metrics.moving_average_long)}\n"
+        )
+
+    def _create_messages(self, asset_data: Dict[str, Any], metrics: RiskMetrics) -> list:
+        """Create message list with system message, asset data and the locally computed metrics."""
         logger.info(f"Creating messages for asset: {asset_data['symbol']}")
         try:
             messages = [self.system_message]
             
             # Format price history for the prompt
+            # The metrics cover the whole series; the most recent closes give the model context
             price_history_str = ""
-            if asset_data.get("price_history"):
-                today = datetime.now().date()
-                for i, price in enumerate(asset_data["price_history"]):
-                    date = today - timedelta(days=len(asset_data["price_history"]) - i)
-                    price_history_str += f"Date: {date.isoformat()}, Close: {price}\n"
+            for date, close in asset_data["price_history"][-self.prompt_history_points:]:
+                price_history_str += f"Date: {date}, Close: {close}\n"
             
             user_content = self.user_prompt_template.format(
                 symbol=asset_data["symbol"],
                 name=asset_data["name"],
                 current_price=asset_data["price"],
-                price_history=price_history_str
+                sector=asset_data["sector"],
+                price_history=price_history_str,
+                metrics=self._format_metrics(metrics)
             )
             
             messages.append({"role": "user", "content": user_content})
@@ -226,7 +272,7 @@ class RiskAnalysisService:
                 messages=messages,
                 response_format={
                     "type": "json_schema",
-                    "json_schema": {"schema": RiskAnalysisResponse.model_json_schema()},
+                    "json_schema": {"schema": QualitativeRiskAssessment.model_json_schema()},
                 },
             )
             
@@ -241,6 +287,8 @@ class RiskAnalysisService:
                 logger.error(f"Failed to parse JSON from response: {str(e)}")
                 raise HTTPException(status_code=500, detail="Invalid response format from Sonar API")
                 
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error in completion response: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Completion error: {str(e)}")
@@ -248,6 +296,7 @@ class RiskAnalysisService:
     async def analyze_asset_risk(self, asset_symbol: str) -> RiskAnalysisResponse:
         """Analyze risk for a given asset."""
         logger.info(f"Analyzing risk for asset: {asset_symbol}")
+        access_tracker.record("risk_analysis", asset_symbol)
         
         try:
             # First check if we have a recent analysis in the database
@@ -255,24 +304,104 @@ class RiskAnalysisService:
             
             if cached_analysis:
                 # Check if the analysis is less than 1 day old
-                updated_at = datetime.fromisoformat(cached_analysis["risk_analysis_updated_at"].replace('Z', '+00:00')).replace(tzinfo=timezone.utc)
-                now = datetime.now(timezone.utc)
-                if (now - updated_at) < timedelta(days=1):
-                    logger.info(f"Using cached risk analysis for {asset_symbol} from {updated_at}")
+                if self._is_fresh(cached_analysis):
+                    record_cache("risk_analysis", "hit")
+                    logger.info(f"Using cached risk analysis for {asset_symbol} from {cached_analysis['risk_analysis_updated_at']}")
                     return RiskAnalysisResponse(**cached_analysis)
                 else:
                     logger.info(f"Cached analysis for {asset_symbol} is older than 1 day, proceeding with new analysis")
+            record_cache("risk_analysis", "stale" if cached_analysis else "miss")
             
             # If no cached analysis or it's too old, proceed with new analysis
-            asset_data = await self._get_asset_data(asset_symbol)
-            messages = self._create_messages(asset_data)
-            analysis_result = await self._handle_completion_response(messages)
-            analysis = RiskAnalysisResponse(**analysis_result)
-            await self._store_risk_analysis(asset_symbol, analysis)  
-            return analysis
+            key = single_flight.make_key("risk_analysis", self.model, asset_symbol)
+            return await single_flight.do(key, lambda: self._run_risk_analysis(asset_symbol))
             
         except HTTPException:
             raise
         except Exception as e:
             logger.error(f"Error analyzing asset risk for {asset_symbol}: {str(e)}")
-            raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=str(e))
+
+    async def _run_risk_analysis(self, asset_symbol: str) -> RiskAnalysisResponse:
+        """Run a fresh risk analysis through the API and store the result."""
+        asset_data = await self._get_asset_data(asset_symbol)
+        # Numbers are computed locally; the model only adds the qualitative assessment
+        metrics = self._compute_metrics(asset_data)
+        messages = self._create_messages(asset_data, metrics)
+        assessment = QualitativeRiskAssessment(**await self._handle_completion_response(messages))
+        analysis = RiskAnalysisResponse(
+            asset_symbol=asset_data["symbol"],
+            asset_name=asset_data["name"],
+            risk_level=assessment.risk_level,
+            factors=RiskFactors(**metrics.model_dump(), sentiment_class=assessment.sentiment_class),
+            risk_breakdown=assessment.risk_breakdown,
+            confidence=assessment.confidence,
+            recommendation=assessment.recommendation
+        )
+        await self._store_risk_analysis(asset_symbol, analysis)  
+        return analysis
+
+    async def needs_refresh(self, asset_symbol: str, margin: timedelta) -> bool:
+        """Whether the stored analysis for an asset is missing or goes stale within margin."""
+        cached_analysis = await self._get_latest_risk_analysis(asset_symbol)
+        return not cached_analysis or not self._is_fresh(cached_analysis, margin)
+
+    async def refresh_asset_risk(self, asset_symbol: str) -> RiskAnalysisResponse:
+        """Run a new analysis for an asset regardless of the stored one."""
+        key = single_flight.make_key("risk_analysis", self.model, asset_symbol)
+        return await single_flight.do(key, lambda: self._run_risk_analysis(asset_symbol))
+
+    async def _get_portfolio_symbols(self, user_id: int) -> List[str]:
+        """A user's tracked symbols, oldest first."""
+        def db_call():
+            with db_connection() as conn:
+                cursor = conn.execute(TRACKED_SYMBOLS_FOR_USER, (user_id,))
+                return list(dict.fromkeys(row["symbol"] for row in cursor.fetchall()))
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, db_call)
+
+    async def analyze_portfolio_risk(self, user_id: int) -> PortfolioRiskResponse:
+        """
+        Analyze risk for every asset a user tracks in one call.
+
+        Stored analyses that are still fresh are served as is; missing or stale ones are
+        requested concurrently, at most portfolio_max_concurrency at a time. Symbols that
+        cannot be analyzed are reported in errors instead of failing the whole portfolio.
+        """
+        logger.info(f"Analyzing portfolio risk for user ID: {user_id}")
+        symbols = await self._get_portfolio_symbols(user_id)
+        for symbol in symbols:
+            access_tracker.record("risk_analysis", symbol)
+
+        cached = await self._get_latest_risk_analyses(symbols)
+        analyses = {
+            symbol: RiskAnalysisResponse(**cached[symbol])
+            for symbol in symbols
+            if symbol in cached and self._is_fresh(cached[symbol])
+        }
+        stale = [symbol for symbol in symbols if symbol not in analyses]
+        for symbol in symbols:
+            record_cache("risk_analysis", "hit" if symbol in analyses else "stale" if symbol in cached else "miss")
+        logger.info(f"Portfolio risk for user ID {user_id}: {len(analyses)} cached, {len(stale)} to analyze")
+
+        errors = {}
+        if stale:
+            semaphore = asyncio.Semaphore(self.portfolio_max_concurrency)
+
+            async def analyze(symbol: str) -> RiskAnalysisResponse:
+                async with semaphore:
+                    return await self.refresh_asset_risk(symbol)
+
+            results = await asyncio.gather(*(analyze(symbol) for symbol in stale), return_exceptions=True)
+            for symbol, result in zip(stale, results):
+                if isinstance(result, BaseException):
+                    logger.error(f"Risk analysis failed for {symbol}: {str(result)}")
+                    errors[symbol] = getattr(result, "detail", None) or str(result)
+                else:
+                    analyses[symbol] = result
+
+        return PortfolioRiskResponse(
+            analyses=[analyses[symbol] for symbol in symbols if symbol in analyses],
+            errors=errors
+        )
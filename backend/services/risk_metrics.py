@@ -0,0 +1,172 @@
+"""
+Quantitative risk metrics computed locally from stored price series.
+
+Single-series functions take closing prices oldest first. Functions that compare
+series take dated closes: beta joins them on date, and the sector index runs over
+the union of its peers' dates, so series with different gaps or end dates are
+compared day by day. The results are
+deterministic, so they can be computed on every request or cached with the analysis.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+from pydantic import BaseModel
+import numpy as np
+
+
+class RiskMetrics(BaseModel):
+    volatility_score: float  # 0 to 1, realized volatility relative to volatility_cap
+    sector_trend_score: float  # 0 to 1, 0.5 means the sector series was flat
+    dip_count_last_month: int
+    realized_volatility: Optional[float] = None  # Annualized standard deviation of log returns
+    max_drawdown: Optional[float] = None  # Largest peak-to-trough decline, as a fraction
+    sector_beta: Optional[float] = None  # Sensitivity of returns to the sector series
+    moving_average_short: Optional[float] = None
+    moving_average_long: Optional[float] = None
+
+
+def to_dated_prices(points: Sequence[Tuple[str, float]]) -> Dict[str, float]:
+    """Dated closes as a date -> price mapping, without missing or non-positive values."""
+    return {
+        point_date: float(close)
+        for point_date, close in points
+        if close is not None and np.isfinite(close) and close > 0
+    }
+
+
+def align(*series: Dict[str, float]) -> Tuple[List[str], List[np.ndarray]]:
+    """Restrict dated series to the dates they all have, as arrays oldest first."""
+    dates = sorted(set.intersection(*(set(prices) for prices in series))) if series else []
+    return dates, [np.asarray([prices[point_date] for point_date in dates], dtype=np.float64) for prices in series]
+
+
+def log_returns(prices: np.ndarray) -> np.ndarray:
+    return np.diff(np.log(prices))
+
+
+def realized_volatility(prices: np.ndarray, periods_per_year: int = 252) -> Optional[float]:
+    """Annualized volatility of log returns, or None with fewer than three prices."""
+    if len(prices) < 3:
+        return None
+    return float(np.std(log_returns(prices), ddof=1) * np.sqrt(periods_per_year))
+
+
+def max_drawdown(prices: np.ndarray) -> Optional[float]:
+    """Largest decline from a running peak, as a positive fraction."""
+    if len(prices) < 2:
+        return None
+    return float(-np.min(prices / np.maximum.accumulate(prices) - 1.0))
+
+
+def dip_count(prices: np.ndarray, threshold: float = 0.0, window: Optional[int] = None) -> int:
+    """Number of period-over-period drops larger than threshold (a fraction) in the last window prices."""
+    if window is not None:
+        prices = prices[-(window + 1):]
+    if len(prices) < 2:
+        return 0
+    return int(np.count_nonzero(prices[1:] / prices[:-1] - 1.0 < -threshold))
+
+
+def beta(prices: Dict[str, float], benchmark: Dict[str, float], min_overlap: int = 3) -> Optional[float]:
+    """Beta of dated closes against a dated benchmark, or None if they share fewer than min_overlap dates."""
+    dates, (aligned, aligned_benchmark) = align(prices, benchmark)
+    if len(dates) < max(min_overlap, 3):
+        return None
+    returns = log_returns(aligned)
+    benchmark_returns = log_returns(aligned_benchmark)
+    variance = np.var(benchmark_returns, ddof=1)
+    if variance == 0:
+        return None
+    return float(np.cov(returns, benchmark_returns, ddof=1)[0, 1] / variance)
+
+
+def moving_average(prices: np.ndarray, window: int) -> Optional[float]:
+    """Mean of the last window prices, or None if the series is shorter."""
+    if window <= 0 or len(prices) < window:
+        return None
+    return float(np.mean(prices[-window:]))
+
+
+def sector_series(peer_series: List[Sequence[Tuple[str, float]]], min_overlap: int = 2,
+                  min_coverage: float = 0.5) -> Optional[Dict[str, float]]:
+    """
+    Equal-weighted sector index from dated peer closes, starting at 1.
+
+    The index runs over the union of the peers' dates, keeping the days on which at
+    least min_coverage of the peers have a close. Each day it moves by the mean return
+    of the peers with a close that day, measured from their close on the previous kept
+    day they had one, so a peer with a short or gapped history only drops out of the
+    days it lacks. None without peers or with fewer than min_overlap kept days.
+    """
+    peers = [prices for prices in (to_dated_prices(series) for series in peer_series) if len(prices) >= 2]
+    if not peers:
+        return None
+    dates = sorted(set().union(*peers))
+    matrix = np.asarray([[prices.get(point_date, np.nan) for point_date in dates] for prices in peers])
+    covered = np.count_nonzero(~np.isnan(matrix), axis=0) >= min_coverage * len(peers)
+    matrix = matrix[:, covered]
+    dates = [point_date for point_date, keep in zip(dates, covered) if keep]
+    if len(dates) < max(min_overlap, 2):
+        return None
+
+    # Each peer's latest close up to every kept day
+    present = ~np.isnan(matrix)
+    last_seen = np.maximum.accumulate(np.where(present, np.arange(len(dates)), 0), axis=1)
+    filled = np.take_along_axis(matrix, last_seen, axis=1)
+    returns = matrix[:, 1:] / filled[:, :-1] - 1.0
+    counted = ~np.isnan(returns)
+    daily = np.where(counted, returns, 0.0).sum(axis=0) / np.maximum(counted.sum(axis=0), 1)
+    levels = np.concatenate([[1.0], np.cumprod(1.0 + daily)])
+    return dict(zip(dates, levels.tolist()))
+
+
+def compute_risk_metrics(
+    prices: Sequence[Tuple[str, float]],
+    peer_series: List[Sequence[Tuple[str, float]]] = (),
+    periods_per_year: int = 252,
+    volatility_cap: float = 0.8,
+    trend_cap: float = 0.2,
+    dip_threshold: float = 0.0,
+    dip_window: int = 21,
+    short_window: int = 5,
+    long_window: int = 20,
+    min_overlap: int = 10,
+    min_coverage: float = 0.5,
+) -> RiskMetrics:
+    """
+    Compute all risk metrics for one asset.
+
+    Args:
+        prices (Sequence[Tuple[str, float]]): The asset's dated closing prices, oldest first
+        peer_series (List[Sequence[Tuple[str, float]]]): Dated closes of other assets in the same
+            sector; without peers the asset's own series stands in for the sector trend
+        volatility_cap (float): Annualized volatility that maps to a volatility score of 1
+        trend_cap (float): Sector return over the window that maps to a trend score of 0 or 1
+        dip_threshold (float): Minimum drop between two prices that counts as a dip, as a fraction
+        min_overlap (int): Dates the asset and the sector index must share for beta to be computed
+        min_coverage (float): Share of the peers that must have a close on a date for the sector index
+
+    Returns:
+        RiskMetrics: Scores and raw metrics
+    """
+    dated = to_dated_prices(prices)
+    series = np.asarray([dated[point_date] for point_date in sorted(dated)], dtype=np.float64)
+    volatility = realized_volatility(series, periods_per_year)
+    volatility_score = float(np.clip(volatility / volatility_cap, 0.0, 1.0)) if volatility is not None else 0.5
+
+    sector = sector_series(peer_series, min_overlap, min_coverage)
+    trend_source = np.asarray(list(sector.values())) if sector is not None else series
+    if len(trend_source) >= 2:
+        trend = trend_source[-1] / trend_source[0] - 1.0
+        sector_trend_score = float(np.clip(0.5 + trend / (2 * trend_cap), 0.0, 1.0))
+    else:
+        sector_trend_score = 0.5
+
+    return RiskMetrics(
+        volatility_score=round(volatility_score, 4),
+        sector_trend_score=round(sector_trend_score, 4),
+        dip_count_last_month=dip_count(series, dip_threshold, dip_window),
+        realized_volatility=volatility,
+        max_drawdown=max_drawdown(series),
+        sector_beta=beta(dated, sector, min_overlap) if sector is not None else None,
+        moving_average_short=moving_average(series, short_window),
+        moving_average_long=moving_average(series, long_window),
+    )
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _normalize(value: Any) -> Hashable:
+    """Normalize a prompt input so equivalent requests produce the same key."""
+    if isinstance(value, str):
+        return " ".join(value.split()).lower()
+    if isinstance(value, (list, tuple, dict, set, frozenset)):
+        if isinstance(value, (set, frozenset)):
+            value = sorted(value, key=str)
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical upstream calls.
+
+    While a call for a key is in flight, every other caller with the same key awaits
+    the same task instead of issuing its own completion. The key is dropped as soon
+    as the call finishes, so later callers start a fresh call.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    @staticmethod
+    def make_key(service: str, model: str, *inputs: Any) -> Tuple[Hashable, ...]:
+        """Build a key from the service name, model and normalized prompt inputs."""
+        return (service, model) + tuple(_normalize(value) for value in inputs)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run func for key, or join the call already in flight for it.
+
+        Args:
+            key (Hashable): Key identifying the work, usually from make_key
+            func (Callable[[], Awaitable[T]]): Factory for the coroutine doing the work
+
+        Returns:
+            T: The shared result; exceptions are shared the same way
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            logger.info(f"Joining in-flight call for {key[0] if isinstance(key, tuple) else key}")
+        # Shield so a disconnecting caller does not cancel the work for everyone else
+        return await asyncio.shield(task)
+
+
+# Shared by all service instances so that identical calls coalesce process-wide
+single_flight = SingleFlight()
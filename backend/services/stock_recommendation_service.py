@@ -1,15 +1,22 @@
-from openai import AsyncOpenAI
-import os
-from typing import Dict, Any
+from typing import Dict, Any, Set
 from fastapi import HTTPException
+import hashlib
 import logging
 import json
 import yaml
 from pathlib import Path
 from pydantic import BaseModel
-from datetime import datetime, timezone
+from datetime import timedelta
 import asyncio
+import time
 from models.stock_recommendation import StockRecommendationResponse
+from services.single_flight import single_flight
+from services.access_tracker import access_tracker
+from services.response_cache import response_cache
+from services.metrics import record_cache
+from database import db_connection, init_db
+from queries import TRACKED_SYMBOLS_FOR_USER
+from services.llm_gateway import llm_gateway
 
 # Configure logging
 logging.basicConfig(
@@ -21,17 +28,14 @@ logger = logging.getLogger(__name__)
 class StockRecommendationService:
     def __init__(self):
         logger.info("Initializing StockRecommendationService")
-        try:
-            self.client = AsyncOpenAI(
-                api_key=os.getenv("PERPLEXITY_API_KEY"),
-                base_url="https://api.perplexity.ai",
-            )
-            logger.info("AsyncOpenAI client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize AsyncOpenAI client: {str(e)}")
-            raise
+        # Upstream calls share the gateway's connection pool, concurrency budget and retries
+        self.client = llm_gateway.client("stock_recommendation")
 
         self.model = "sonar-deep-research"
+        # Keeps stale-while-revalidate refreshes referenced until they finish
+        self._background_refreshes: Set[asyncio.Task] = set()
+
+        init_db()
 
         # Load prompts from YAML
         try:
@@ -45,84 +49,53 @@ class StockRecommendationService:
                 self.user_prompt_template = prompts["stock_recommendation_service"][
                     "user_prompt_template"
                 ]
+                cache_settings = prompts["stock_recommendation_service"].get("cache", {})
+                self.bucket_seconds = float(cache_settings.get("bucket_hours", 6)) * 3600
             logger.info("Successfully loaded prompts from YAML")
         except Exception as e:
             logger.error(f"Failed to load prompts from YAML: {str(e)}")
             raise
-        
-        # Cache setup
-        self.CACHE_DIR = Path(__file__).parent.parent / "cache"
-        try:
-            self.CACHE_DIR.mkdir(parents=True, exist_ok=True)
-            logger.info(f"Cache directory ensured at: {self.CACHE_DIR}")
-        except Exception as e:
-            logger.error(f"Failed to create cache directory {self.CACHE_DIR}: {str(e)}")
 
-    def _get_cache_file(self, user_id: str, model: str) -> Path:
-        return self.CACHE_DIR / f"stock_recommendation_cache_{user_id}_{model}.json"
+    def _prompt_version(self, messages: list) -> str:
+        """Short hash of the prompt, so editing it starts a new shared recommendation."""
+        return hashlib.sha1(json.dumps(messages, sort_keys=True).encode()).hexdigest()[:12]
 
-    async def _load_from_cache(self, user_id: str, model: str) -> Dict[str, Any] | None:
-        cache_file = self._get_cache_file(user_id, model)
-        logger.info(f"Attempting to load stock recommendation from cache for user '{user_id}' with model '{model}' at '{cache_file}'")
-        if not cache_file.exists():
-            logger.info(f"Cache file '{cache_file}' does not exist for user '{user_id}' and model '{model}'.")
-            return None
-        try:
-            # Run synchronous file I/O in a thread pool
-            def file_read():
-                with open(cache_file, "r") as f:
-                    return json.load(f)
-            
-            loop = asyncio.get_event_loop()
-            cache_content = await loop.run_in_executor(None, file_read)
-            
-            if not (isinstance(cache_content, dict) and "recommendation_data" in cache_content and "cached_at_iso" in cache_content and "model" in cache_content):
-                logger.warning(f"Cache file '{cache_file}' for user '{user_id}' and model '{model}' has invalid structure. Ignoring cache.")
-                return None
-
-            # Verify the cached model matches the requested model
-            if cache_content.get("model") != model:
-                logger.warning(f"Cache file '{cache_file}' contains data for model '{cache_content.get('model')}' but '{model}' was requested. Ignoring cache.")
-                return None
-
-            # Check if cache is less than 6 hours old
-            cached_at = datetime.fromisoformat(cache_content["cached_at_iso"])
-            now = datetime.now(timezone.utc)
-            age_hours = (now - cached_at).total_seconds() / 3600
-            
-            if age_hours < 6:  # Cache for 6 hours
-                logger.info(f"Successfully loaded stock recommendation from cache for user '{user_id}' and model '{model}' (age: {age_hours:.1f} hours)")
-                return cache_content["recommendation_data"]
-            else:
-                logger.info(f"Cache is stale for user '{user_id}' and model '{model}' (age: {age_hours:.1f} hours), will refresh")
-                return None
-
-        except json.JSONDecodeError:
-            logger.warning(f"Failed to decode JSON from cache file '{cache_file}' for user '{user_id}' and model '{model}'. Ignoring cache.")
-            return None
-        except Exception as e:
-            logger.error(f"Error loading from cache for user '{user_id}' and model '{model}' at '{cache_file}': {str(e)}")
-            return None
-
-    async def _save_to_cache(self, data: Dict[str, Any], user_id: str, model: str):
-        cache_file = self._get_cache_file(user_id, model)
-        logger.info(f"Saving stock recommendation to cache for user '{user_id}' and model '{model}' at '{cache_file}'")
-        cache_content = {
-            "cached_at_iso": datetime.now(timezone.utc).isoformat(),
-            "model": model,
-            "recommendation_data": data 
-        }
+    def _bucket(self, at: float | None = None) -> int:
+        return int((time.time() if at is None else at) // self.bucket_seconds)
+
+    def _cache_key(self, model: str, messages: list, bucket: int) -> tuple:
+        return (model, self._prompt_version(messages), bucket)
+
+    async def _save_to_cache(self, data: Dict[str, Any], model: str, messages: list, bucket: int):
+        logger.info(f"Saving shared stock recommendation to cache for model '{model}', bucket {bucket}")
+        # Fresh until its bucket ends, then kept for one more bucket to be served while the next is computed
+        ttl = timedelta(seconds=max((bucket + 1) * self.bucket_seconds - time.time(), 0))
+        await response_cache.set(
+            "stock_recommendation", self._cache_key(model, messages, bucket), data,
+            ttl=ttl, stale_ttl=timedelta(seconds=self.bucket_seconds)
+        )
+
+    async def _is_tracked(self, user_id: str, symbol: str) -> bool:
+        # Tracked symbols are stored as the user typed them
+        wanted = symbol.strip().upper()
+
+        def db_call():
+            with db_connection() as conn:
+                rows = conn.execute(TRACKED_SYMBOLS_FOR_USER, (user_id,)).fetchall()
+                return any(row["symbol"].strip().upper() == wanted for row in rows)
+
+        loop = asyncio.get_event_loop()
         try:
-            # Run synchronous file I/O in a thread pool
-            def file_write():
-                with open(cache_file, "w") as f:
-                    json.dump(cache_content, f, indent=4)
-            
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, file_write)
-            logger.info(f"Successfully saved stock recommendation to cache for user '{user_id}' and model '{model}' at {cache_file}.")
+            return await loop.run_in_executor(None, db_call)
         except Exception as e:
-            logger.error(f"Error saving to cache for user '{user_id}' and model '{model}' at '{cache_file}': {str(e)}")
+            logger.error(f"Error checking tracked assets for user '{user_id}': {str(e)}")
+            return False
+
+    async def _personalize(self, recommendation_data: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+        """Layer per-user fields on a copy of the shared recommendation."""
+        personalized = dict(recommendation_data)
+        personalized["already_tracked"] = await self._is_tracked(user_id, recommendation_data["ticker_symbol"])
+        return personalized
 
     def _extract_valid_json(self, response_dict: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -229,6 +202,8 @@ class StockRecommendationService:
 
             return recommendation_data
 
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error in API completion: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Failed to get stock recommendation: {str(e)}")
@@ -238,9 +213,12 @@ class StockRecommendationService:
     ) -> Dict[str, Any]:
         """
         Get a beginner-friendly low-risk stock recommendation.
+
+        The recommendation is shared by all users for the current time bucket; only the
+        per-user fields are computed for each request.
         
         Args:
-            user_id (str): The user ID for user-specific caching
+            user_id (str): The user ID the recommendation is personalized for
             model (str): The model to use for the API call
             force_reload (bool): Whether to force a reload and bypass cache
             
@@ -248,20 +226,66 @@ class StockRecommendationService:
             Dict[str, Any]: Stock recommendation data
         """
         logger.info(f"Processing stock recommendation request for user '{user_id}' with model: {model}, force_reload: {force_reload}")
-        
+        access_tracker.record("stock_recommendation", model)
+        messages = self._create_messages()
+        bucket = self._bucket()
+
         # Check cache first unless force_reload is True
         if not force_reload:
-            cached_data = await self._load_from_cache(user_id, model)
-            if cached_data:
-                logger.info(f"Returning cached stock recommendation for user '{user_id}'")
-                return cached_data
+            entry = await response_cache.get("stock_recommendation", self._cache_key(model, messages, bucket))
+            if entry is not None:
+                record_cache("stock_recommendation", "hit")
+                logger.info(f"Returning shared stock recommendation for model '{model}' from cache")
+                return await self._personalize(entry.value, user_id)
 
-        # Create messages and make API call
-        messages = self._create_messages()
-        recommendation_data = await self._handle_completion_response(messages, model)
-        
-        # Save to cache
-        await self._save_to_cache(recommendation_data, user_id, model)
+            # Serve the previous bucket's recommendation while this bucket's is computed
+            previous = await response_cache.get("stock_recommendation", self._cache_key(model, messages, bucket - 1))
+            if previous is not None:
+                record_cache("stock_recommendation", "stale")
+                logger.info(f"Returning previous stock recommendation for model '{model}' and refreshing it in the background")
+                self._refresh_in_background(model)
+                return await self._personalize(previous.value, user_id)
+            record_cache("stock_recommendation", "miss")
+
+        recommendation_data = await self.refresh_recommendation(model)
         
         logger.info(f"Successfully processed stock recommendation request for user '{user_id}'")
-        return recommendation_data 
\ No newline at end of file
+        return await self._personalize(recommendation_data, user_id)
+
+    async def needs_refresh(self, model: str, margin: timedelta) -> bool:
+        """Whether the shared recommendation that will be current after margin is missing."""
+        bucket = self._bucket(time.time() + margin.total_seconds())
+        entry = await response_cache.get("stock_recommendation", self._cache_key(model, self._create_messages(), bucket))
+        return entry is None
+
+    async def refresh_recommendation(self, model: str = "sonar-pro", ahead: timedelta = timedelta(0)) -> Dict[str, Any]:
+        """
+        Fetch a fresh shared recommendation from the API and store it in the cache.
+
+        Args:
+            model (str): The model to use for the API call
+            ahead (timedelta): Compute the recommendation for the bucket current this far
+                in the future, so it is ready before that bucket starts
+        """
+        messages = self._create_messages()
+        bucket = self._bucket(time.time() + ahead.total_seconds())
+        cache_key = self._cache_key(model, messages, bucket)
+        # Every user asks for the same recommendation, so concurrent misses share one call
+        key = single_flight.make_key("stock_recommendation", *cache_key)
+
+        async def fetch():
+            recommendation_data = await self._handle_completion_response(messages, model)
+            await self._save_to_cache(recommendation_data, model, messages, bucket)
+            return recommendation_data
+
+        return await single_flight.do(key, fetch)
+
+    def _refresh_in_background(self, model: str):
+        def on_done(task: asyncio.Task):
+            self._background_refreshes.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"Background stock recommendation refresh failed for model '{model}': {str(task.exception())}")
+
+        task = asyncio.ensure_future(self.refresh_recommendation(model))
+        self._background_refreshes.add(task)
+        task.add_done_callback(on_done)
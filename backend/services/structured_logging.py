@@ -0,0 +1,121 @@
+"""
+Structured logging: request ids, context fields and cheap payload logging.
+
+Every log line carries the id of the request (or job) it belongs to, followed by
+any context fields bound for that request, e.g.
+
+    ... - services.chat_service - INFO - [3f2a9c1d0b7e4a55] Processing chat request conversation_id=abc chat_type=chat
+
+Both live in context variables, so they follow the request into awaited coroutines
+and, through the default executor, into its database threads.
+
+Prompt and response bodies go through log_payload, which returns before touching
+the payload unless payload logging is enabled, DEBUG is on for the logger and the
+payload is sampled; what is logged is serialized compactly and capped in size.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+import json
+import logging
+import os
+import random
+import uuid
+import yaml
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s%(context)s'
+
+logger = logging.getLogger(__name__)
+
+try:
+    config_path = Path(__file__).parent.parent / "config" / "logging.yaml"
+    with open(config_path, "r") as file:
+        settings = yaml.safe_load(file)["logging"]
+        LOG_LEVEL = os.getenv("LOG_LEVEL", settings.get("level", "INFO")).upper()
+        payload_settings = settings.get("payloads", {})
+        PAYLOADS_ENABLED = bool(payload_settings.get("enabled", False))
+        PAYLOAD_SAMPLE_RATE = float(payload_settings.get("sample_rate", 0.05))
+        PAYLOAD_MAX_CHARS = int(payload_settings.get("max_chars", 2000))
+except Exception as e:
+    logger.error(f"Failed to load logging settings from YAML: {str(e)}")
+    raise
+
+_request_id: ContextVar[str] = ContextVar("request_id", default="-")
+_fields: ContextVar[Optional[Dict[str, Any]]] = ContextVar("log_fields", default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def start_log_context(request_id: Optional[str] = None) -> str:
+    """Begin a request's log context with a fresh (or the given) id and no fields."""
+    request_id = request_id or new_request_id()
+    _request_id.set(request_id)
+    _fields.set(None)
+    return request_id
+
+
+def bind_log_context(**fields: Any) -> None:
+    """Add fields to every later log line of the current request."""
+    _fields.set({**(_fields.get() or {}), **fields})
+
+
+@contextmanager
+def log_context(request_id: Optional[str] = None, **fields: Any) -> Iterator[None]:
+    """Scope a request id and fields to a block, e.g. one background job."""
+    id_token = _request_id.set(request_id) if request_id else None
+    fields_token = _fields.set({**(_fields.get() or {}), **fields})
+    try:
+        yield
+    finally:
+        _fields.reset(fields_token)
+        if id_token is not None:
+            _request_id.reset(id_token)
+
+
+class ContextFilter(logging.Filter):
+    """Adds the request id and context fields of the current context to each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        fields = _fields.get()
+        record.context = "".join(f" {key}={value}" for key, value in fields.items()) if fields else ""
+        return True
+
+
+def configure_logging() -> None:
+    """Apply the configured level and the structured format to the root handlers."""
+    root = logging.getLogger()
+    if not root.handlers:
+        logging.basicConfig()
+    root.setLevel(LOG_LEVEL)
+    for handler in root.handlers:
+        if not any(isinstance(existing, ContextFilter) for existing in handler.filters):
+            handler.addFilter(ContextFilter())
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+
+def preview(payload: Any, max_chars: Optional[int] = None) -> str:
+    """Compact, size-capped text of a payload (str, or anything JSON-serializable)."""
+    max_chars = max_chars or PAYLOAD_MAX_CHARS
+    if isinstance(payload, str):
+        text = payload
+    else:
+        try:
+            text = json.dumps(payload, default=str, ensure_ascii=False, separators=(",", ":"))
+        except (TypeError, ValueError):
+            text = repr(payload)
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}... [{len(text)} chars]"
+
+
+def log_payload(log: logging.Logger, label: str, payload: Any, level: int = logging.DEBUG) -> None:
+    """Log a prompt or response body if payload logging is on and this one is sampled."""
+    if not PAYLOADS_ENABLED or not log.isEnabledFor(level):
+        return
+    if PAYLOAD_SAMPLE_RATE < 1 and random.random() >= PAYLOAD_SAMPLE_RATE:
+        return
+    log.log(level, "%s: %s", label, preview(payload))
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Point every service at a throwaway database before database.py is imported
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/finsight-test.db")
+os.environ.setdefault("PERPLEXITY_API_KEY", "test")
@@ -0,0 +1,88 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from api.v1 import auth
+from database import SessionLocal, create_db_and_tables
+from models.user import User as UserModel
+from services.auth_cache import Principal, PrincipalCache
+
+
+def _principal(user_id=1):
+    return Principal(id=user_id, email=f"user{user_id}@example.com", is_active=True)
+
+
+def test_cache_entries_expire_with_the_token():
+    cache = PrincipalCache(ttl_seconds=60)
+    cache.put("live", _principal(1))
+    cache.put("expired", _principal(1), token_expires_in=0)
+    assert cache.get("live") == _principal(1)
+    assert cache.get("expired") is None
+
+
+def test_invalidate_user_drops_every_token_of_that_user():
+    cache = PrincipalCache(ttl_seconds=60)
+    cache.put("a", _principal(1))
+    cache.put("b", _principal(1))
+    cache.put("c", _principal(2))
+    cache.invalidate_user(1)
+    assert cache.get("a") is None and cache.get("b") is None
+    assert cache.get("c") == _principal(2)
+
+
+def test_cached_principal_is_immutable():
+    with pytest.raises(ValidationError):
+        _principal().is_active = False
+
+
+def _new_user():
+    create_db_and_tables()
+    email = f"{uuid.uuid4().hex}@example.com"
+
+    async def register():
+        db = SessionLocal()
+        try:
+            return await auth.register_user(auth.UserCreate(email=email, password="secret"), db)
+        finally:
+            db.close()
+
+    user = asyncio.run(register())
+    return user.id, email
+
+
+def test_current_user_is_cached_until_the_user_changes():
+    user_id, email = _new_user()
+    token = auth.create_access_token({"sub": email})
+
+    first = asyncio.run(auth.get_current_user(token))
+    assert first == Principal(id=user_id, email=email, is_active=True)
+    assert asyncio.run(auth.get_current_user(token)) is first
+
+    db = SessionLocal()
+    try:
+        db.get(UserModel, user_id).is_active = False
+        db.commit()
+    finally:
+        db.close()
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(auth.get_current_user(token))
+    assert excinfo.value.status_code == 400
+
+
+def test_register_rejects_a_taken_email():
+    _, email = _new_user()
+
+    async def register_again():
+        db = SessionLocal()
+        try:
+            await auth.register_user(auth.UserCreate(email=email, password="other"), db)
+        finally:
+            db.close()
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(register_again())
+    assert excinfo.value.status_code == 400
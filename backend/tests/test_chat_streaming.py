@@ -0,0 +1,74 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+from queries import ASSET_CHAT_MESSAGES, CHAT_MESSAGES
+from database import db_connection
+from services.asset_chat_service import AssetChatService
+from services.chat_service import ChatService
+from services.conversation_store import INTERRUPTED_NOTE
+
+
+class FakeStream:
+    def __init__(self, tokens, fail_after=None):
+        self._tokens = tokens
+        self._fail_after = fail_after
+        self.closed = False
+
+    async def __aiter__(self):
+        for n, token in enumerate(self._tokens):
+            if n == self._fail_after:
+                raise ConnectionError("upstream dropped the stream")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))], citations=None)
+
+    async def close(self):
+        self.closed = True
+
+
+def _chat_rows(conversation_id):
+    with db_connection() as conn:
+        return [(row["role"], row["content"]) for row in conn.execute(CHAT_MESSAGES, (conversation_id, 1))]
+
+
+def test_completed_stream_saves_the_turn():
+    async def scenario():
+        conversation_id = uuid.uuid4().hex
+        upstream = FakeStream(["Hel", "lo"])
+        events = ChatService()._stream_events(upstream, [{"role": "user", "content": "hi"}], conversation_id, "chat", 1)
+        names = [event["event"] async for event in events]
+        return names, upstream.closed, _chat_rows(conversation_id)
+
+    names, closed, rows = asyncio.run(scenario())
+    assert names == ["token", "token", "done"]
+    assert closed
+    assert rows == [("user", "hi"), ("assistant", "Hello")]
+
+
+def test_disconnect_mid_stream_saves_the_partial_answer():
+    async def scenario():
+        conversation_id = uuid.uuid4().hex
+        upstream = FakeStream(["Hel", "lo"])
+        events = ChatService()._stream_events(upstream, [{"role": "user", "content": "hi"}], conversation_id, "chat", 1)
+        await events.__anext__()
+        await events.aclose()
+        return upstream.closed, _chat_rows(conversation_id)
+
+    closed, rows = asyncio.run(scenario())
+    assert closed
+    assert rows == [("user", "hi"), ("assistant", f"Hel\n\n{INTERRUPTED_NOTE}")]
+
+
+def test_upstream_failure_saves_the_asset_chat_turn():
+    async def scenario():
+        conversation_id = uuid.uuid4().hex
+        upstream = FakeStream(["Up", "down"], fail_after=1)
+        events = AssetChatService()._stream_events(upstream, [{"role": "user", "content": "why?"}], conversation_id, "AAPL", 1)
+        try:
+            async for _ in events:
+                pass
+        except ConnectionError:
+            pass
+        with db_connection() as conn:
+            return [(row["role"], row["content"]) for row in conn.execute(ASSET_CHAT_MESSAGES, (conversation_id, "AAPL", 1))]
+
+    assert asyncio.run(scenario()) == [("user", "why?"), ("assistant", f"Up\n\n{INTERRUPTED_NOTE}")]
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+
+from database import db_connection, db_transaction
+from services.job_service import JobService
+
+
+def _service(lease_seconds: float = 60) -> JobService:
+    service = JobService()
+    service.lease_seconds = lease_seconds
+    service.heartbeat_seconds = 0.05
+    return service
+
+
+def _insert_job(job_id: str, kind: str, status: str, heartbeat=None):
+    now = time.time()
+    with db_transaction() as conn:
+        conn.execute("""
+            INSERT INTO jobs (id, kind, user_id, input_hash, params, status, created_at, started_at, heartbeat)
+            VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?)
+        """, (job_id, kind, job_id, json.dumps({}), status, now, now if status == "running" else None, heartbeat))
+
+
+def _status(job_id: str) -> str:
+    with db_connection() as conn:
+        return conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()["status"]
+
+
+def test_sweeps_do_not_enqueue_waiting_jobs_again():
+    async def scenario():
+        service = _service()
+
+        async def handler(user_id, params):
+            return params
+
+        service.register("sweep_backlog", handler)
+        for n in range(3):
+            await service.submit("sweep_backlog", "1", {"n": n})
+        queue = service._queues["sweep_backlog"]
+        assert queue.qsize() == 3
+
+        await service._requeue_stale()
+        await service._requeue_stale()
+        return queue.qsize()
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_only_jobs_with_an_expired_lease_are_requeued():
+    async def scenario():
+        service = _service(lease_seconds=30)
+        service.register("lease", lambda user_id, params: None)
+        _insert_job("lease-live", "lease", "running", heartbeat=time.time())
+        _insert_job("lease-dead", "lease", "running", heartbeat=time.time() - 300)
+        _insert_job("lease-unset", "lease", "running")
+
+        await service._requeue_stale()
+        queued = []
+        while not service._queues["lease"].empty():
+            queued.append(service._queues["lease"].get_nowait())
+        return sorted(queued)
+
+    assert asyncio.run(scenario()) == ["lease-dead", "lease-unset"]
+    assert _status("lease-live") == "running"
+    assert _status("lease-dead") == "queued"
+
+
+def test_job_runs_once_and_streams_its_result():
+    async def scenario():
+        service = _service()
+        runs = []
+
+        async def handler(user_id, params):
+            runs.append(params)
+            await asyncio.sleep(0.05)
+            return {"echo": params["n"]}
+
+        service.register("stream", handler)
+        await service.start()
+        try:
+            job, created = await service.submit("stream", "1", {"n": 7})
+            events = [event async for event in service.events(job["job_id"], "1")]
+            again, created_again = await service.submit("stream", "1", {"n": 7})
+        finally:
+            await service.stop()
+        return runs, events, created, created_again, service._changed
+
+    runs, events, created, created_again, subscribers = asyncio.run(scenario())
+    assert runs == [{"n": 7}]
+    assert events[-1] == {"event": "result", "data": {"echo": 7}}
+    assert created and not created_again
+    assert subscribers == {}
+
+
+def test_disconnected_stream_removes_its_subscriber():
+    async def scenario():
+        service = _service()
+        service.register("disconnect", lambda user_id, params: None)
+        job, _ = await service.submit("disconnect", "1", {})
+        stream = service.events(job["job_id"], "1")
+        first = await stream.__anext__()
+        subscribed = len(service._changed[job["job_id"]])
+        await stream.aclose()
+        return first, subscribed, service._changed
+
+    first, subscribed, subscribers = asyncio.run(scenario())
+    assert first["data"]["status"] == "queued"
+    assert subscribed == 1
+    assert subscribers == {}
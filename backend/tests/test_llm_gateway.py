@@ -0,0 +1,82 @@
+import asyncio
+import gc
+from types import SimpleNamespace
+
+from services.llm_gateway import LLMGateway
+
+
+class FakeStream:
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self._chunks:
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+def _gateway(max_concurrency: int = 1) -> LLMGateway:
+    gateway = LLMGateway()
+    gateway.model_concurrency["fake-model"] = max_concurrency
+    gateway.queue_timeout_seconds = 0.1
+    gateway.requests_per_second = 0
+
+    async def create(**kwargs):
+        if kwargs.get("stream"):
+            return FakeStream([SimpleNamespace(choices=[], usage=None)])
+        return SimpleNamespace(usage=None)
+
+    gateway._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return gateway
+
+
+def test_dropped_stream_gives_its_slot_back():
+    async def scenario():
+        gateway = _gateway()
+        stream = await gateway.create_chat_completion(model="fake-model", messages=[], stream=True)
+        held = gateway.stats()["fake-model"]["in_flight"]
+        del stream
+        gc.collect()
+        # The only slot is free again, so this does not time out
+        await gateway.create_chat_completion(model="fake-model", messages=[])
+        return held, gateway.stats()["fake-model"]["in_flight"]
+
+    assert asyncio.run(scenario()) == (1, 0)
+
+
+def test_closed_and_consumed_streams_release_once():
+    async def scenario():
+        gateway = _gateway(max_concurrency=2)
+        consumed = await gateway.create_chat_completion(model="fake-model", messages=[], stream=True)
+        async for _ in consumed:
+            pass
+        await consumed.close()
+        closed = await gateway.create_chat_completion(model="fake-model", messages=[], stream=True)
+        await closed.close()
+        await closed.close()
+        return gateway.stats()["fake-model"]["in_flight"], gateway._model_slots["fake-model"]._value
+
+    assert asyncio.run(scenario()) == (0, 2)
+
+
+
+def test_model_queue_timeout_overrides_the_default():
+    async def scenario():
+        gateway = _gateway()
+        gateway.model_queue_timeout_seconds["fake-model"] = 5
+        held = await gateway.create_chat_completion(model="fake-model", messages=[], stream=True)
+
+        async def release_later():
+            await asyncio.sleep(0.3)
+            await held.close()
+
+        # Waits past the 0.1 s default for the held slot instead of failing with 503
+        releaser = asyncio.create_task(release_later())
+        await gateway.create_chat_completion(model="fake-model", messages=[])
+        await releaser
+        return gateway.stats()["fake-model"]["rejected"]
+
+    assert asyncio.run(scenario()) == 0
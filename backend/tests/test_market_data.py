@@ -0,0 +1,41 @@
+from datetime import datetime, timezone
+
+from database import db_connection
+from services.market_data_service import MarketDataService
+from services.price_store import last_trading_day
+
+
+def _details(price, history):
+    return {"price": price, "movement": 1.0, "reason": "r", "sector": "Testing", "news": "n", "price_history": history}
+
+
+def test_snapshots_load_sparklines_and_corrected_names():
+    service = MarketDataService()
+    service._store_snapshots({
+        "SPKA": ("Spark A", _details(10.0, [1.0, 2.0, 3.0])),
+        "SPKB": ("Spark B", _details(20.0, [4.0, 5.0])),
+    })
+    service._store_snapshots({"SPKA": ("Spark A Inc.", _details(11.0, [1.0, 2.0, 3.0]))})
+
+    snapshots = service.load_snapshots(["SPKA", "SPKB", "MISSING"])
+
+    assert set(snapshots) == {"SPKA", "SPKB"}
+    assert snapshots["SPKA"]["name"] == "Spark A Inc."
+    assert snapshots["SPKA"]["price"] == 11.0
+    # The current day's price is not part of the sparkline
+    assert snapshots["SPKA"]["price_history"][-3:] == [1.0, 2.0, 3.0]
+    assert snapshots["SPKB"]["price_history"][-2:] == [4.0, 5.0]
+
+
+def test_price_series_of_several_symbols():
+    service = MarketDataService()
+    service._store_snapshots({"SERA": ("Series A", _details(3.0, [1.0, 2.0]))})
+    today = last_trading_day(datetime.now(timezone.utc).date())
+
+    series = service.load_price_series(["SERA", "SERB"], end=today)
+
+    assert [close for _, close in series["SERA"]] == [1.0, 2.0, 3.0]
+    assert series["SERA"][-1][0] == today.isoformat()
+    assert series["SERB"] == []
+    with db_connection() as conn:
+        assert conn.execute("SELECT name FROM market_snapshots WHERE symbol = 'SERA'").fetchone()["name"] == "Series A"
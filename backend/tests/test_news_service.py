@@ -0,0 +1,29 @@
+import asyncio
+from datetime import timedelta
+from unittest import mock
+
+from services.access_tracker import access_tracker
+from services.news_service import NewsService
+
+ASSETS = [{"symbol": "AAPL", "name": "Apple"}]
+
+
+def test_cache_key_separates_models_and_normalizes_topics():
+    service = NewsService()
+    key = service._cache_key("1", " AI, chips", "sonar-pro", ASSETS)
+    assert key == service._cache_key("1", "Chips,ai", "sonar-pro", ASSETS)
+    assert key != service._cache_key("1", " AI, chips", "sonar-deep-research", ASSETS)
+
+
+def test_requests_record_normalized_topics():
+    async def scenario():
+        service = NewsService()
+        news = {"news": []}
+        with mock.patch.object(service, "_get_tracked_assets", return_value=ASSETS), \
+                mock.patch.object(service, "_fetch_fresh_news", return_value=news):
+            await service.process_news_request(" AI", "tracked-user")
+            await service.process_news_request("ai", "tracked-user")
+
+    asyncio.run(scenario())
+    recorded = [key for key, _ in access_tracker.recent("news", timedelta(minutes=1)) if key[0] == "tracked-user"]
+    assert recorded == [("tracked-user", "ai", "sonar-pro")]
@@ -0,0 +1,5 @@
+from query_plans import check_query_plans
+
+
+def test_hot_queries_use_an_index():
+    assert check_query_plans() == {}
@@ -0,0 +1,81 @@
+import asyncio
+from datetime import timedelta
+
+from database import db_connection, db_transaction
+from services.response_cache import ResponseCache, SQLiteCacheStore
+
+
+def _cache(**store_settings) -> ResponseCache:
+    cache = ResponseCache()
+    if store_settings:
+        cache._store = SQLiteCacheStore(**store_settings)
+    return cache
+
+
+def _disk_keys():
+    with db_connection() as conn:
+        return {row["cache_key"] for row in conn.execute("SELECT cache_key FROM response_cache")}
+
+
+def test_disk_hits_are_promoted_to_memory():
+    async def scenario():
+        cache = _cache()
+        await cache.set("tiers", "key", {"answer": 42}, ttl=timedelta(minutes=5))
+        cache._memory.clear()
+        from_disk = await cache.get("tiers", "key")
+        in_memory = cache.make_key("tiers", "key") in cache._memory
+        return from_disk, in_memory
+
+    entry, in_memory = asyncio.run(scenario())
+    assert entry.value == {"answer": 42} and entry.is_fresh
+    assert in_memory
+
+
+def test_stale_entries_are_kept_until_evicted():
+    async def scenario():
+        cache = _cache()
+        await cache.set("stale", "kept", "old", ttl=timedelta(0), stale_ttl=timedelta(minutes=5))
+        await cache.set("stale", "gone", "old", ttl=timedelta(0))
+        cache._memory.clear()
+        return await cache.get("stale", "kept"), await cache.get("stale", "gone")
+
+    kept, gone = asyncio.run(scenario())
+    assert kept.value == "old" and not kept.is_fresh
+    assert gone is None
+
+
+def test_bumping_a_namespace_version_invalidates_it():
+    async def scenario():
+        cache = _cache()
+        await cache.set("versioned", "key", "v1 value", ttl=timedelta(minutes=5))
+        cache.namespace_versions["versioned"] = cache.namespace_versions.get("versioned", 1) + 1
+        return await cache.get("versioned", "key")
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_eviction_runs_every_few_writes_and_keeps_recently_read_rows():
+    async def scenario():
+        with db_transaction() as conn:
+            conn.execute("DELETE FROM response_cache")
+        cache = _cache(max_entries=2, max_bytes=1024 * 1024, evict_every=3, touch_batch_size=10)
+        await cache.set("lru", "a", "a", ttl=timedelta(minutes=5))
+        await cache.set("lru", "b", "b", ttl=timedelta(minutes=5))
+        # A disk hit on "a" makes "b" the least recently used row
+        cache._memory.clear()
+        await cache.get("lru", "a")
+        pending = dict(cache.store._touched)
+        await cache.set("lru", "c", "c", ttl=timedelta(minutes=5))
+        return pending, _disk_keys(), cache
+
+    pending, keys, cache = asyncio.run(scenario())
+    assert list(pending) == [cache.make_key("lru", "a")]
+    assert keys == {cache.make_key("lru", "a"), cache.make_key("lru", "c")}
+
+
+def test_reads_batch_their_access_times():
+    store = SQLiteCacheStore(max_entries=100, max_bytes=1024 * 1024, evict_every=100, touch_batch_size=2)
+    store.touch("batch:one")
+    assert list(store._touched) == ["batch:one"]
+    store.touch("batch:two")
+    assert store._touched == {}
@@ -0,0 +1,96 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from services.risk_metrics import (
+    align, beta, compute_risk_metrics, dip_count, max_drawdown, moving_average, realized_volatility,
+    sector_series, to_dated_prices,
+)
+
+
+def dated(closes, start=date(2024, 1, 1)):
+    return [((start + timedelta(days=n)).isoformat(), close) for n, close in enumerate(closes)]
+
+
+def test_to_dated_prices_drops_missing_and_non_positive_closes():
+    assert to_dated_prices([("d1", 1.0), ("d2", None), ("d3", 0.0), ("d4", float("nan")), ("d5", 2)]) == {"d1": 1.0, "d5": 2.0}
+
+
+def test_align_keeps_shared_dates_in_order():
+    dates, (a, b) = align({"d2": 2.0, "d1": 1.0, "d3": 3.0}, {"d3": 30.0, "d1": 10.0})
+    assert dates == ["d1", "d3"]
+    assert a.tolist() == [1.0, 3.0] and b.tolist() == [10.0, 30.0]
+
+
+def test_realized_volatility():
+    assert realized_volatility(np.array([1.0, 2.0])) is None
+    assert realized_volatility(np.full(10, 5.0)) == 0.0
+    prices = np.array([100.0, 110.0, 99.0, 108.9])
+    expected = np.std(np.diff(np.log(prices)), ddof=1) * np.sqrt(252)
+    assert realized_volatility(prices) == pytest.approx(expected)
+
+
+def test_max_drawdown():
+    assert max_drawdown(np.array([1.0])) is None
+    assert max_drawdown(np.array([100.0, 120.0, 90.0, 130.0, 117.0])) == pytest.approx(0.25)
+    assert max_drawdown(np.array([1.0, 2.0, 3.0])) == 0.0
+
+
+def test_dip_count_with_threshold_and_window():
+    prices = np.array([100.0, 98.0, 99.0, 97.0, 96.9])
+    assert dip_count(prices) == 3
+    assert dip_count(prices, threshold=0.015) == 2
+    assert dip_count(prices, window=2) == 2
+
+
+def test_moving_average():
+    prices = np.array([1.0, 2.0, 3.0, 4.0])
+    assert moving_average(prices, 2) == 3.5
+    assert moving_average(prices, 5) is None
+    assert moving_average(prices, 0) is None
+
+
+def test_beta_joins_on_date():
+    benchmark = dict(dated([100.0, 110.0, 99.0, 108.9, 119.79]))
+    # Twice the benchmark's log returns, with a gap in the asset's series
+    prices = {point_date: close ** 2 / 100 for point_date, close in benchmark.items()}
+    del prices[dated([0, 0, 0])[2][0]]
+    assert beta(prices, benchmark) == pytest.approx(2.0)
+    assert beta(prices, benchmark, min_overlap=5) is None
+
+
+def test_sector_series_survives_a_peer_with_short_history():
+    long_peer = dated([100.0, 101.0, 102.0, 103.0, 104.0, 105.0])
+    other_peer = dated([50.0, 50.5, 51.0, 51.5, 52.0, 52.5])
+    short_peer = dated([10.0, 20.0], start=date(2024, 1, 5))
+    index = sector_series([long_peer, other_peer, short_peer], min_overlap=6)
+    assert index is not None
+    assert list(index) == [point_date for point_date, _ in long_peer]
+    assert index[long_peer[0][0]] == 1.0
+    # The short peer's one return (+100%) counts on its second day only
+    assert index[long_peer[5][0]] / index[long_peer[4][0]] - 1 == pytest.approx((105 / 104 + 52.5 / 52 + 2.0) / 3 - 1)
+
+
+def test_sector_series_needs_coverage_and_overlap():
+    first = dated([1.0, 2.0, 3.0])
+    second = dated([1.0, 2.0, 3.0], start=date(2024, 1, 10))
+    # No day has both peers, so a 100% coverage rule leaves nothing
+    assert sector_series([first, second], min_coverage=1.0) is None
+    assert len(sector_series([first, second], min_coverage=0.5)) == 6
+    assert sector_series([]) is None
+    assert sector_series([dated([1.0])]) is None
+
+
+def test_compute_risk_metrics():
+    closes = [100.0, 102.0, 101.0, 103.0, 104.0, 102.0, 105.0, 107.0, 106.0, 108.0, 110.0, 109.0]
+    peer = dated([c * 2 for c in closes])
+    metrics = compute_risk_metrics(dated(closes), [peer], min_overlap=10, short_window=3, long_window=10)
+    assert metrics.sector_beta == pytest.approx(1.0)
+    assert metrics.dip_count_last_month == 4
+    assert metrics.moving_average_short == pytest.approx((108.0 + 110.0 + 109.0) / 3)
+    assert 0.5 < metrics.sector_trend_score <= 1.0
+    assert 0.0 < metrics.volatility_score < 1.0
+
+    alone = compute_risk_metrics(dated(closes[:2]))
+    assert alone.sector_beta is None and alone.realized_volatility is None and alone.volatility_score == 0.5
@@ -0,0 +1,19 @@
+import asyncio
+
+from database import db_transaction
+from services.stock_recommendation_service import StockRecommendationService
+
+
+def test_already_tracked_ignores_symbol_case():
+    service = StockRecommendationService()
+    with db_transaction() as conn:
+        conn.execute("""
+            INSERT INTO tracked_assets (
+                id, user_id, symbol, name, price, movement, reason, sector, news, price_history, created_at, last_updated
+            ) VALUES ('tracked-lowercase', 4242, ' nvda', 'Nvidia', 1, 0, '', '', '', '[]', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+        """)
+
+    async def scenario():
+        return await service._is_tracked("4242", "NVDA"), await service._is_tracked("4242", "AMD")
+
+    assert asyncio.run(scenario()) == (True, False)
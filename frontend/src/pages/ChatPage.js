@@ -104,14 +104,23 @@ function ChatPage({ currentTheme }) {
   const fetchChatHistory = useCallback(async () => {
     if (!token) return;
     try {
-      const response = await authFetch(`${process.env.REACT_APP_API_URL}/api/v1/chat/history`);
-      if (response.ok) {
+      // History is paginated; follow next_cursor until every conversation is loaded
+      const history = [];
+      let cursor = null;
+      do {
+        const params = new URLSearchParams({ limit: '100' });
+        if (cursor) params.set('cursor', cursor);
+        const response = await authFetch(`${process.env.REACT_APP_API_URL}/api/v1/chat/history?${params}`);
+        if (!response.ok) {
+          console.error('Failed to fetch chat history:', response.statusText);
+          return;
+        }
         const data = await response.json();
-        setChatHistory(data.history || []);
-        setSelectedChat(null);
-      } else {
-        console.error('Failed to fetch chat history:', response.statusText);
-      }
+        history.push(...(data.history || []));
+        cursor = data.next_cursor;
+      } while (cursor);
+      setChatHistory(history);
+      setSelectedChat(null);
     } catch (error) {
       console.error('Error fetching chat history:', error);
     }